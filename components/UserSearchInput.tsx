@@ -1,6 +1,9 @@
 import * as React from 'react';
 import { User } from '../types';
 import { useInventory } from '../context/InventoryContext';
+import api from '../services/apiService';
+
+const SEARCH_DEBOUNCE_MS = 250;
 
 interface UserSearchInputProps {
     selectedUserId: string;
@@ -11,8 +14,13 @@ export const UserSearchInput: React.FC<UserSearchInputProps> = ({ selectedUserId
     const { state } = useInventory();
     const [searchTerm, setSearchTerm] = React.useState('');
     const [isSearching, setIsSearching] = React.useState(!selectedUserId);
+    const [filteredUsers, setFilteredUsers] = React.useState<User[]>([]);
+    const [pickedUser, setPickedUser] = React.useState<User | null>(null);
 
-    const selectedUser = React.useMemo(() => state.users.find(u => u.id === selectedUserId), [state.users, selectedUserId]);
+    const selectedUser = React.useMemo(
+        () => (pickedUser?.id === selectedUserId ? pickedUser : state.users.find(u => u.id === selectedUserId)),
+        [pickedUser, state.users, selectedUserId]
+    );
 
     React.useEffect(() => {
         if (selectedUserId && !isSearching) {
@@ -24,17 +32,27 @@ export const UserSearchInput: React.FC<UserSearchInputProps> = ({ selectedUserId
         }
     }, [selectedUserId, isSearching]);
 
-    const filteredUsers = React.useMemo(() => {
-        if (!searchTerm.trim()) return [];
-        const lowercasedFilter = searchTerm.toLowerCase();
-        return state.users.filter(user =>
-            user.fullName.toLowerCase().includes(lowercasedFilter) ||
-            user.username.toLowerCase().includes(lowercasedFilter) ||
-            (user.lrn && user.lrn.includes(lowercasedFilter))
-        ).slice(0, 5); // Limit results
-    }, [state.users, searchTerm]);
+    React.useEffect(() => {
+        const term = searchTerm.trim();
+        if (!term) {
+            setFilteredUsers([]);
+            return;
+        }
+        // Wait for a pause in typing, and drop answers to queries that were typed over.
+        let cancelled = false;
+        const timer = setTimeout(() => {
+            api.search(term, 'users', 5)
+                .then(results => { if (!cancelled) setFilteredUsers(results.users || []); })
+                .catch(error => console.error('User search failed:', error));
+        }, SEARCH_DEBOUNCE_MS);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [searchTerm]);
 
     const handleSelectUser = (user: User) => {
+        setPickedUser(user);
         onUserSelect(user.id);
         setSearchTerm('');
         setIsSearching(false);
@@ -20,7 +20,7 @@ const SESSION_STORAGE_KEY = 'oliLabLoggedInUserId';
 export const AuthProvider = ({ children }: { children: React.ReactNode }) => {
   const [currentUser, setCurrentUser] = React.useState<SecureUser | null>(null);
   const [isLoading, setIsLoading] = React.useState(true);
-  const { state: inventoryState } = useInventory();
+  const { state: inventoryState, watchNotifications } = useInventory();
 
   React.useEffect(() => {
     try {
@@ -42,6 +42,11 @@ export const AuthProvider = ({ children }: { children: React.ReactNode }) => {
     }
   }, [inventoryState.users]);
 
+  React.useEffect(() => {
+    if (!currentUser) return;
+    return watchNotifications(currentUser.id);
+  }, [currentUser?.id, watchNotifications]);
+
   const login = async (identifier: string, password: string): Promise<boolean> => {
     try {
         const user = await api.login({ identifier, password });
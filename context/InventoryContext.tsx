@@ -26,6 +26,7 @@ interface InventoryContextType {
   approveUser: (userId: string) => Promise<void>;
   denyUser: (userId: string) => Promise<void>;
   markNotificationsAsRead: (notificationIds: string[]) => Promise<void>;
+  watchNotifications: (userId: string) => () => void;
   addSuggestion: (suggestionData: Omit<Suggestion, 'id' | 'status' | 'timestamp' | 'category'>) => Promise<void>;
   approveItemSuggestion: (payload: { suggestionId: string; category: string; totalQuantity: number }) => Promise<void>;
   approveFeatureSuggestion: (suggestionId: string) => Promise<void>;
@@ -105,7 +106,7 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
     let newUserId = '';
     await handleApiCall(
         () => api.createUser(userData),
-        ({ newUser, newNotification }) => {
+        ({ newUser }) => {
             newUserId = newUser.id;
             setState((prev: State) => {
                 const updatedUsers = [...prev.users, newUser];
@@ -114,7 +115,6 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
                 return {
                     ...prev,
                     users: updatedUsers,
-                    notifications: [newNotification, ...prev.notifications]
                 };
             });
         }
@@ -159,11 +159,10 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
   const requestBorrowItem: InventoryContextType['requestBorrowItem'] = async (payload) => {
     await handleApiCall(
         () => api.requestBorrowItem(payload),
-        ({ newLog, newNotification }) => {
+        ({ newLog }) => {
             setState((prev: State) => ({
                 ...prev,
                 logs: [newLog, ...prev.logs],
-                notifications: [newNotification, ...prev.notifications]
             }));
         }
     );
@@ -205,11 +204,10 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
   const requestItemReturn: InventoryContextType['requestItemReturn'] = async (log) => {
       await handleApiCall(
           () => api.requestItemReturn(log.id),
-          ({ updatedLog, newNotification }) => {
+          ({ updatedLog }) => {
               setState((prev: State) => ({
                   ...prev,
                   logs: prev.logs.map(l => l.id === updatedLog.id ? updatedLog : l),
-                  notifications: [newNotification, ...prev.notifications],
               }));
           }
       );
@@ -227,6 +225,22 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
     );
   };
 
+  // Notifications are per user: load the signed-in user's, then keep them current from the server's event stream.
+  const watchNotifications: InventoryContextType['watchNotifications'] = React.useCallback((userId) => {
+    const addNotifications = (incoming: Notification[]) => setState((prev: State) => {
+        const known = new Set(prev.notifications.map(n => n.id));
+        return { ...prev, notifications: [...incoming.filter(n => !known.has(n.id)), ...prev.notifications] };
+    });
+    api.getNotifications(userId)
+        .then(notifications => setState((prev: State) => ({ ...prev, notifications })))
+        .catch(error => console.error("Failed to load notifications:", error));
+    const unsubscribe = api.subscribeToNotifications(userId, notification => addNotifications([notification]));
+    return () => {
+        unsubscribe();
+        setState((prev: State) => ({ ...prev, notifications: [] }));
+    };
+  }, []);
+
   const addSuggestion: InventoryContextType['addSuggestion'] = async (suggestionData) => {
     await handleApiCall(
         () => api.addSuggestion(suggestionData),
@@ -300,6 +314,7 @@ export const InventoryProvider = ({ children }: { children: React.ReactNode }) =
       approveUser,
       denyUser,
       markNotificationsAsRead,
+      watchNotifications,
       addSuggestion,
       approveItemSuggestion,
       approveFeatureSuggestion,
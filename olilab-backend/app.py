@@ -2,23 +2,73 @@ import os
 import uuid
 import enum
 import json
-from flask import Flask, jsonify, request, abort
+import base64
+import csv
+import io
+import hashlib
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import click
+from flask import Blueprint, Flask, Response, jsonify, request, abort, stream_with_context, current_app, has_app_context
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
-import google.generativeai as genai
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy import event, create_engine, make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import make_transient_to_detached
+from metrics import Metrics, PoolMonitor
+from passwords import PasswordHasher, PasswordHasherBusy
+from events import EventBroadcaster, CHANNEL as EVENT_CHANNEL, LISTEN_DRIVERS, format_sse
+from reports import GeminiReportWriter, StubReportWriter, ReportWorkerPool, ReportQueueFull
+from search import SearchIndex
+from cache import ReadCache, MISSING
+from storage import TZDateTime, Enum, utcnow, configure_engine, install_engine_hooks, is_busy_error
+from exports import iter_csv, iter_xlsx, CSV_MIMETYPE, XLSX_MIMETYPE
+from serializers import RowSerializer, RowStream, FastJSONProvider, dumps, iter_json_object, iter_ndjson
 
 # --- App Initialization & Configuration ---
 
 # Load environment variables from .env file for local development
 load_dotenv()
 
+class BatchableSession(FlaskSession):
+    """The session class, able to run route handlers as parts of one /api/batch transaction.
+
+    While a batch operation runs, `info['batch_savepoint']` holds the savepoint
+    around it: the handler's commit() only releases that savepoint and its
+    rollback() only rolls back to it. Both expire the session as usual, so the
+    next operation reads what this one wrote. The batch ends the transaction.
+    """
+    def commit(self):
+        savepoint = self.info.get('batch_savepoint')
+        if savepoint is None:
+            return super().commit()
+        if savepoint.is_active:
+            savepoint.commit()
+        self.expire_all()
+
+    def rollback(self):
+        savepoint = self.info.get('batch_savepoint')
+        if savepoint is None:
+            return super().rollback()
+        if savepoint.is_active:
+            savepoint.rollback()
+        self.expire_all()
+
 # Initialize extensions
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+db = SQLAlchemy(session_options={'class_': BatchableSession})
+passwords = PasswordHasher()
+metrics = Metrics()
 
 # --- ENUM Type Definitions for SQLAlchemy Models ---
 # These ensure data integrity by restricting values to predefined sets.
@@ -51,12 +101,26 @@ class SuggestionStatusEnum(enum.Enum):
     APPROVED = 'APPROVED'
     DENIED = 'DENIED'
 
+class ReportJobStatusEnum(enum.Enum):
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
 # --- SQLAlchemy Database Models ---
 # These classes define the structure of the database tables.
 
-class User(db.Model):
+class SyncMixin:
+    """Adds a monotonic change version, bumped on every insert or update."""
+    row_version = db.Column(db.BigInteger, nullable=False, default=0, index=True)
+
+class User(SyncMixin, db.Model):
     __tablename__ = 'users'
-    id = db.Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        db.Index('idx_users_full_name_id', 'full_name', 'id'),
+        db.Index('idx_users_status_full_name_id', 'status', 'full_name', 'id'),
+    )
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     username = db.Column(db.String(80), unique=True, nullable=False)
     full_name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -64,559 +128,2677 @@ class User(db.Model):
     lrn = db.Column(db.String(12), unique=True, nullable=True)
     grade_level = db.Column(db.String(50), nullable=True)
     section = db.Column(db.String(50), nullable=True)
-    role = db.Column(db.Enum(UserRoleEnum), nullable=False, default=UserRoleEnum.Member)
+    role = db.Column(Enum(UserRoleEnum), nullable=False, default=UserRoleEnum.Member)
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
-    status = db.Column(db.Enum(UserStatusEnum), nullable=False, default=UserStatusEnum.PENDING)
-    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    status = db.Column(Enum(UserStatusEnum), nullable=False, default=UserStatusEnum.PENDING)
+    created_at = db.Column(TZDateTime(), server_default=utcnow())
 
     def to_dict(self, exclude_password=True):
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        if exclude_password:
-            d.pop('password_hash', None)
-        for key, value in d.items():
-            if isinstance(value, enum.Enum): d[key] = value.value
-            if isinstance(value, uuid.UUID): d[key] = str(value)
-        return {
-            'id': d['id'], 'username': d['username'], 'fullName': d['full_name'], 'email': d['email'],
-            'lrn': d['lrn'], 'gradeLevel': d['grade_level'], 'section': d['section'], 'role': d['role'],
-            'isAdmin': d['is_admin'], 'status': d['status']
-        }
-
-class Item(db.Model):
+        # The serialized shape never includes the password hash.
+        return USER_ROW.from_object(self)
+
+# Case-insensitive lookups used by login and signup uniqueness checks.
+db.Index('idx_users_lower_username', db.func.lower(User.username))
+db.Index('idx_users_lower_email', db.func.lower(User.email))
+
+class Item(SyncMixin, db.Model):
     __tablename__ = 'items'
-    id = db.Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    __table_args__ = (
+        db.Index('idx_items_name_id', 'name', 'id'),
+        db.Index('idx_items_category_name_id', 'category', 'name', 'id'),
+    )
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(255), nullable=False)
     category = db.Column(db.String(100), nullable=False)
     total_quantity = db.Column(db.Integer, nullable=False)
     available_quantity = db.Column(db.Integer, nullable=False)
-    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
-    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now())
+    created_at = db.Column(TZDateTime(), server_default=utcnow())
+    updated_at = db.Column(TZDateTime(), server_default=utcnow(), onupdate=utcnow())
     
     def to_dict(self):
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        if isinstance(d['id'], uuid.UUID): d['id'] = str(d['id'])
-        return {
-            'id': d['id'], 'name': d['name'], 'category': d['category'],
-            'totalQuantity': d['total_quantity'], 'availableQuantity': d['available_quantity']
-        }
-
-class Log(db.Model):
+        return ITEM_ROW.from_object(self)
+
+class Log(SyncMixin, db.Model):
     __tablename__ = 'logs'
-    id = db.Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = db.Column(PG_UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
-    item_id = db.Column(PG_UUID(as_uuid=True), db.ForeignKey('items.id'), nullable=False)
+    __table_args__ = (
+        db.Index('idx_logs_timestamp_id', 'timestamp', 'id'),
+        db.Index('idx_logs_status_timestamp_id', 'status', 'timestamp', 'id'),
+        db.Index('idx_logs_action_timestamp_id', 'action', 'timestamp', 'id'),
+        db.Index('idx_logs_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+        db.Index('idx_logs_user_status_timestamp_id', 'user_id', 'status', 'timestamp', 'id'),
+        db.Index('idx_logs_item_timestamp_id', 'item_id', 'timestamp', 'id'),
+    )
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    # Logs outlive their user (history is kept) but not their item, as in schema.sql.
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    item_id = db.Column(db.Uuid, db.ForeignKey('items.id', ondelete='CASCADE'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    timestamp = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
-    action = db.Column(db.Enum(LogActionEnum), nullable=False)
-    status = db.Column(db.Enum(LogStatusEnum), nullable=True)
+    timestamp = db.Column(TZDateTime(), server_default=utcnow())
+    action = db.Column(Enum(LogActionEnum), nullable=False)
+    status = db.Column(Enum(LogStatusEnum), nullable=True)
     admin_notes = db.Column(db.Text, nullable=True)
-    related_log_id = db.Column(PG_UUID(as_uuid=True), nullable=True)
+    related_log_id = db.Column(db.Uuid, nullable=True)
     return_requested = db.Column(db.Boolean, default=False)
     
     def to_dict(self):
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        for key, value in d.items():
-            if isinstance(value, enum.Enum): d[key] = value.value
-            if isinstance(value, uuid.UUID): d[key] = str(value)
-        # Ensure timestamp is always serialized correctly
-        if 'timestamp' in d and hasattr(d['timestamp'], 'isoformat'):
-            d['timestamp'] = d['timestamp'].isoformat()
-        return {
-            'id': d['id'], 'userId': d['user_id'], 'itemId': d['item_id'], 'quantity': d['quantity'],
-            'timestamp': d['timestamp'], 'action': d['action'], 'status': d['status'],
-            'adminNotes': d['admin_notes'], 'relatedLogId': d['related_log_id'], 'returnRequested': d['return_requested']
-        }
-
-class Suggestion(db.Model):
+        return LOG_ROW.from_object(self)
+
+# Only RETURN logs link back to a borrow; finds a borrow's return without a scan.
+db.Index('idx_logs_related_log_id', Log.related_log_id,
+         postgresql_where=Log.related_log_id.isnot(None), sqlite_where=Log.related_log_id.isnot(None))
+
+class ArchivedLog(db.Model):
+    """A RETURNED or DENIED log moved out of `logs` by `flask archive-logs`.
+
+    The archive has no foreign keys, so history outlives deleted users and
+    items; their names are copied in when the log is archived.
+    """
+    __tablename__ = 'log_archive'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('timestamp', 'id'),
+        db.Index('idx_log_archive_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+        db.Index('idx_log_archive_item_timestamp_id', 'item_id', 'timestamp', 'id'),
+    )
+    id = db.Column(db.Uuid, nullable=False)
+    user_id = db.Column(db.Uuid, nullable=True)
+    item_id = db.Column(db.Uuid, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(TZDateTime(), nullable=False)
+    action = db.Column(Enum(LogActionEnum), nullable=False)
+    status = db.Column(Enum(LogStatusEnum), nullable=True)
+    admin_notes = db.Column(db.Text, nullable=True)
+    related_log_id = db.Column(db.Uuid, nullable=True)
+    return_requested = db.Column(db.Boolean, default=False)
+    user_name = db.Column(db.String(120), nullable=True)
+    item_name = db.Column(db.String(255), nullable=True)
+    archived_at = db.Column(TZDateTime(), nullable=False, server_default=utcnow())
+
+class OutstandingLoan(db.Model):
+    """How many approved, unreturned loans of one item a user holds.
+
+    The approve and return routes keep this in step with the logs in the same
+    transaction, so a user's outstanding loans are one primary-key range read.
+    """
+    __tablename__ = 'outstanding_loans'
+    __table_args__ = (
+        db.Index('idx_outstanding_loans_item_id', 'item_id'),
+    )
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    item_id = db.Column(db.Uuid, db.ForeignKey('items.id', ondelete='CASCADE'), primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class UsageCountersMixin:
+    """One day's borrow and return counts; see `add_usage` and `rebuild_usage_rollups`."""
+    day = db.Column(db.Date, nullable=False)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    borrowed_quantity = db.Column(db.Integer, nullable=False, default=0)
+    returned_quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class ItemUsageDaily(UsageCountersMixin, db.Model):
+    """How much one item was requested, borrowed and returned on one day."""
+    __tablename__ = 'item_usage_daily'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('item_id', 'day'),
+        # Covers the whole row, so ranking items over a date range never visits the table.
+        db.Index('idx_item_usage_daily_day', 'day', 'item_id', 'requests', 'borrows', 'returns',
+                 'borrowed_quantity', 'returned_quantity'),
+    )
+    item_id = db.Column(db.Uuid, db.ForeignKey('items.id', ondelete='CASCADE'), nullable=False)
+
+class SectionUsageDaily(UsageCountersMixin, db.Model):
+    """How much the borrowers of one section requested, borrowed and returned on one day."""
+    __tablename__ = 'section_usage_daily'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('section', 'day'),
+        db.Index('idx_section_usage_daily_day', 'day'),
+    )
+    # '' for borrowers without a section, so it can be part of the primary key.
+    section = db.Column(db.String(50), nullable=False)
+
+class Suggestion(SyncMixin, db.Model):
     __tablename__ = 'suggestions'
-    id = db.Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = db.Column(PG_UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
-    type = db.Column(db.Enum(SuggestionTypeEnum), nullable=False)
+    __table_args__ = (
+        db.Index('idx_suggestions_timestamp_id', 'timestamp', 'id'),
+        db.Index('idx_suggestions_status_timestamp_id', 'status', 'timestamp', 'id'),
+        db.Index('idx_suggestions_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    type = db.Column(Enum(SuggestionTypeEnum), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(100), nullable=True)
-    status = db.Column(db.Enum(SuggestionStatusEnum), nullable=False, default=SuggestionStatusEnum.PENDING)
-    timestamp = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    status = db.Column(Enum(SuggestionStatusEnum), nullable=False, default=SuggestionStatusEnum.PENDING)
+    timestamp = db.Column(TZDateTime(), server_default=utcnow())
 
     def to_dict(self):
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        for key, value in d.items():
-            if isinstance(value, enum.Enum): d[key] = value.value
-            if isinstance(value, uuid.UUID): d[key] = str(value)
-        if hasattr(d['timestamp'], 'isoformat'):
-            d['timestamp'] = d['timestamp'].isoformat()
-        return {
-            'id': d['id'], 'userId': d['user_id'], 'type': d['type'], 'title': d['title'],
-            'description': d['description'], 'category': d['category'], 'status': d['status'],
-            'timestamp': d['timestamp']
-        }
-
-class Comment(db.Model):
+        return SUGGESTION_ROW.from_object(self)
+
+class Comment(SyncMixin, db.Model):
     __tablename__ = 'comments'
-    id = db.Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = db.Column(PG_UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
-    suggestion_id = db.Column(PG_UUID(as_uuid=True), db.ForeignKey('suggestions.id'), nullable=False)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    suggestion_id = db.Column(db.Uuid, db.ForeignKey('suggestions.id', ondelete='CASCADE'), nullable=False)
     text = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    timestamp = db.Column(TZDateTime(), server_default=utcnow())
     
     def to_dict(self):
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        for key, value in d.items():
-            if isinstance(value, uuid.UUID): d[key] = str(value)
-        if hasattr(d['timestamp'], 'isoformat'):
-            d['timestamp'] = d['timestamp'].isoformat()
-        return {
-            'id': d['id'], 'userId': d['user_id'], 'suggestionId': d['suggestion_id'],
-            'text': d['text'], 'timestamp': d['timestamp']
-        }
-        
-def create_mock_notification(message, type, related_id=None):
-    """Helper to create a notification-like dictionary for the frontend."""
+        return COMMENT_ROW.from_object(self)
+
+class Notification(db.Model):
+    """A message for one user; admin notifications get one row per admin."""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('idx_notifications_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    read = db.Column(db.Boolean, nullable=False, default=False)
+    timestamp = db.Column(TZDateTime(), nullable=False, default=lambda: datetime.now(timezone.utc))
+    related_log_id = db.Column(db.Uuid, nullable=True)
+
+    def to_dict(self):
+        return NOTIFICATION_ROW.from_object(self)
+
+# Unread counts only touch this user's unread rows, never their read history.
+db.Index('idx_notifications_user_unread', Notification.user_id,
+         postgresql_where=~Notification.read, sqlite_where=~Notification.read)
+
+# --- Row Serializers ---
+# Each model's API shape, compiled once into a converter. Routes select these
+# columns directly and serialize the plain tuples without hydrating ORM objects.
+USER_ROW = RowSerializer([
+    ('id', User.id), ('username', User.username), ('fullName', User.full_name), ('email', User.email),
+    ('lrn', User.lrn), ('gradeLevel', User.grade_level), ('section', User.section), ('role', User.role),
+    ('isAdmin', User.is_admin), ('status', User.status),
+])
+ITEM_ROW = RowSerializer([
+    ('id', Item.id), ('name', Item.name), ('category', Item.category),
+    ('totalQuantity', Item.total_quantity), ('availableQuantity', Item.available_quantity),
+])
+LOG_ROW = RowSerializer([
+    ('id', Log.id), ('userId', Log.user_id), ('itemId', Log.item_id), ('quantity', Log.quantity),
+    ('timestamp', Log.timestamp), ('action', Log.action), ('status', Log.status),
+    ('adminNotes', Log.admin_notes), ('relatedLogId', Log.related_log_id), ('returnRequested', Log.return_requested),
+])
+ARCHIVED_LOG_ROW = RowSerializer([
+    ('id', ArchivedLog.id), ('userId', ArchivedLog.user_id), ('itemId', ArchivedLog.item_id),
+    ('quantity', ArchivedLog.quantity), ('timestamp', ArchivedLog.timestamp), ('action', ArchivedLog.action),
+    ('status', ArchivedLog.status), ('adminNotes', ArchivedLog.admin_notes),
+    ('relatedLogId', ArchivedLog.related_log_id), ('returnRequested', ArchivedLog.return_requested),
+    ('userName', ArchivedLog.user_name), ('itemName', ArchivedLog.item_name), ('archivedAt', ArchivedLog.archived_at),
+])
+# A borrow log with its item's name, as the per-user ledger shows it.
+BORROW_ROW = RowSerializer([*zip(LOG_ROW.keys, LOG_ROW.columns), ('itemName', Item.name)])
+OUTSTANDING_ROW = RowSerializer([
+    ('itemId', OutstandingLoan.item_id), ('itemName', Item.name),
+    ('loans', OutstandingLoan.loans), ('quantity', OutstandingLoan.quantity),
+])
+SUGGESTION_ROW = RowSerializer([
+    ('id', Suggestion.id), ('userId', Suggestion.user_id), ('type', Suggestion.type), ('title', Suggestion.title),
+    ('description', Suggestion.description), ('category', Suggestion.category), ('status', Suggestion.status),
+    ('timestamp', Suggestion.timestamp),
+])
+COMMENT_ROW = RowSerializer([
+    ('id', Comment.id), ('userId', Comment.user_id), ('suggestionId', Comment.suggestion_id),
+    ('text', Comment.text), ('timestamp', Comment.timestamp),
+])
+NOTIFICATION_ROW = RowSerializer([
+    ('id', Notification.id), ('message', Notification.message), ('type', Notification.type),
+    ('read', Notification.read), ('timestamp', Notification.timestamp), ('relatedLogId', Notification.related_log_id),
+])
+
+class ReportJob(db.Model):
+    """A queued or finished report; stored in the database so every worker can serve it."""
+    __tablename__ = 'report_jobs'
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    cache_key = db.Column(db.String(64), nullable=False, index=True)
+    mode = db.Column(db.String(16), nullable=False)
+    status = db.Column(Enum(ReportJobStatusEnum), nullable=False, default=ReportJobStatusEnum.QUEUED)
+    result = db.Column(db.Text, nullable=True) # The finished report as JSON
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(TZDateTime(), nullable=False, default=lambda: datetime.now(timezone.utc))
+    deadline = db.Column(TZDateTime(), nullable=False)
+
+    def is_expired(self):
+        deadline = self.deadline if self.deadline.tzinfo else self.deadline.replace(tzinfo=timezone.utc)
+        return (self.status in (ReportJobStatusEnum.QUEUED, ReportJobStatusEnum.RUNNING)
+                and datetime.now(timezone.utc) > deadline)
+
+    def is_finished(self):
+        return self.status in (ReportJobStatusEnum.DONE, ReportJobStatusEnum.FAILED) or self.is_expired()
+
+    def to_dict(self):
+        d = {"jobId": str(self.id), "status": self.status.value}
+        if self.is_expired():
+            d.update(status=ReportJobStatusEnum.FAILED.value, error="Report generation timed out.")
+        elif self.status == ReportJobStatusEnum.DONE:
+            d["report"] = json.loads(self.result)
+        elif self.status == ReportJobStatusEnum.FAILED:
+            d["error"] = self.error
+        return d
+
+class SyncCounter(db.Model):
+    """Single-row counter that hands out change versions in commit order."""
+    __tablename__ = 'sync_counter'
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class Tombstone(db.Model):
+    """Records a deleted row so delta-syncing clients can drop it too."""
+    __tablename__ = 'tombstones'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    entity = db.Column(db.String(32), nullable=False)
+    entity_id = db.Column(db.Uuid, nullable=False)
+    row_version = db.Column(db.BigInteger, nullable=False, index=True)
+
+# --- Change Tracking for Delta Sync ---
+# Maps each synced model to the key it uses in the /api/data payload.
+SYNCED_MODELS = {Item: 'items', User: 'users', Log: 'logs', Suggestion: 'suggestions', Comment: 'comments'}
+
+def next_row_version(session):
+    """Increments the change counter and returns the new value.
+
+    The counter row stays locked until the transaction commits, so versions
+    become visible in the same order they were handed out. Core-level
+    UPDATE/INSERT statements that bypass the ORM must stamp rows with this too.
+    """
+    version = session.execute(
+        db.update(SyncCounter).where(SyncCounter.id == 1)
+        .values(value=SyncCounter.value + 1).returning(SyncCounter.value)
+    ).scalar()
+    if version is None:
+        session.execute(db.insert(SyncCounter).values(id=1, value=1))
+        version = 1
+    return version
+
+def current_row_version(session):
+    """Returns the latest committed change version without bumping it."""
+    return session.execute(db.select(SyncCounter.value).where(SyncCounter.id == 1)).scalar() or 0
+
+@event.listens_for(db.session, 'before_flush')
+def _stamp_row_versions(session, flush_context, instances):
+    """Stamps changed rows with a new version and writes tombstones for deletes."""
+    changed = [o for o in session.new if isinstance(o, SyncMixin)]
+    changed += [o for o in session.dirty if isinstance(o, SyncMixin) and session.is_modified(o)]
+    deleted = [o for o in session.deleted if type(o) in SYNCED_MODELS]
+    if not changed and not deleted:
+        return
+
+    with session.no_autoflush:
+        version = next_row_version(session)
+        for obj in changed:
+            obj.row_version = version
+        for obj in deleted:
+            session.add(Tombstone(entity=SYNCED_MODELS[type(obj)], entity_id=obj.id, row_version=version))
+            if isinstance(obj, Item):
+                # The database cascades the item's logs away; tell clients about them too.
+                for log_id in session.execute(db.select(Log.id).where(Log.item_id == obj.id)).scalars():
+                    session.add(Tombstone(entity='logs', entity_id=log_id, row_version=version))
+            elif isinstance(obj, User):
+                # The database nulls out the user's references; make those rows resync.
+                for model in (Log, Suggestion, Comment):
+                    session.execute(db.update(model).where(model.user_id == obj.id).values(row_version=version))
+
+def login_user_query(identifier):
+    """Selects the user whose username, email or LRN is `identifier` (lowercased)."""
+    # Each branch matches an index (lower(username), lower(email), lrn).
+    return db.select(User).where(
+        (db.func.lower(User.username) == identifier) |
+        (db.func.lower(User.email) == identifier) |
+        (User.lrn == identifier)
+    ).limit(1)
+
+def hash_password_or_503(password):
+    """Hashes a password in the worker pool, answering 503 if the pool is saturated."""
+    try:
+        return passwords.hash(password)
+    except PasswordHasherBusy:
+        abort(503, "The server is busy. Please try again in a moment.")
+
+# --- Atomic Stock & Log Transitions ---
+# Stock and status changes are single conditional UPDATEs, so concurrent workers
+# can never oversell an item or process the same log twice. Callers take a
+# version from next_row_version() first; that also fixes the lock order as
+# sync counter -> log -> item -> outstanding loan -> usage rollup, which keeps
+# concurrent transactions deadlock-free.
+
+MAX_BULK_OPERATIONS = 500
+BULK_LOG_ACTIONS = ('approve', 'deny', 'return')
+# What the borrower is told after each log action: (message template, notification type).
+LOG_ACTION_NOTICES = {
+    'approve': ("Your request to borrow {item} was approved.", 'borrow_request_approved'),
+    'deny': ("Your request to borrow {item} was denied.", 'borrow_request_denied'),
+    'return': ("Your return of {item} was received.", 'item_returned'),
+}
+
+def transition_log(log_id, from_status, to_status, version, **values):
+    """Moves a log to `to_status` only if it is still in `from_status`.
+
+    Returns False if another request got there first.
+    """
+    result = db.session.execute(
+        db.update(Log).where(Log.id == log_id, Log.status == from_status)
+        .values(status=to_status, row_version=version, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def reserve_stock(item_id, quantity, version):
+    """Takes `quantity` units out of stock only if that many are available."""
+    result = db.session.execute(
+        db.update(Item).where(Item.id == item_id, Item.available_quantity >= quantity)
+        .values(available_quantity=Item.available_quantity - quantity, row_version=version)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def release_stock(item_id, quantity, version):
+    """Puts `quantity` units back in stock, never above the item's total."""
+    result = db.session.execute(
+        db.update(Item).where(Item.id == item_id, Item.available_quantity + quantity <= Item.total_quantity)
+        .values(available_quantity=Item.available_quantity + quantity, row_version=version)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def adjust_outstanding_loans(user_id, item_id, loans, quantity):
+    """Adds approved loans to what a user has out of an item; negative numbers return them.
+
+    A single upsert, so concurrent approvals for the same user and item both count.
+    Logs whose borrower was deleted have no one to count against and are skipped.
+    """
+    if user_id is None:
+        return
+    insert = pg_insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(OutstandingLoan).values(user_id=user_id, item_id=item_id, loans=loans, quantity=quantity)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[OutstandingLoan.user_id, OutstandingLoan.item_id],
+        set_={'loans': OutstandingLoan.loans + stmt.excluded.loans,
+              'quantity': OutstandingLoan.quantity + stmt.excluded.quantity},
+    ))
+
+def rebuild_outstanding_loans():
+    """Recomputes every outstanding-loan counter from the logs, for backfills and repairs."""
+    db.session.execute(db.delete(OutstandingLoan))
+    db.session.execute(db.insert(OutstandingLoan).from_select(
+        ['user_id', 'item_id', 'loans', 'quantity'],
+        db.select(Log.user_id, Log.item_id, db.func.count(), db.func.sum(Log.quantity))
+        .where(Log.action == LogActionEnum.BORROW, Log.status == LogStatusEnum.APPROVED, Log.user_id.isnot(None))
+        .group_by(Log.user_id, Log.item_id)
+    ))
+
+# --- Log Archive ---
+# Finished logs past the cutoff move to log_archive, so everything that reads
+# `logs` (full syncs, ledgers, reports) only sees the active window.
+LOG_ARCHIVE_BATCH_SIZE = 1000
+ARCHIVED_LOG_STATUSES = (LogStatusEnum.RETURNED, LogStatusEnum.DENIED)
+
+def archivable_logs(cutoff):
+    """Selects the ids of RETURNED and DENIED logs older than `cutoff`, oldest first.
+
+    A returned borrow waits until its RETURN log is past the cutoff as well,
+    so the two are archived together and related_log_id stays in one table.
+    """
+    later_return = db.aliased(Log)
+    return (
+        db.select(Log.id)
+        .where(Log.status.in_(ARCHIVED_LOG_STATUSES), Log.timestamp < cutoff)
+        .where(~db.select(later_return.id)
+               .where(later_return.related_log_id == Log.id, later_return.timestamp >= cutoff).exists())
+        .order_by(Log.timestamp, Log.id)
+    )
+
+def ensure_archive_partitions(start, end):
+    """Creates the yearly partitions of log_archive from `start` to `end` on Postgres.
+
+    Only when schema.sql created the table partitioned; a table made by
+    db.create_all() is a plain table and needs none.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    if not db.session.execute(db.text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('log_archive')"
+    )).scalar():
+        return
+    for year in range(start.year, end.year + 1):
+        db.session.execute(db.text(
+            f"CREATE TABLE IF NOT EXISTS log_archive_{year} PARTITION OF log_archive "
+            f"FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')"
+        ))
+    db.session.commit()
+
+def archive_log_batch(cutoff, batch_size=LOG_ARCHIVE_BATCH_SIZE):
+    """Moves up to `batch_size` archivable logs into log_archive in one transaction.
+
+    The moved logs get tombstones, as when an item's logs are deleted, so
+    delta-syncing clients drop them too. Returns how many were moved.
+    """
+    ids = db.session.execute(archivable_logs(cutoff).limit(batch_size)).scalars().all()
+    if not ids:
+        return 0
+    version = next_row_version(db.session)
+    columns = ['id', 'user_id', 'item_id', 'quantity', 'timestamp', 'action', 'status', 'admin_notes',
+               'related_log_id', 'return_requested']
+    db.session.execute(db.insert(ArchivedLog).from_select(
+        columns + ['user_name', 'item_name'],
+        db.select(*[Log.__table__.c[name] for name in columns], User.full_name, Item.name)
+        .join(Item, Item.id == Log.item_id).outerjoin(User, User.id == Log.user_id)
+        .where(Log.id.in_(ids))
+    ))
+    db.session.execute(db.insert(Tombstone), [
+        {'entity': 'logs', 'entity_id': log_id, 'row_version': version} for log_id in ids])
+    db.session.execute(db.delete(Log).where(Log.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+def archive_logs(cutoff, batch_size=LOG_ARCHIVE_BATCH_SIZE):
+    """Moves every archivable log older than `cutoff`, a batch per transaction. Returns the count."""
+    oldest = db.session.execute(
+        db.select(db.func.min(Log.timestamp)).where(Log.status.in_(ARCHIVED_LOG_STATUSES), Log.timestamp < cutoff)
+    ).scalar()
+    if oldest is None:
+        return 0
+    ensure_archive_partitions(oldest, cutoff)
+    moved = 0
+    while True:
+        count = archive_log_batch(cutoff, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
+
+# --- Usage Rollups ---
+# Daily request, borrow and return counts per item and per borrower section,
+# so trends and rankings read one row per item (or section) per day instead of
+# every log. A request and its approval count on the day it was requested:
+# logs keep no approval time, and a rebuild has to land on the same day. A
+# return counts on the day it came back.
+USAGE_METRICS = {
+    'requests': 'requests', 'borrows': 'borrows', 'returns': 'returns',
+    'borrowedQuantity': 'borrowed_quantity', 'returnedQuantity': 'returned_quantity',
+}
+USAGE_INTERVALS = ('day', 'week', 'month')
+DEFAULT_USAGE_DAYS = 90
+MAX_USAGE_DAYS = 3660
+DEFAULT_TOP_USAGE_LIMIT = 10
+MAX_TOP_USAGE_LIMIT = 100
+
+def usage_timezone():
+    return ZoneInfo(current_app.config['USAGE_TIMEZONE'])
+
+def usage_day(timestamp):
+    """The calendar day a log's timestamp falls on in USAGE_TIMEZONE."""
+    return timestamp.astimezone(usage_timezone()).date()
+
+def user_section(user_id):
+    """The section usage is counted under for a borrower: '' without one."""
+    user = cached_get(User, user_id) if user_id else None
+    return (user.section or '') if user else ''
+
+def add_usage(entries):
+    """Adds (item_id, section, day, {counter: amount}) entries to the daily rollups.
+
+    Every row is a single upsert, so concurrent writers all count. Item rows go
+    before section rows, each in key order, so writers lock them in one order.
+    """
+    items, sections = {}, {}
+    for item_id, section, day, counts in entries:
+        items.setdefault((item_id, day), Counter()).update(counts)
+        sections.setdefault((section or '', day), Counter()).update(counts)
+    insert = pg_insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    for model, key, rows in ((ItemUsageDaily, 'item_id', items), (SectionUsageDaily, 'section', sections)):
+        for (value, day), counts in sorted(rows.items(), key=lambda row: row[0]):
+            stmt = insert(model).values({key: value, 'day': day, **counts})
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[key, 'day'],
+                set_={name: model.__table__.c[name] + stmt.excluded[name] for name in counts},
+            ))
+
+def rebuild_usage_rollups():
+    """Recomputes the usage rollups from the logs and the log archive, for backfills and repairs.
+
+    The logs are read in cursor batches and counted in memory, which holds one
+    entry per item and per section for each day with any activity.
+    """
+    zone = usage_timezone()
+    items, sections = {}, {}
+
+    def count(rows, key, counts):
+        total = rows.get(key)
+        if total is None:
+            rows[key] = list(counts)
+        else:
+            for index, value in enumerate(counts):
+                total[index] += value
+
+    # Counts in USAGE_METRICS order: requests, borrows, returns, borrowed and returned quantity.
+    for model in (Log, ArchivedLog):
+        stmt = (db.select(model.item_id, Item.id.isnot(None), User.section, model.action, model.status,
+                          model.quantity, model.timestamp)
+                .outerjoin(Item, Item.id == model.item_id).outerjoin(User, User.id == model.user_id))
+        for batch in stream_batches(stmt):
+            for item_id, item_exists, section, action, status, quantity, timestamp in batch:
+                day = timestamp.astimezone(zone).date()
+                if action == LogActionEnum.RETURN:
+                    counts = (0, 0, 1, 0, quantity)
+                elif status in (LogStatusEnum.APPROVED, LogStatusEnum.RETURNED):
+                    counts = (1, 1, 0, quantity, 0)
+                else:
+                    counts = (1, 0, 0, 0, 0)
+                # Archived logs can outlive their item; those only count for the section.
+                if item_exists:
+                    count(items, (item_id, day), counts)
+                count(sections, (section or '', day), counts)
+
+    db.session.execute(db.delete(ItemUsageDaily))
+    db.session.execute(db.delete(SectionUsageDaily))
+    for model, key, rows in ((ItemUsageDaily, 'item_id', items), (SectionUsageDaily, 'section', sections)):
+        values = [{key: value, 'day': day, **dict(zip(USAGE_METRICS.values(), counts))}
+                  for (value, day), counts in rows.items()]
+        for start in range(0, len(values), STREAM_BATCH_SIZE):
+            db.session.execute(model.__table__.insert(), values[start:start + STREAM_BATCH_SIZE])
+
+def usage_range():
+    """The `from`/`to` days (ISO dates) of a usage query; the last DEFAULT_USAGE_DAYS days by default."""
+    end = parse_date_arg('to') or datetime.now(usage_timezone()).date()
+    start = parse_date_arg('from') or end - timedelta(days=DEFAULT_USAGE_DAYS - 1)
+    if start > end: abort(400, "'from' must not be after 'to'.")
+    if (end - start).days >= MAX_USAGE_DAYS:
+        abort(400, f"At most {MAX_USAGE_DAYS} days can be queried at once.")
+    return start, end
+
+def usage_period(day, interval):
+    """The first day of the day, week (from Monday) or month that `day` falls in."""
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_usage_period(period, interval):
+    if interval == 'week':
+        return period + timedelta(weeks=1)
+    if interval == 'month':
+        return (period + timedelta(days=32)).replace(day=1)
+    return period + timedelta(days=1)
+
+# --- Streaming Item Import ---
+IMPORT_CHUNK_SIZE = 1000
+MAX_IMPORT_CHUNK_SIZE = 10000
+MAX_IMPORT_ERRORS = 1000
+
+def iter_import_records(stream, fmt):
+    """Yields (row_number, record) from a CSV or NDJSON body without buffering it.
+
+    `record` is a dict, or None when the line itself could not be parsed.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        # Row 1 is the header, so data rows are numbered from 2 like in a spreadsheet.
+        for row_number, record in enumerate(csv.DictReader(text), start=2):
+            yield row_number, record
+        return
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield row_number, record if isinstance(record, dict) else None
+
+def validate_import_record(record):
+    """Returns (name, category, quantity) for a valid record, or an error message."""
+    if record is None:
+        return "Row is not a valid JSON object."
+    name = record.get('name') or ''
+    category = record.get('category') or ''
+    quantity = record.get('totalQuantity', record.get('total_quantity'))
+    if not isinstance(name, str) or not isinstance(category, str):
+        return "Name and category must be text."
+    name, category = name.strip(), category.strip()
+    if not name or len(name) > 255:
+        return "Name is required and must be at most 255 characters."
+    if not category or len(category) > 100:
+        return "Category is required and must be at most 100 characters."
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return "Total quantity must be a whole number."
+    if quantity < 0:
+        return "Total quantity cannot be negative."
+    return name, category, quantity
+
+def import_item_chunk(chunk):
+    """Upserts one chunk of (name, category, quantity) rows on (name, category).
+
+    Quantities for an existing item, or repeated within the chunk, are added to
+    it. Returns (inserted, merged) counts.
+    """
+    merged_rows = {}
+    for name, category, quantity in chunk:
+        key = (name, category)
+        merged_rows[key] = merged_rows.get(key, 0) + quantity
+
+    version = next_row_version(db.session)
+    existing = {(name, category): item_id for name, category, item_id in db.session.execute(
+        db.select(Item.name, Item.category, Item.id)
+        .where(db.tuple_(Item.name, Item.category).in_(list(merged_rows)))
+    )}
+
+    updates = [{'b_id': existing[key], 'b_quantity': quantity}
+               for key, quantity in merged_rows.items() if key in existing]
+    inserts = [{'name': name, 'category': category, 'total_quantity': quantity,
+                'available_quantity': quantity, 'row_version': version}
+               for (name, category), quantity in merged_rows.items() if (name, category) not in existing]
+    if updates:
+        db.session.execute(
+            db.update(Item.__table__).where(Item.__table__.c.id == db.bindparam('b_id')).values(
+                total_quantity=Item.__table__.c.total_quantity + db.bindparam('b_quantity'),
+                available_quantity=Item.__table__.c.available_quantity + db.bindparam('b_quantity'),
+                row_version=version),
+            updates)
+    if inserts:
+        db.session.execute(db.insert(Item.__table__), inserts)
+    db.session.commit()
+    return len(inserts), len(updates)
+
+# --- Bulk Roster Enrollment ---
+# Each row's password is hashed before the insert (~0.25 s of CPU at the default
+# cost, spread over PASSWORD_HASH_WORKERS): keep a roster to what one request can hash.
+MAX_ROSTER_SIZE = 100
+ROSTER_INSERT_CHUNK_SIZE = 500
+ROSTER_FIELD_LIMITS = {'username': 80, 'fullName': 120, 'email': 120, 'lrn': 12, 'gradeLevel': 50, 'section': 50}
+
+def validate_roster_record(record):
+    """Returns a cleaned roster entry, or an error message."""
+    if not isinstance(record, dict):
+        return "Row is not a valid object."
+    entry = {key: (str(record.get(key) or '')).strip() for key in ROSTER_FIELD_LIMITS}
+    for key in ('username', 'fullName', 'email'):
+        if not entry[key]:
+            return f"'{key}' is required."
+    for key, limit in ROSTER_FIELD_LIMITS.items():
+        if len(entry[key]) > limit:
+            return f"'{key}' must be at most {limit} characters."
+    password = record.get('password')
+    if not password:
+        return "'password' is required."
+    entry['password'] = str(password)
+    return entry
+
+def find_roster_conflicts(entries):
+    """Returns the usernames, emails and LRNs (lowercased where case-insensitive) already taken.
+
+    One set-based query per column, each served by its index.
+    """
+    usernames = {e['username'].lower() for e in entries}
+    emails = {e['email'].lower() for e in entries}
+    lrns = {e['lrn'] for e in entries if e['lrn']}
+    taken_usernames = set(db.session.execute(
+        db.select(db.func.lower(User.username)).where(db.func.lower(User.username).in_(usernames))).scalars())
+    taken_emails = set(db.session.execute(
+        db.select(db.func.lower(User.email)).where(db.func.lower(User.email).in_(emails))).scalars())
+    taken_lrns = set(db.session.execute(
+        db.select(User.lrn).where(User.lrn.in_(lrns))).scalars()) if lrns else set()
+    return taken_usernames, taken_emails, taken_lrns
+
+def split_roster(entries):
+    """Splits validated roster entries into those that can be created and per-row conflict errors."""
+    taken_usernames, taken_emails, taken_lrns = find_roster_conflicts(entries) if entries else (set(), set(), set())
+    accepted, errors = [], []
+    for entry in entries:
+        # Each accepted row claims its keys, so later duplicates in the roster conflict too.
+        if entry['username'].lower() in taken_usernames:
+            errors.append({"row": entry['row'], "field": "username", "error": "Username is already taken."})
+        elif entry['email'].lower() in taken_emails:
+            errors.append({"row": entry['row'], "field": "email", "error": "Email is already registered."})
+        elif entry['lrn'] and entry['lrn'] in taken_lrns:
+            errors.append({"row": entry['row'], "field": "lrn", "error": "LRN is already registered."})
+        else:
+            taken_usernames.add(entry['username'].lower())
+            taken_emails.add(entry['email'].lower())
+            if entry['lrn']:
+                taken_lrns.add(entry['lrn'])
+            accepted.append(entry)
+    return accepted, errors
+
+# --- Report Analytics ---
+LOW_STOCK_PERCENT = 20
+REPORT_LOW_STOCK_LIMIT = 20
+REPORT_RECENT_ACTIVITY_LIMIT = 5
+REPORT_MOST_ACTIVE_LIMIT = 3
+REPORT_ACTION_LABELS = {LogActionEnum.BORROW: 'Borrowed', LogActionEnum.RETURN: 'Returned'}
+REPORT_UNKNOWN_USER = 'Unknown User'
+
+def build_report_summary():
+    """Computes every figure in the lab status report with SQL aggregates.
+
+    The result is small and fixed-size regardless of how much history exists.
+    """
+    totals = db.session.execute(db.select(
+        db.func.count(Item.id),
+        db.func.coalesce(db.func.sum(Item.total_quantity), 0),
+        db.func.coalesce(db.func.sum(Item.available_quantity), 0),
+    )).one()
+    log_counts = dict(db.session.execute(
+        db.select(Log.status, db.func.count(Log.id)).where(Log.action == LogActionEnum.BORROW).group_by(Log.status)
+    ).all())
+    user_counts = dict(db.session.execute(db.select(User.status, db.func.count(User.id)).group_by(User.status)).all())
+
+    # available < LOW_STOCK_PERCENT% of total, compared in integers.
+    low_stock_filter = db.and_(Item.total_quantity > 0,
+                               Item.available_quantity * 100 < Item.total_quantity * LOW_STOCK_PERCENT)
+    low_stock = db.session.execute(
+        db.select(Item.name, Item.available_quantity, Item.total_quantity).where(low_stock_filter)
+        .order_by((Item.available_quantity * 1.0 / Item.total_quantity), Item.name).limit(REPORT_LOW_STOCK_LIMIT)
+    ).all()
+    low_stock_count = db.session.execute(db.select(db.func.count(Item.id)).where(low_stock_filter)).scalar()
+    recent = db.session.execute(
+        # Outer join: the logs of deleted users (user_id NULL) still count as activity.
+        db.select(Item.name, db.func.coalesce(User.full_name, REPORT_UNKNOWN_USER), Log.action, Log.quantity)
+        .join(Item, Log.item_id == Item.id).outerjoin(User, Log.user_id == User.id)
+        .order_by(Log.timestamp.desc(), Log.id.desc()).limit(REPORT_RECENT_ACTIVITY_LIMIT)
+    ).all()
+    borrow_count = db.func.count(Log.id).label('borrow_count')
+    most_active = db.session.execute(
+        db.select(Item.name, borrow_count).join(Item, Log.item_id == Item.id)
+        .where(Log.action == LogActionEnum.BORROW).group_by(Item.id, Item.name)
+        .order_by(borrow_count.desc(), Item.name).limit(REPORT_MOST_ACTIVE_LIMIT)
+    ).all()
+
     return {
-        "id": str(uuid.uuid4()),
-        "message": message,
-        "type": type,
-        "read": False,
-        "timestamp": db.func.now().isoformat(),
-        "relatedLogId": related_id
+        "itemCount": totals[0], "totalUnits": int(totals[1]), "availableUnits": int(totals[2]),
+        "activeLoans": log_counts.get(LogStatusEnum.APPROVED, 0),
+        "pendingRequests": log_counts.get(LogStatusEnum.PENDING, 0),
+        "approvedUsers": user_counts.get(UserStatusEnum.APPROVED, 0),
+        "pendingUsers": user_counts.get(UserStatusEnum.PENDING, 0),
+        "lowStockCount": low_stock_count,
+        "lowStockItems": [{"name": n, "available": a, "total": t} for n, a, t in low_stock],
+        "recentActivity": [{"itemName": i, "userName": u, "action": REPORT_ACTION_LABELS[a], "quantity": q}
+                           for i, u, a, q in recent],
+        "mostActiveItems": [{"name": n, "borrowCount": c} for n, c in most_active],
     }
 
-# --- Application Factory ---
-def create_app():
-    app = Flask(__name__)
-    CORS(app, resources={r"/api/*": {"origins": "*"}}) # Allow all origins for simplicity
+def report_from_summary(summary, overview, conclusion):
+    """Shapes a summary plus the narrative text into the InventoryReport the frontend expects."""
+    return {
+        "overview": overview,
+        "lowStockItems": summary["lowStockItems"],
+        "recentActivity": summary["recentActivity"],
+        "mostActiveItems": summary["mostActiveItems"],
+        "conclusion": conclusion,
+    }
 
-    # Configure database
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    db.init_app(app)
-    bcrypt.init_app(app)
+def basic_report(summary):
+    """Deterministic report with templated text, for when the AI is not wanted or available."""
+    overview = (
+        f"The lab tracks {summary['itemCount']} items with {summary['availableUnits']} of "
+        f"{summary['totalUnits']} units currently available. There are {summary['activeLoans']} active loans "
+        f"and {summary['pendingRequests']} borrow requests awaiting approval."
+    )
+    actions = []
+    if summary['lowStockCount']:
+        names = ', '.join(item['name'] for item in summary['lowStockItems'][:3])
+        actions.append(f"{summary['lowStockCount']} items are below {LOW_STOCK_PERCENT}% availability (starting with {names}); "
+                       f"consider restocking or following up on their loans.")
+    if summary['pendingRequests']:
+        actions.append(f"Review the {summary['pendingRequests']} pending borrow requests.")
+    if summary['pendingUsers']:
+        actions.append(f"Approve or deny the {summary['pendingUsers']} pending user registrations.")
+    conclusion = ' '.join(actions) or "Stock levels are healthy and there is nothing awaiting review."
+    return report_from_summary(summary, overview, conclusion)
+
+# --- Report Jobs ---
+REPORT_JOB_RETENTION = timedelta(days=1)
+MAX_REPORT_WAIT_SECONDS = 30
+# A wait here holds a server thread; asgi.py waits on its event loop and allows the longer one.
+MAX_THREADED_REPORT_WAIT_SECONDS = 2
+REPORT_POLL_INTERVAL = 0.25
+
+def report_cache_key(mode, writer):
+    """Keys a report on everything it depends on, including the current data version."""
+    raw = f"{mode}:{writer.name}:{current_row_version(db.session)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def run_report_job(app, job_id):
+    """Builds a report on a pool thread and stores the outcome on its job row."""
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        job.status = ReportJobStatusEnum.RUNNING
+        db.session.commit()
+        try:
+            summary = build_report_summary()
+            if job.mode == 'basic':
+                report = basic_report(summary)
+            else:
+                writer = app.extensions['report_writer']
+                started = time.perf_counter()
+                try:
+                    overview, conclusion = writer.write(summary)
+                except Exception:
+                    metrics.observe_external(writer.name, time.perf_counter() - started, ok=False)
+                    raise
+                metrics.observe_external(writer.name, time.perf_counter() - started)
+                report = report_from_summary(summary, overview, conclusion)
+            job.result = json.dumps(report)
+            job.status = ReportJobStatusEnum.DONE
+        except Exception as e:
+            print(f"Report job {job_id} failed: {e}")
+            db.session.rollback()
+            job = db.session.get(ReportJob, job_id)
+            job.status = ReportJobStatusEnum.FAILED
+            job.error = "Failed to generate report from AI service."
+        db.session.commit()
+
+# --- Keyset Pagination Helpers ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(values):
+    """Packs the sort key of the last row on a page into an opaque token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, types):
+    """Unpacks a cursor token into sort key values, converting each with `types`."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return [convert(v) for convert, v in zip(types, values)]
+    except (ValueError, TypeError):
+        abort(400, "Invalid pagination cursor.")
+
+def parse_datetime_arg(name):
+    """Reads an optional ISO 8601 date/datetime query parameter."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f"Invalid '{name}' date.")
+
+def parse_date_arg(name):
+    """Reads an optional ISO 8601 date query parameter as a date."""
+    value = parse_datetime_arg(name)
+    return value.date() if value else None
+
+def parse_enum_arg(name, enum_cls):
+    """Reads an optional enum query parameter by value."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return enum_cls(value)
+    except ValueError:
+        abort(400, f"Invalid '{name}' value.")
+
+def parse_uuid_arg(name):
+    """Reads an optional UUID query parameter."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        abort(400, f"Invalid '{name}' value.")
+
+def keyset_statement(query, serializer, sort_columns, sort_types, descending=False):
+    """Builds the select for one page of `query` ordered by `sort_columns`, seeking past `?cursor=`.
+
+    Returns it with the page size; it fetches one extra row to tell whether
+    another page follows. The last sort column must be unique (the primary key)
+    so the order is total. Seeking with a row-value comparison lets the
+    matching composite index jump straight to the page, so deep pages cost the
+    same as the first one.
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400, "Invalid 'limit' value.")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    token = request.args.get('cursor')
+    if token:
+        after = decode_cursor(token, sort_types)
+        key = db.tuple_(*sort_columns)
+        bound = db.tuple_(*[db.literal(v, c.type) for c, v in zip(sort_columns, after)])
+        query = query.filter(key < bound if descending else key > bound)
+
+    order = [c.desc() for c in sort_columns] if descending else list(sort_columns)
+    return query.with_only_columns(*serializer.columns).order_by(*order).limit(limit + 1), limit
+
+def keyset_response(rows, serializer, sort_columns, limit):
+    """Serializes a page fetched with keyset_statement(), with the cursor for the next one."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor([last[serializer.index(c)] for c in sort_columns])
+    return jsonify({"data": serializer.rows(rows), "nextCursor": next_cursor})
+
+def keyset_page(query, serializer, sort_columns, sort_types, descending=False):
+    """Returns one page of the select `query` (see keyset_statement)."""
+    stmt, limit = keyset_statement(query, serializer, sort_columns, sort_types, descending)
+    return keyset_response(db.session.execute(stmt).all(), serializer, sort_columns, limit)
+
+# The list pages the ASGI server also serves natively; each returns keyset_page()'s arguments.
+def items_page():
+    """Items by name. Filter: category."""
+    query = db.select(Item)
+    if request.args.get('category'):
+        query = query.filter(Item.category == request.args['category'])
+    return query, ITEM_ROW, (Item.name, Item.id), (str, uuid.UUID)
+
+def logs_page():
+    """Logs newest first. Filters: status, action, userId, itemId, from, to (ISO dates)."""
+    return filter_logs(db.select(Log)), LOG_ROW, (Log.timestamp, Log.id), (datetime.fromisoformat, uuid.UUID), True
+
+def filter_logs(query, model=Log):
+    """Applies the log filters of the request's query string to a select over `model` (Log or ArchivedLog)."""
+    status = parse_enum_arg('status', LogStatusEnum)
+    if status:
+        query = query.filter(model.status == status)
+    action = parse_enum_arg('action', LogActionEnum)
+    if action:
+        query = query.filter(model.action == action)
+    user_id = parse_uuid_arg('userId')
+    if user_id:
+        query = query.filter(model.user_id == user_id)
+    item_id = parse_uuid_arg('itemId')
+    if item_id:
+        query = query.filter(model.item_id == item_id)
+    start, end = parse_datetime_arg('from'), parse_datetime_arg('to')
+    if start:
+        query = query.filter(model.timestamp >= start)
+    if end:
+        query = query.filter(model.timestamp <= end)
+    return query
+
+# --- Streaming Helpers ---
+STREAM_BATCH_SIZE = 1000
+
+def stream_batches(stmt):
+    """Yields the rows of `stmt` in batches of plain tuples, read through a server-side cursor."""
+    result = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    yield from result.partitions()
+
+def stream_rows(serializer, stmt):
+    """Yields serialized rows of `stmt` in batches, read through a server-side cursor."""
+    for batch in stream_batches(stmt):
+        yield serializer.rows(batch)
+
+def wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def streamed_response(fields):
+    """Streams `fields` as one JSON object, or as NDJSON if the client asked for it."""
+    if wants_ndjson():
+        return Response(stream_with_context(iter_ndjson(fields)), mimetype='application/x-ndjson')
+    return Response(stream_with_context(iter_json_object(fields)), mimetype='application/json')
+
+# --- Spreadsheet Exports ---
+# Each export's columns as (header, column) pairs, with user and item names
+# joined in so the sheet reads on its own.
+ITEM_EXPORT = [
+    ('Name', Item.name), ('Category', Item.category), ('Total Quantity', Item.total_quantity),
+    ('Available Quantity', Item.available_quantity),
+    ('On Loan', (Item.total_quantity - Item.available_quantity).label('on_loan')),
+    ('Added (UTC)', Item.created_at), ('Item ID', Item.id),
+]
+USER_EXPORT = [
+    ('Full Name', User.full_name), ('Username', User.username), ('Email', User.email), ('LRN', User.lrn),
+    ('Grade Level', User.grade_level), ('Section', User.section), ('Role', User.role), ('Status', User.status),
+    ('Admin', User.is_admin), ('Joined (UTC)', User.created_at), ('User ID', User.id),
+]
+LOG_EXPORT = [
+    ('Timestamp (UTC)', Log.timestamp), ('Borrower', User.full_name), ('Username', User.username),
+    ('LRN', User.lrn), ('Item', Item.name), ('Category', Item.category), ('Quantity', Log.quantity),
+    ('Action', Log.action), ('Status', Log.status), ('Return Requested', Log.return_requested),
+    ('Admin Notes', Log.admin_notes), ('Log ID', Log.id), ('Related Log ID', Log.related_log_id),
+]
+EXPORT_FORMATS = {'csv': (iter_csv, CSV_MIMETYPE), 'xlsx': (iter_xlsx, XLSX_MIMETYPE)}
+
+def export_select(fields):
+    return db.select(*[column for _, column in fields])
+
+def filter_created(query, column):
+    """Applies the `from`/`to` query parameters (ISO dates) to a creation timestamp."""
+    start, end = parse_datetime_arg('from'), parse_datetime_arg('to')
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column <= end)
+    return query
+
+def export_response(name, fields, stmt):
+    """Streams `stmt` as a CSV (default) or `?format=xlsx` download, one cursor batch at a time."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS: abort(400, "Invalid 'format' value.")
+    write, mimetype = EXPORT_FORMATS[fmt]
+    headers = [header for header, _ in fields]
+    filename = f"olilab_{name}_{datetime.now(timezone.utc):%Y-%m-%d}.{fmt}"
+    return Response(stream_with_context(write(headers, stream_batches(stmt))), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                             "Cache-Control": "no-store"})
+
+# --- Notifications & Live Events ---
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 5000
+
+def admin_ids():
+    return db.session.execute(
+        db.select(User.id).where(User.is_admin.is_(True), User.status == UserStatusEnum.APPROVED)
+    ).scalars().all()
+
+def notify_borrower(log, item, action):
+    message, type = LOG_ACTION_NOTICES[action]
+    notify([log.user_id] if log.user_id else [], message.format(item=item.name), type, log.id)
+
+def notify(recipient_ids, message, type, related_log_id=None):
+    """Stores a notification for each recipient and pushes it once the transaction commits.
+
+    Returns the notification as the frontend shapes it, for routes that still
+    echo it back in their response.
+    """
+    now = datetime.now(timezone.utc)
+    notifications = [
+        Notification(id=uuid.uuid4(), user_id=user_id, message=message, type=type, read=False,
+                     timestamp=now, related_log_id=related_log_id)
+        for user_id in recipient_ids
+    ]
+    db.session.add_all(notifications)
+    for notification in notifications:
+        publish_after_commit({"userId": str(notification.user_id), "event": "notification",
+                              "data": notification.to_dict()})
+    if notifications:
+        return notifications[0].to_dict()
+    return Notification(id=uuid.uuid4(), message=message, type=type, read=False, timestamp=now,
+                        related_log_id=related_log_id).to_dict()
+
+def publish_after_commit(payload):
+    """Queues a live event that is only sent if the current transaction commits."""
+    if current_app.config['EVENTS_VIA_NOTIFY']:
+        # NOTIFY is transactional: Postgres delivers it to every worker on commit.
+        db.session.execute(db.select(db.func.pg_notify(EVENT_CHANNEL, dumps(payload).decode('utf-8'))))
+    else:
+        db.session.info.setdefault('pending_events', []).append(payload)
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_pending_events(session):
+    if session.in_nested_transaction():
+        return  # a savepoint was released; wait for the transaction around it
+    payloads = session.info.pop('pending_events', None)
+    if payloads and has_app_context():
+        broadcaster = current_app.extensions['events']
+        for payload in payloads:
+            broadcaster.publish(payload)
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _drop_pending_events(session, transaction):
+    # Runs after after_commit, so anything left here was rolled back or discarded.
+    if transaction.parent is None:
+        session.info.pop('pending_events', None)
+
+def unread_count_query(user_id):
+    return (db.select(db.func.count()).select_from(Notification)
+            .where(Notification.user_id == user_id, Notification.read.is_(False)))
+
+def unread_notification_count(user_id):
+    return db.session.execute(unread_count_query(user_id)).scalar()
+
+def listen_for_events():
+    """Starts this process's LISTEN relay the first time a client connects, when events go through Postgres."""
+    if current_app.config['EVENTS_VIA_NOTIFY']:
+        current_app.extensions['events'].listen(current_app.extensions.get('events_engine') or db.engine)
+
+# --- Search ---
+# Indexed fields and their weights; a match in a name outranks one in a category.
+SEARCH_FIELDS = {
+    'items': (Item, ((Item.name, 1.0), (Item.category, 0.5))),
+    'users': (User, ((User.full_name, 1.0), (User.username, 0.9), (User.lrn, 0.9), (User.section, 0.4))),
+}
+SEARCH_SERIALIZERS = {'items': ITEM_ROW, 'users': USER_ROW}
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+def refresh_search_index(index):
+    """Brings the in-process search index up to the latest committed change.
+
+    The first call loads every item and user. Later calls only read rows whose
+    row_version moved and the tombstones since then, so another worker's
+    writes show up on the next search. When nothing has changed, it costs
+    one primary-key read.
+    """
+    version = current_row_version(db.session)
+    if index.version == version:
+        return
+    with index.lock:
+        since = index.version
+        if since == version:
+            return # Another thread caught up while we waited.
+        for kind, (model, fields) in SEARCH_FIELDS.items():
+            weights = [weight for _, weight in fields]
+            stmt = db.select(model.id, *[column for column, _ in fields])
+            if since is not None:
+                stmt = stmt.where(model.row_version > since)
+            rows = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+            index.add_many(((kind, row[0]), zip(row[1:], weights)) for row in rows)
+        if since is not None:
+            for entity, entity_id in db.session.execute(
+                db.select(Tombstone.entity, Tombstone.entity_id)
+                .where(Tombstone.row_version > since, Tombstone.entity.in_(SEARCH_FIELDS))
+            ):
+                index.remove((entity, entity_id))
+        index.version = version
+
+_search_warmup_lock = threading.Lock()
+
+def warm_search_index(app):
+    """Starts building the app's search index in a background thread.
+
+    Gunicorn calls this as each worker starts (post_worker_init), asgi.py at
+    startup, and otherwise the first search does. Until the build finishes,
+    searches answer `warming: true` with no hits. Returns the thread, or None
+    when the index is built or already building.
+    """
+    index = app.extensions['search']
+    with _search_warmup_lock:
+        warmer = app.extensions.get('search_warmer')
+        if index.version is not None or (warmer is not None and warmer.is_alive()):
+            return None
+        def build():
+            with app.app_context():
+                try:
+                    refresh_search_index(index)
+                except Exception:
+                    # The next search starts another attempt.
+                    app.logger.exception("Building the search index failed.")
+        warmer = app.extensions['search_warmer'] = threading.Thread(
+            target=build, name='search-warmup', daemon=True)
+        warmer.start()
+        return warmer
+
+# --- Read Cache ---
+# Single-row lookups for these models go through the read cache. The namespaces
+# match the tombstone entity names so deletes invalidate the same keys. Logs are
+# left out: nearly every log lookup comes right before a write that invalidates it.
+CACHED_MODELS = {Item: 'items', User: 'users'}
+# More changes than this since the last sync just empty the cache.
+MAX_CACHE_DELTA = 1000
+
+def read_cache_changes(cache, since):
+    """Lists the cache keys changed after `since`, or None to drop everything."""
+    if since is None or not len(cache):
+        return None
+    changed_rows = db.union_all(
+        *[db.select(db.literal(entity).label('entity'), model.id.label('id')).where(model.row_version > since)
+          for model, entity in CACHED_MODELS.items()],
+        db.select(Tombstone.entity, Tombstone.entity_id)
+        .where(Tombstone.row_version > since, Tombstone.entity.in_(CACHED_MODELS.values())),
+    ).limit(MAX_CACHE_DELTA + 1)
+    changed = db.session.execute(changed_rows).all()
+    if len(changed) > MAX_CACHE_DELTA:
+        return None
+    sections = {('data', entity) for entity, _ in changed}
+    return [*changed, *sections]
+
+def read_cache_version():
+    """Brings the read cache up to this transaction's change version and returns it.
+
+    Checked once per transaction; when another worker has written since, only
+    the changed keys are dropped. Returns None when the cache must be
+    bypassed: it is switched off, or this session has written and has to see
+    its own changes.
+    """
+    cache = current_app.extensions['read_cache']
+    session = db.session
+    if not cache.enabled or session.info.get('read_cache_bypass'):
+        return None
+    version = session.info.get('read_cache_version')
+    if version is None:
+        version = session.info['read_cache_version'] = current_row_version(session)
+    if cache.version is None or cache.version < version:
+        with cache.advance_lock:
+            since = cache.version
+            if since is None or since < version: # Another thread may have caught up while we waited.
+                cache.advance(version, read_cache_changes(cache, since))
+    return version
+
+def cached_get(model, id):
+    """db.session.get() through the read cache.
+
+    A hit is attached to the session as if it had just been loaded, so routes
+    can change or delete it as usual.
+    """
+    identity = db.session.identity_key(model, id)
+    if identity in db.session.identity_map:
+        return db.session.identity_map[identity]
+    version = read_cache_version()
+    if version is None:
+        return db.session.get(model, id)
+    cache, entity = current_app.extensions['read_cache'], CACHED_MODELS[model]
+    values = cache.get(entity, id)
+    if values is MISSING:
+        obj = db.session.get(model, id)
+        if obj is not None:
+            cache.put(entity, id, {attr.key: getattr(obj, attr.key) for attr in db.inspect(model).column_attrs},
+                      version)
+        return obj
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    db.session.add(obj)
+    return obj
+
+def cached_stream_rows(section, serializer, stmt):
+    """stream_rows() for a whole-table /api/data section, through the read cache.
+
+    Sections over READ_CACHE_SECTION_MAX_ROWS rows are not kept, so a large
+    catalog is streamed from the database each time instead of held in every
+    worker's memory.
+    """
+    version = read_cache_version()
+    cache = current_app.extensions['read_cache']
+    if version is not None:
+        batches = cache.get('data', section)
+        if batches is not MISSING:
+            yield from batches
+            return
+    max_rows = current_app.config['READ_CACHE_SECTION_MAX_ROWS']
+    batches, rows = [], 0
+    for batch in stream_rows(serializer, stmt):
+        if batches is not None:
+            rows += len(batch)
+            if rows <= max_rows:
+                batches.append(batch)
+            else:
+                batches = None  # Too large to keep; let go of what was collected.
+        yield batch
+    if version is not None and batches is not None:
+        cache.put('data', section, batches, version)
+
+@event.listens_for(db.session, 'after_flush')
+def _bypass_read_cache_after_flush(session, flush_context):
+    session.info['read_cache_bypass'] = True
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _bypass_read_cache_after_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['read_cache_bypass'] = True
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _reset_read_cache_state(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('read_cache_bypass', None)
+        session.info.pop('read_cache_version', None)
+
+# --- Batched Operations ---
+# /api/batch runs several requests through their own route handlers in one
+# transaction: one round trip and one commit instead of one per action.
+MAX_BATCH_OPERATIONS = 100
+# The JSON write routes of the admin and borrowing workflows. Streaming,
+# import and login routes keep their own requests.
+BATCH_ENDPOINTS = {
+    'items.add_item', 'items.edit_item', 'items.delete_item',
+    'users.create_user', 'users.edit_user', 'users.delete_user', 'users.approve_user', 'users.deny_user',
+    'logs.request_borrow', 'logs.approve_borrow', 'logs.deny_borrow', 'logs.request_return', 'logs.return_item',
+    'logs.bulk_update_logs',
+    'suggestions.add_suggestion', 'suggestions.approve_item_suggestion', 'suggestions.approve_feature_suggestion',
+    'suggestions.deny_suggestion', 'suggestions.add_comment',
+    'notifications.mark_notifications_read',
+}
+
+def batch_error_response(error):
+    """The response the app's error handlers give for `error`, always with a JSON message."""
+    try:
+        rv = current_app.handle_user_exception(error)
+    except Exception:
+        current_app.log_exception(sys.exc_info())
+        rv = internal_server_error(error)
+    response = current_app.make_response(rv)
+    if not response.is_json:  # a status without a handler here, e.g. 405
+        response = current_app.make_response(
+            (jsonify({"message": getattr(error, 'description', None) or response.status}), response.status_code))
+    return response
+
+def run_batch_operation(operation):
+    """Runs one {method, path, body} operation through its route inside a savepoint.
+
+    Returns (status, JSON body). A failed operation is rolled back to its
+    savepoint, along with the live events it queued.
+    """
+    if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+        return 400, {"message": "Each operation needs a path."}
+    session = db.session()
+    events = len(session.info.get('pending_events', ()))
+    savepoint = session.info['batch_savepoint'] = session.begin_nested()
+    try:
+        with current_app.test_request_context(operation['path'], method=str(operation.get('method', 'POST')).upper(),
+                                              json=operation.get('body')):
+            try:
+                if request.routing_exception:
+                    raise request.routing_exception
+                if request.url_rule.endpoint not in BATCH_ENDPOINTS:
+                    abort(400, "This route cannot be part of a batch.")
+                view = current_app.view_functions[request.url_rule.endpoint]
+                response = current_app.make_response(view(**request.view_args))
+            except Exception as error:
+                response = batch_error_response(error)
+    finally:
+        del session.info['batch_savepoint']
+    succeeded = response.status_code < 400
+    if savepoint.is_active:
+        if succeeded:
+            savepoint.commit()
+        else:
+            savepoint.rollback()
+        session.expire_all()
+    if not succeeded:
+        del session.info.get('pending_events', [])[events:]
+    return response.status_code, response.get_json()
+
+# --- Blueprints ---
+# Routes are registered on these once, when the module is imported; create_app()
+# only mounts them, so building an app (or one per test) does no route setup.
+errors_bp = Blueprint('errors', __name__)
+auth_bp = Blueprint('auth', __name__)
+data_bp = Blueprint('data', __name__)
+items_bp = Blueprint('items', __name__)
+users_bp = Blueprint('users', __name__)
+logs_bp = Blueprint('logs', __name__)
+suggestions_bp = Blueprint('suggestions', __name__)
+search_bp = Blueprint('search', __name__)
+notifications_bp = Blueprint('notifications', __name__)
+reports_bp = Blueprint('reports', __name__)
+exports_bp = Blueprint('exports', __name__)
+usage_bp = Blueprint('usage', __name__)
+batch_bp = Blueprint('batch', __name__)
+BLUEPRINTS = (errors_bp, auth_bp, data_bp, items_bp, users_bp, logs_bp, suggestions_bp, search_bp,
+              notifications_bp, reports_bp, exports_bp, usage_bp, batch_bp)
+
+# --- Error Handlers ---
+@errors_bp.app_errorhandler(400)
+def bad_request(error): return jsonify({"message": error.description or "Bad request"}), 400
+@errors_bp.app_errorhandler(401)
+def unauthorized(error): return jsonify({"message": error.description or "Unauthorized"}), 401
+@errors_bp.app_errorhandler(403)
+def forbidden(error): return jsonify({"message": error.description or "Forbidden"}), 403
+@errors_bp.app_errorhandler(404)
+def not_found(error): return jsonify({"message": "Resource not found"}), 404
+@errors_bp.app_errorhandler(409)
+def conflict(error): return jsonify({"message": error.description or "Conflict"}), 409
+@errors_bp.app_errorhandler(503)
+def service_unavailable(error): return jsonify({"message": error.description or "Service unavailable"}), 503
+@errors_bp.app_errorhandler(500)
+def internal_server_error(error):
+    db.session.rollback()
+    return jsonify({"message": "An unexpected server error occurred."}), 500
+@errors_bp.app_errorhandler(OperationalError)
+def database_error(error):
+    db.session.rollback()
+    if is_busy_error(error):
+        # SQLite: another worker held the write lock past the busy timeout.
+        return jsonify({"message": "The server is busy. Please try again in a moment."}), 503
+    current_app.log_exception((type(error), error, error.__traceback__))
+    return jsonify({"message": "An unexpected server error occurred."}), 500
+@errors_bp.app_errorhandler(PoolTimeoutError)
+def database_pool_exhausted(error):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT; the monitor has logged it.
+    return jsonify({"message": "The server is busy. Please try again in a moment."}), 503
+
+# --- API Routes ---
+
+@auth_bp.route('/api/auth/login', methods=['POST'])
+def login():
+    data = request.get_json()
+    if not data: abort(400, "Missing request body.")
+    identifier = data.get('identifier', '').lower()
+    password = data.get('password', '')
+    
+    user = db.session.execute(login_user_query(identifier)).scalar()
+
+    try:
+        if not user or not passwords.check(user.password_hash, password):
+            abort(401, "Invalid credentials.")
+        if user.status != UserStatusEnum.APPROVED:
+            abort(403, "Your account has not been approved by an administrator.")
+        # Upgrade hashes made with an older cost factor while we have the password.
+        if passwords.needs_rehash(user.password_hash):
+            user.password_hash = passwords.hash(password)
+            db.session.commit()
+    except PasswordHasherBusy:
+        abort(503, "The server is busy. Please try again in a moment.")
+        
+    return jsonify(user.to_dict())
+
+@data_bp.route('/api/data', methods=['GET'])
+def get_initial_data():
+    """Fetch all initial data for the application state.
+
+    With `?since=<cursor>`, only rows changed after that cursor are returned,
+    along with the ids of rows deleted since then. Every response carries a
+    new `cursor` to pass on the next call.
+
+    The response is streamed in batches straight from a server-side cursor,
+    so memory stays flat regardless of table size. `?format=ndjson` (or
+    `Accept: application/x-ndjson`) streams one JSON line per row instead.
+    """
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            abort(400, "Invalid sync cursor.")
+        if since < 0:
+            abort(400, "Invalid sync cursor.")
+
+    # Read the cursor first: anything committed after this point is either
+    # included below or picked up by the next sync, never lost.
+    cursor = current_row_version(db.session)
+
+    def rows(serializer, model, order, section=None):
+        stmt = db.select(*serializer.columns).order_by(order)
+        if since is not None:
+            stmt = stmt.where(model.row_version > since)
+        elif section is not None:
+            # The catalog and user list rarely change; full loads come from the read cache.
+            return RowStream(cached_stream_rows(section, serializer, stmt))
+        return RowStream(stream_rows(serializer, stmt))
+
+    fields = [
+        ("items", rows(ITEM_ROW, Item, Item.name, 'items')),
+        ("users", rows(USER_ROW, User, User.full_name, 'users')),
+        ("logs", rows(LOG_ROW, Log, Log.timestamp.desc())),
+        ("suggestions", rows(SUGGESTION_ROW, Suggestion, Suggestion.timestamp.desc())),
+        ("comments", rows(COMMENT_ROW, Comment, Comment.timestamp.asc())),
+        ("notifications", []), # Per-user; clients load them from /api/notifications
+        ("cursor", str(cursor))
+    ]
+    if since is not None:
+        deleted = {key: [] for key in SYNCED_MODELS.values()}
+        for entity, entity_id in db.session.execute(
+            db.select(Tombstone.entity, Tombstone.entity_id).where(Tombstone.row_version > since)
+        ):
+            deleted[entity].append(str(entity_id))
+        fields.append(("deleted", deleted))
+    return streamed_response(fields)
+    
+# --- Items Routes ---
+@items_bp.route('/api/items', methods=['GET'])
+def list_items():
+    """Lists items by name, one keyset page at a time. Filter: category."""
+    return keyset_page(*items_page())
+
+@items_bp.route('/api/items', methods=['POST'])
+def add_item():
+    data = request.get_json()
+    new_item = Item(
+        name=data['name'], 
+        category=data['category'],
+        total_quantity=int(data['totalQuantity']),
+        available_quantity=int(data['totalQuantity'])
+    )
+    db.session.add(new_item)
+    db.session.commit()
+    return jsonify(new_item.to_dict()), 201
+    
+@items_bp.route('/api/items/<uuid:item_id>', methods=['PUT'])
+def edit_item(item_id):
+    item = cached_get(Item, item_id)
+    if not item: abort(404)
+    data = request.get_json()
+    total = int(data['totalQuantity'])
+
+    # Recompute availability in the UPDATE itself so a concurrent approval
+    # or return between our read and write is not lost.
+    borrowed = Item.total_quantity - Item.available_quantity
+    result = db.session.execute(
+        db.update(Item).where(Item.id == item_id, borrowed <= total)
+        .values(name=data['name'], category=data['category'], total_quantity=total,
+                available_quantity=total - borrowed, row_version=next_row_version(db.session))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        db.session.refresh(item)
+        borrowed_count = item.total_quantity - item.available_quantity
+        abort(400, f"Total quantity cannot be less than the amount currently borrowed ({borrowed_count}).")
+    db.session.commit()
+    return jsonify(item.to_dict())
+
+@items_bp.route('/api/items/<uuid:item_id>', methods=['DELETE'])
+def delete_item(item_id):
+    item = cached_get(Item, item_id)
+    if not item: abort(404)
+    # Prevent deletion if items are currently on loan
+    if item.available_quantity < item.total_quantity:
+        abort(409, "Cannot delete item with outstanding loans.")
+    db.session.delete(item)
+    db.session.commit()
+    return jsonify({"id": str(item_id)})
     
-    # Configure Gemini API
+@items_bp.route('/api/items/import', methods=['POST'])
+def import_items():
+    """Imports items from a JSON array, or streams a CSV/NDJSON body.
+
+    Streamed imports (Content-Type text/csv or application/x-ndjson) are
+    parsed row by row and bulk-inserted in chunks of `?chunkSize=` rows.
+    Rows matching an existing (name, category) add to its quantities,
+    and invalid rows are skipped and reported instead of failing the import.
+    """
+    if request.mimetype in ('text/csv', 'application/x-ndjson'):
+        return import_items_stream('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    items_data = request.get_json()
+    new_items = []
+    for item_data in items_data:
+        new_item = Item(
+            name=item_data['name'],
+            category=item_data['category'],
+            total_quantity=item_data['totalQuantity'],
+            available_quantity=item_data['totalQuantity']
+        )
+        new_items.append(new_item)
+    db.session.add_all(new_items)
+    db.session.commit()
+    return jsonify([item.to_dict() for item in new_items]), 201
+
+def import_items_stream(fmt):
+    try:
+        chunk_size = int(request.args.get('chunkSize', IMPORT_CHUNK_SIZE))
+    except ValueError:
+        abort(400, "Invalid 'chunkSize' value.")
+    chunk_size = max(1, min(chunk_size, MAX_IMPORT_CHUNK_SIZE))
+
+    report = {"inserted": 0, "merged": 0, "failed": 0, "errors": []}
+    chunk = []
+    def flush_chunk():
+        inserted, merged = import_item_chunk(chunk)
+        report["inserted"] += inserted
+        report["merged"] += merged
+        chunk.clear()
+
     try:
-        api_key = os.getenv("API_KEY")
-        if not api_key:
-            print("Warning: API_KEY environment variable not found. AI features will be disabled.")
+        for row_number, record in iter_import_records(request.stream, fmt):
+            row = validate_import_record(record)
+            if isinstance(row, str):
+                report["failed"] += 1
+                if len(report["errors"]) < MAX_IMPORT_ERRORS:
+                    report["errors"].append({"row": row_number, "error": row})
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush_chunk()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        abort(400, f"Could not parse the import file: {e}")
+    if chunk:
+        flush_chunk()
+    return jsonify(report)
+
+# --- Users Routes ---
+@users_bp.route('/api/users', methods=['GET'])
+def list_users():
+    """Lists users by full name, one keyset page at a time. Filter: status."""
+    query = db.select(User)
+    status = parse_enum_arg('status', UserStatusEnum)
+    if status:
+        query = query.filter(User.status == status)
+    return keyset_page(query, USER_ROW, (User.full_name, User.id), (str, uuid.UUID))
+
+@users_bp.route('/api/users', methods=['POST'])
+def create_user():
+    data = request.get_json()
+    # Check for uniqueness constraints
+    if User.query.filter(db.func.lower(User.username) == data['username'].lower()).first():
+        abort(409, "Username is already taken.")
+    if User.query.filter(db.func.lower(User.email) == data['email'].lower()).first():
+        abort(409, "Email is already registered.")
+    if data.get('lrn') and User.query.filter_by(lrn=data['lrn']).first():
+        abort(409, "LRN is already registered.")
+    
+    new_user = User(
+        username=data['username'],
+        full_name=data['fullName'],
+        email=data['email'],
+        password_hash=hash_password_or_503(data['password']),
+        lrn=data.get('lrn') or None,
+        grade_level=data.get('gradeLevel') or None,
+        section=data.get('section') or None,
+        is_admin=False, # Ensure new signups are not admins
+        role=UserRoleEnum.Member
+    )
+    db.session.add(new_user)
+    notification = notify(admin_ids(), f"New user '{new_user.full_name}' requires approval.", 'new_user')
+    db.session.commit()
+
+    return jsonify({"newUser": new_user.to_dict(), "newNotification": notification}), 201
+    
+@users_bp.route('/api/users/bulk', methods=['POST'])
+def bulk_create_users():
+    """Enrolls a class roster from a JSON list or a CSV body in one transaction.
+
+    Fields per row: username, fullName, email, password, lrn, gradeLevel,
+    section. JSON bodies may be a list or {"users": [...], "approve": true};
+    CSV bodies (text/csv) pass `?approve=true` instead. Approved rosters are
+    enrolled as APPROVED. Rows that are invalid or clash with existing
+    accounts (or each other) are skipped and reported by row number. If
+    another request registers a clashing account meanwhile, nothing is
+    created and the report comes back with a 409.
+    """
+    approve = request.args.get('approve', '').lower() == 'true'
+    if request.mimetype == 'text/csv':
+        try:
+            records = list(iter_import_records(request.stream, 'csv'))
+        except (UnicodeDecodeError, csv.Error) as e:
+            abort(400, f"Could not parse the roster file: {e}")
+    else:
+        data = request.get_json()
+        if isinstance(data, dict):
+            approve = approve or bool(data.get('approve'))
+            data = data.get('users')
+        if not isinstance(data, list): abort(400, "Expected a list of users.")
+        records = list(enumerate(data, start=1))
+    if len(records) > MAX_ROSTER_SIZE:
+        abort(400, f"At most {MAX_ROSTER_SIZE} users can be enrolled at once.")
+
+    errors, entries = [], []
+    for row_number, record in records:
+        entry = validate_roster_record(record)
+        if isinstance(entry, str):
+            errors.append({"row": row_number, "error": entry})
         else:
-            genai.configure(api_key=api_key)
-    except Exception as e:
-        print(f"Error configuring Gemini API: {e}")
+            entry['row'] = row_number
+            entries.append(entry)
 
-    with app.app_context():
-        # --- Error Handlers ---
-        @app.errorhandler(400)
-        def bad_request(error): return jsonify({"message": error.description or "Bad request"}), 400
-        @app.errorhandler(401)
-        def unauthorized(error): return jsonify({"message": error.description or "Unauthorized"}), 401
-        @app.errorhandler(403)
-        def forbidden(error): return jsonify({"message": error.description or "Forbidden"}), 403
-        @app.errorhandler(404)
-        def not_found(error): return jsonify({"message": "Resource not found"}), 404
-        @app.errorhandler(409)
-        def conflict(error): return jsonify({"message": error.description or "Conflict"}), 409
-        @app.errorhandler(500)
-        def internal_server_error(error):
+    accepted, conflicts = split_roster(entries)
+    errors.extend(conflicts)
+
+    created = []
+    if accepted:
+        try:
+            hashes = passwords.hash_many([entry['password'] for entry in accepted])
+        except PasswordHasherBusy:
+            abort(503, "The server is busy. Please try again in a moment.")
+        version = next_row_version(db.session)
+        status = UserStatusEnum.APPROVED if approve else UserStatusEnum.PENDING
+        rows = [{
+            'id': uuid.uuid4(), 'username': entry['username'], 'full_name': entry['fullName'],
+            'email': entry['email'], 'password_hash': password_hash, 'lrn': entry['lrn'] or None,
+            'grade_level': entry['gradeLevel'] or None, 'section': entry['section'] or None,
+            'role': UserRoleEnum.Member, 'is_admin': False, 'status': status, 'row_version': version,
+        } for entry, password_hash in zip(accepted, hashes)]
+        try:
+            for start in range(0, len(rows), ROSTER_INSERT_CHUNK_SIZE):
+                db.session.execute(db.insert(User.__table__), rows[start:start + ROSTER_INSERT_CHUNK_SIZE])
+            db.session.commit()
+        except IntegrityError:
+            # Another request took some of these keys after the check: nothing is
+            # created, and the rows it now blocks are reported like any other clash.
             db.session.rollback()
-            return jsonify({"message": "An unexpected server error occurred."}), 500
+            errors.extend(split_roster(accepted)[1])
+            errors.sort(key=lambda e: e['row'])
+            return jsonify({"message": "Some accounts were registered while this roster was being enrolled.",
+                            "created": [], "errors": errors}), 409
+        created = USER_ROW.rows(db.session.execute(
+            db.select(*USER_ROW.columns).where(User.id.in_([row['id'] for row in rows])).order_by(User.full_name)))
+
+    errors.sort(key=lambda e: e['row'])
+    return jsonify({"created": created, "errors": errors}), 201 if created else 200
+
+@users_bp.route('/api/users/<uuid:user_id>', methods=['PUT'])
+def edit_user(user_id):
+    user = cached_get(User, user_id)
+    if not user: abort(404)
+    data = request.get_json()
+    
+    user.full_name = data['fullName']
+    user.username = data['username']
+    # Only admin can change role/admin status
+    if data.get('isAdmin'):
+         user.is_admin = data['isAdmin']
+         user.role = UserRoleEnum.Admin if data['isAdmin'] else UserRoleEnum.Member
+    user.lrn = data.get('lrn') or None
+    user.grade_level = data.get('gradeLevel') or None
+    user.section = data.get('section') or None
+    
+    db.session.commit()
+    return jsonify(user.to_dict())
+
+@users_bp.route('/api/users/<uuid:user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    user = cached_get(User, user_id)
+    if not user: abort(404)
+    # Add checks to prevent deletion if user has loans or is last admin
+    has_loans = db.session.execute(db.select(
+        db.select(OutstandingLoan).where(OutstandingLoan.user_id == user_id, OutstandingLoan.loans > 0).exists()
+    )).scalar()
+    if has_loans:
+        abort(409, "Cannot delete user with outstanding loans.")
+    # Their requests would be left without a borrower; deny them first.
+    has_requests = db.session.execute(db.select(
+        db.select(Log).where(Log.user_id == user_id, Log.status == LogStatusEnum.PENDING).exists()
+    )).scalar()
+    if has_requests:
+        abort(409, "Cannot delete user with pending borrow requests.")
+    if user.is_admin:
+        admin_count = User.query.filter_by(is_admin=True).count()
+        if admin_count <= 1:
+            abort(409, "Cannot delete the last admin account.")
+    
+    db.session.delete(user)
+    db.session.commit()
+    return jsonify({"id": str(user_id)})
+
+@users_bp.route('/api/users/<uuid:user_id>/approve', methods=['POST'])
+def approve_user(user_id):
+    user = cached_get(User, user_id)
+    if not user: abort(404)
+    user.status = UserStatusEnum.APPROVED
+    notify([user.id], "Your account has been approved. Welcome to OliLab!", 'account_approved')
+    db.session.commit()
+    return jsonify(user.to_dict())
 
-        # --- API Routes ---
+@users_bp.route('/api/users/<uuid:user_id>/deny', methods=['POST'])
+def deny_user(user_id):
+    user = cached_get(User, user_id)
+    if not user: abort(404)
+    user.status = UserStatusEnum.DENIED
+    notify([user.id], "Your account request has been denied.", 'account_denied')
+    db.session.commit()
+    return jsonify(user.to_dict())
+    
+@users_bp.route('/api/users/<uuid:user_id>/borrows', methods=['GET'])
+def user_borrows(user_id):
+    """A user's borrowing ledger: what they still have, what is pending and recent history.
+
+    `outstanding` is read from the loan counters. The log lists are newest
+    first, each one range of the (user_id, status, timestamp) index.
+    `?historyLimit=` caps the history; older entries are on /api/logs?userId=, and
+    archived ones on /api/logs/archive?userId=.
+    """
+    if not cached_get(User, user_id): abort(404)
+    try:
+        history_limit = int(request.args.get('historyLimit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400, "Invalid 'historyLimit' value.")
+    history_limit = max(1, min(history_limit, MAX_PAGE_SIZE))
+
+    outstanding = OUTSTANDING_ROW.rows(db.session.execute(
+        db.select(*OUTSTANDING_ROW.columns).join(Item, Item.id == OutstandingLoan.item_id)
+        .where(OutstandingLoan.user_id == user_id, OutstandingLoan.loans > 0)
+        .order_by(Item.name)
+    ))
+
+    def borrow_logs(statuses, limit=None):
+        return db.session.execute(
+            db.select(*BORROW_ROW.columns).join(Item, Item.id == Log.item_id)
+            .where(Log.user_id == user_id, Log.status.in_(statuses), Log.action == LogActionEnum.BORROW)
+            .order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit)
+        ).all()
+
+    history_rows = borrow_logs((LogStatusEnum.RETURNED, LogStatusEnum.DENIED), history_limit)
+    id_at, status_at = BORROW_ROW.index(Log.id), BORROW_ROW.index(Log.status)
+    returned_ids = [row[id_at] for row in history_rows if row[status_at] == LogStatusEnum.RETURNED]
+    return_notes = dict(db.session.execute(
+        db.select(Log.related_log_id, Log.admin_notes)
+        .where(Log.related_log_id.in_(returned_ids), Log.action == LogActionEnum.RETURN)
+    ).all()) if returned_ids else {}
+    history = BORROW_ROW.rows(history_rows)
+    for row, entry in zip(history_rows, history):
+        entry["returnNotes"] = return_notes.get(row[id_at])
+
+    return jsonify({
+        "outstanding": {
+            "loans": sum(entry["loans"] for entry in outstanding),
+            "quantity": sum(entry["quantity"] for entry in outstanding),
+            "items": outstanding,
+        },
+        "activeLoans": BORROW_ROW.rows(borrow_logs((LogStatusEnum.APPROVED,))),
+        "pendingRequests": BORROW_ROW.rows(borrow_logs((LogStatusEnum.PENDING,))),
+        "history": history,
+    })
+
+# --- Logs Routes ---
+@logs_bp.route('/api/logs', methods=['GET'])
+def list_logs():
+    """Lists logs newest first, one keyset page at a time.
+
+    Filters: status, action, userId, itemId, from, to (ISO dates).
+    """
+    return keyset_page(*logs_page())
+
+@logs_bp.route('/api/logs/archive', methods=['GET'])
+def list_archived_logs():
+    """Lists archived logs newest first, one keyset page at a time, with user and item names.
+
+    Takes the same filters as /api/logs. Logs move here once RETURNED or
+    DENIED for longer than LOG_ARCHIVE_AFTER_DAYS (see `flask archive-logs`).
+    """
+    query = filter_logs(db.select(ArchivedLog), ArchivedLog)
+    return keyset_page(query, ARCHIVED_LOG_ROW, (ArchivedLog.timestamp, ArchivedLog.id),
+                       (datetime.fromisoformat, uuid.UUID), descending=True)
+
+@logs_bp.route('/api/logs/borrow', methods=['POST'])
+def request_borrow():
+    data = request.get_json()
+    item = cached_get(Item, uuid.UUID(data['itemId']))
+    if not item: abort(404)
+    # Early feedback only; stock is reserved atomically when the request is approved.
+    if item.available_quantity < data['quantity']:
+        abort(400, "Not enough items available to borrow.")
         
-        @app.route('/api/auth/login', methods=['POST'])
-        def login():
-            data = request.get_json()
-            if not data: abort(400, "Missing request body.")
-            identifier = data.get('identifier', '').lower()
-            password = data.get('password', '')
-            
-            user = User.query.filter(
-                (db.func.lower(User.username) == identifier) |
-                (db.func.lower(User.email) == identifier) |
-                (User.lrn == identifier)
-            ).first()
-
-            if not user or not bcrypt.check_password_hash(user.password_hash, password):
-                abort(401, "Invalid credentials.")
-            if user.status != UserStatusEnum.APPROVED:
-                abort(403, "Your account has not been approved by an administrator.")
-                
-            return jsonify(user.to_dict())
-
-        @app.route('/api/data', methods=['GET'])
-        def get_initial_data():
-            """Fetch all initial data for the application state."""
-            state = {
-                "items": [i.to_dict() for i in Item.query.order_by(Item.name).all()],
-                "users": [u.to_dict() for u in User.query.order_by(User.full_name).all()],
-                "logs": [l.to_dict() for l in Log.query.order_by(Log.timestamp.desc()).all()],
-                "suggestions": [s.to_dict() for s in Suggestion.query.order_by(Suggestion.timestamp.desc()).all()],
-                "comments": [c.to_dict() for c in Comment.query.order_by(Comment.timestamp.asc()).all()],
-                "notifications": [] # Notifications are transient and generated on-the-fly
-            }
-            return jsonify(state)
-            
-        # --- Items Routes ---
-        @app.route('/api/items', methods=['POST'])
-        def add_item():
-            data = request.get_json()
-            new_item = Item(
-                name=data['name'], 
-                category=data['category'],
-                total_quantity=int(data['totalQuantity']),
-                available_quantity=int(data['totalQuantity'])
-            )
-            db.session.add(new_item)
-            db.session.commit()
-            return jsonify(new_item.to_dict()), 201
-            
-        @app.route('/api/items/<uuid:item_id>', methods=['PUT'])
-        def edit_item(item_id):
-            item = db.session.get(Item, item_id)
-            if not item: abort(404)
-            data = request.get_json()
-            
-            borrowed_count = item.total_quantity - item.available_quantity
-            if data['totalQuantity'] < borrowed_count:
-                abort(400, f"Total quantity cannot be less than the amount currently borrowed ({borrowed_count}).")
-
-            item.name = data['name']
-            item.category = data['category']
-            item.total_quantity = data['totalQuantity']
-            item.available_quantity = data['totalQuantity'] - borrowed_count
-            db.session.commit()
-            return jsonify(item.to_dict())
-
-        @app.route('/api/items/<uuid:item_id>', methods=['DELETE'])
-        def delete_item(item_id):
-            item = db.session.get(Item, item_id)
-            if not item: abort(404)
-            # Prevent deletion if items are currently on loan
-            if item.available_quantity < item.total_quantity:
-                abort(409, "Cannot delete item with outstanding loans.")
-            db.session.delete(item)
-            db.session.commit()
-            return jsonify({"id": str(item_id)})
-            
-        @app.route('/api/items/import', methods=['POST'])
-        def import_items():
-            items_data = request.get_json()
-            new_items = []
-            for item_data in items_data:
-                new_item = Item(
-                    name=item_data['name'],
-                    category=item_data['category'],
-                    total_quantity=item_data['totalQuantity'],
-                    available_quantity=item_data['totalQuantity']
-                )
-                new_items.append(new_item)
-            db.session.add_all(new_items)
-            db.session.commit()
-            return jsonify([item.to_dict() for item in new_items]), 201
-
-        # --- Users Routes ---
-        @app.route('/api/users', methods=['POST'])
-        def create_user():
-            data = request.get_json()
-            # Check for uniqueness constraints
-            if User.query.filter(db.func.lower(User.username) == data['username'].lower()).first():
-                abort(409, "Username is already taken.")
-            if User.query.filter(db.func.lower(User.email) == data['email'].lower()).first():
-                abort(409, "Email is already registered.")
-            if data.get('lrn') and User.query.filter_by(lrn=data['lrn']).first():
-                abort(409, "LRN is already registered.")
-            
-            new_user = User(
-                username=data['username'],
-                full_name=data['fullName'],
-                email=data['email'],
-                password_hash=bcrypt.generate_password_hash(data['password']).decode('utf-8'),
-                lrn=data.get('lrn') or None,
-                grade_level=data.get('gradeLevel') or None,
-                section=data.get('section') or None,
-                is_admin=False, # Ensure new signups are not admins
-                role=UserRoleEnum.Member
-            )
-            db.session.add(new_user)
-            db.session.commit()
-            
-            notification = create_mock_notification(f"New user '{new_user.full_name}' requires approval.", 'new_user')
-            return jsonify({"newUser": new_user.to_dict(), "newNotification": notification}), 201
-            
-        @app.route('/api/users/<uuid:user_id>', methods=['PUT'])
-        def edit_user(user_id):
-            user = db.session.get(User, user_id)
-            if not user: abort(404)
-            data = request.get_json()
-            
-            user.full_name = data['fullName']
-            user.username = data['username']
-            # Only admin can change role/admin status
-            if data.get('isAdmin'):
-                 user.is_admin = data['isAdmin']
-                 user.role = UserRoleEnum.Admin if data['isAdmin'] else UserRoleEnum.Member
-            user.lrn = data.get('lrn') or None
-            user.grade_level = data.get('gradeLevel') or None
-            user.section = data.get('section') or None
-            
-            db.session.commit()
-            return jsonify(user.to_dict())
-
-        @app.route('/api/users/<uuid:user_id>', methods=['DELETE'])
-        def delete_user(user_id):
-            user = db.session.get(User, user_id)
-            if not user: abort(404)
-            # Add checks to prevent deletion if user has loans or is last admin
-            has_loans = Log.query.filter_by(user_id=user_id, status=LogStatusEnum.APPROVED).first()
-            if has_loans:
-                abort(409, "Cannot delete user with outstanding loans.")
-            if user.is_admin:
-                admin_count = User.query.filter_by(is_admin=True).count()
-                if admin_count <= 1:
-                    abort(409, "Cannot delete the last admin account.")
-            
-            db.session.delete(user)
-            db.session.commit()
-            return jsonify({"id": str(user_id)})
+    new_log = Log(
+        user_id=uuid.UUID(data['userId']),
+        item_id=item.id,
+        quantity=data['quantity'],
+        action=LogActionEnum.BORROW,
+        status=LogStatusEnum.PENDING
+    )
+    db.session.add(new_log)
+    db.session.flush()
 
-        @app.route('/api/users/<uuid:user_id>/approve', methods=['POST'])
-        def approve_user(user_id):
-            user = db.session.get(User, user_id)
-            if not user: abort(404)
-            user.status = UserStatusEnum.APPROVED
-            db.session.commit()
-            return jsonify(user.to_dict())
+    user = cached_get(User, new_log.user_id)
+    add_usage([(item.id, user.section, usage_day(new_log.timestamp), {'requests': 1})])
+    notification = notify(admin_ids(), f"{user.full_name} requested to borrow {item.name}.",
+                          'new_borrow_request', new_log.id)
+    db.session.commit()
+    return jsonify({"newLog": new_log.to_dict(), "newNotification": notification}), 201
+    
+@logs_bp.route('/api/logs/<uuid:log_id>/approve', methods=['POST'])
+def approve_borrow(log_id):
+    log = db.session.get(Log, log_id)
+    if not log or log.status != LogStatusEnum.PENDING: abort(404)
 
-        @app.route('/api/users/<uuid:user_id>/deny', methods=['POST'])
-        def deny_user(user_id):
-            user = db.session.get(User, user_id)
-            if not user: abort(404)
-            user.status = UserStatusEnum.DENIED
-            db.session.commit()
-            return jsonify(user.to_dict())
-            
-        # --- Logs Routes ---
-        @app.route('/api/logs/borrow', methods=['POST'])
-        def request_borrow():
-            data = request.get_json()
-            item = db.session.get(Item, uuid.UUID(data['itemId']))
-            if not item: abort(404)
-            if item.available_quantity < data['quantity']:
-                abort(400, "Not enough items available to borrow.")
-                
-            new_log = Log(
-                user_id=uuid.UUID(data['userId']),
-                item_id=item.id,
-                quantity=data['quantity'],
-                action=LogActionEnum.BORROW,
-                status=LogStatusEnum.PENDING
-            )
-            db.session.add(new_log)
-            db.session.commit()
-            
-            user = db.session.get(User, new_log.user_id)
-            notification = create_mock_notification(f"{user.full_name} requested to borrow {item.name}.", 'new_borrow_request', str(new_log.id))
-            return jsonify({"newLog": new_log.to_dict(), "newNotification": notification}), 201
-            
-        @app.route('/api/logs/<uuid:log_id>/approve', methods=['POST'])
-        def approve_borrow(log_id):
-            log = db.session.get(Log, log_id)
-            if not log or log.status != LogStatusEnum.PENDING: abort(404)
-            
-            item = db.session.get(Item, log.item_id)
+    version = next_row_version(db.session)
+    if not transition_log(log_id, LogStatusEnum.PENDING, LogStatusEnum.APPROVED, version):
+        abort(404)
+    if not reserve_stock(log.item_id, log.quantity, version):
+        db.session.rollback()
+        abort(400, "Not enough stock to approve this request.")
+    adjust_outstanding_loans(log.user_id, log.item_id, 1, log.quantity)
+    add_usage([(log.item_id, user_section(log.user_id), usage_day(log.timestamp),
+                {'borrows': 1, 'borrowed_quantity': log.quantity})])
+    item = cached_get(Item, log.item_id)
+    notify_borrower(log, item, 'approve')
+    db.session.commit()
+
+    return jsonify({"updatedLog": log.to_dict(), "updatedItem": item.to_dict()})
+
+@logs_bp.route('/api/logs/<uuid:log_id>/deny', methods=['POST'])
+def deny_borrow(log_id):
+    log = db.session.get(Log, log_id)
+    if not log: abort(404)
+    data = request.get_json()
+    # Only pending requests hold no stock; denying an approved loan would leak it.
+    if not transition_log(log_id, LogStatusEnum.PENDING, LogStatusEnum.DENIED,
+                          next_row_version(db.session), admin_notes=data.get('reason')):
+        abort(409, "Only pending requests can be denied.")
+    item = cached_get(Item, log.item_id)
+    notify_borrower(log, item, 'deny')
+    db.session.commit()
+    return jsonify(log.to_dict())
+    
+@logs_bp.route('/api/logs/<uuid:log_id>/request-return', methods=['POST'])
+def request_return(log_id):
+    log = db.session.get(Log, log_id)
+    if not log: abort(404)
+    log.return_requested = True
+
+    user = cached_get(User, log.user_id)
+    item = cached_get(Item, log.item_id)
+    notification = notify(admin_ids(), f"{user.full_name} requested to return {item.name}.",
+                          'return_request', log.id)
+    db.session.commit()
+    return jsonify({"updatedLog": log.to_dict(), "newNotification": notification})
+
+@logs_bp.route('/api/logs/return', methods=['POST'])
+def return_item():
+    data = request.get_json()
+    borrow_log_id = uuid.UUID(data['borrowLog']['id'])
+    borrow_log = db.session.get(Log, borrow_log_id)
+    if not borrow_log: abort(404)
+
+    # The status transition makes returns idempotent: a double submit finds
+    # the log already RETURNED and cannot put the stock back twice.
+    version = next_row_version(db.session)
+    if not transition_log(borrow_log_id, LogStatusEnum.APPROVED, LogStatusEnum.RETURNED, version):
+        abort(409, "This borrow is not on loan; it may have already been returned.")
+    if not release_stock(borrow_log.item_id, borrow_log.quantity, version):
+        db.session.rollback()
+        abort(409, "Returning this borrow would exceed the item's total quantity.")
+    adjust_outstanding_loans(borrow_log.user_id, borrow_log.item_id, -1, -borrow_log.quantity)
+
+    return_log = Log(
+        user_id=borrow_log.user_id,
+        item_id=borrow_log.item_id,
+        quantity=borrow_log.quantity,
+        action=LogActionEnum.RETURN,
+        status=LogStatusEnum.RETURNED,
+        admin_notes=data.get('adminNotes'),
+        related_log_id=borrow_log.id
+    )
+    db.session.add(return_log)
+    db.session.flush()
+    add_usage([(borrow_log.item_id, user_section(borrow_log.user_id), usage_day(return_log.timestamp),
+                {'returns': 1, 'returned_quantity': borrow_log.quantity})])
+    item = cached_get(Item, borrow_log.item_id)
+    notify_borrower(borrow_log, item, 'return')
+    db.session.commit()
+    return jsonify({
+        "returnLog": return_log.to_dict(),
+        "updatedBorrowLog": borrow_log.to_dict(),
+        "updatedItem": item.to_dict()
+    })
+
+@logs_bp.route('/api/logs/bulk', methods=['POST'])
+def bulk_update_logs():
+    """Approves, denies or returns many logs in one transaction.
+
+    Takes a list of {logId, action: 'approve'|'deny'|'return', notes} and
+    returns one result per entry, in order. Entries that cannot be applied
+    are reported and skipped; the rest commit together.
+    """
+    entries = request.get_json()
+    if not isinstance(entries, list): abort(400, "Expected a list of log operations.")
+    if len(entries) > MAX_BULK_OPERATIONS:
+        abort(400, f"At most {MAX_BULK_OPERATIONS} operations can be sent at once.")
+
+    results, parsed = [], []
+    for entry in entries:
+        result = {"logId": entry.get('logId') if isinstance(entry, dict) else None,
+                  "action": entry.get('action') if isinstance(entry, dict) else None, "ok": False}
+        results.append(result)
+        try:
+            log_id = uuid.UUID(entry['logId'])
+        except (TypeError, KeyError, ValueError):
+            result["error"] = "Invalid log id."
+            continue
+        if entry.get('action') not in BULK_LOG_ACTIONS:
+            result["error"] = "Action must be one of: approve, deny, return."
+            continue
+        parsed.append((result, log_id, entry['action'], entry.get('notes')))
+
+    # Take the sync counter first, then lock logs and items in id order,
+    # matching the single-log routes so concurrent requests cannot deadlock.
+    next_row_version(db.session)
+    log_ids = {log_id for _, log_id, _, _ in parsed}
+    logs = {log.id: log for log in
+            Log.query.filter(Log.id.in_(log_ids)).order_by(Log.id).with_for_update()} if log_ids else {}
+    item_ids = {log.item_id for log in logs.values()}
+    items = {item.id: item for item in
+             Item.query.filter(Item.id.in_(item_ids)).order_by(Item.id).with_for_update()} if item_ids else {}
+
+    # Apply every entry to the locked rows in memory; stock is tracked per
+    # item and written back once per item at flush.
+    return_logs = {}
+    outstanding = {}  # (user_id, item_id) -> [loans, quantity] still to apply
+    usage = []  # (log, usage log, counts) for the rollups, once timestamps are known
+    for result, log_id, action, notes in parsed:
+        log = logs.get(log_id)
+        if not log:
+            result["error"] = "Log not found."
+            continue
+        item = items[log.item_id]
+        if action == 'approve':
+            if log.status != LogStatusEnum.PENDING:
+                result["error"] = "Only pending requests can be approved."
+                continue
             if item.available_quantity < log.quantity:
-                abort(400, "Not enough stock to approve this request.")
-                
+                result["error"] = "Not enough stock to approve this request."
+                continue
             item.available_quantity -= log.quantity
             log.status = LogStatusEnum.APPROVED
-            db.session.commit()
-            return jsonify({"updatedLog": log.to_dict(), "updatedItem": item.to_dict()})
-
-        @app.route('/api/logs/<uuid:log_id>/deny', methods=['POST'])
-        def deny_borrow(log_id):
-            log = db.session.get(Log, log_id)
-            if not log: abort(404)
-            data = request.get_json()
+            if log.user_id:  # a deleted borrower's loans are not counted
+                delta = outstanding.setdefault((log.user_id, log.item_id), [0, 0])
+                delta[0] += 1
+                delta[1] += log.quantity
+            usage.append((log, log, {'borrows': 1, 'borrowed_quantity': log.quantity}))
+        elif action == 'deny':
+            if log.status != LogStatusEnum.PENDING:
+                result["error"] = "Only pending requests can be denied."
+                continue
             log.status = LogStatusEnum.DENIED
-            log.admin_notes = data.get('reason')
-            db.session.commit()
-            return jsonify(log.to_dict())
-            
-        @app.route('/api/logs/<uuid:log_id>/request-return', methods=['POST'])
-        def request_return(log_id):
-            log = db.session.get(Log, log_id)
-            if not log: abort(404)
-            log.return_requested = True
-            db.session.commit()
-            
-            user = db.session.get(User, log.user_id)
-            item = db.session.get(Item, log.item_id)
-            notification = create_mock_notification(f"{user.full_name} requested to return {item.name}.", 'return_request', str(log.id))
-            return jsonify({"updatedLog": log.to_dict(), "newNotification": notification})
-
-        @app.route('/api/logs/return', methods=['POST'])
-        def return_item():
-            data = request.get_json()
-            borrow_log_id = uuid.UUID(data['borrowLog']['id'])
-            borrow_log = db.session.get(Log, borrow_log_id)
-            if not borrow_log: abort(404)
-            
-            item = db.session.get(Item, borrow_log.item_id)
-            item.available_quantity += borrow_log.quantity
-            
-            borrow_log.status = LogStatusEnum.RETURNED
-            
+            log.admin_notes = notes
+        else:
+            if log.status != LogStatusEnum.APPROVED:
+                result["error"] = "This borrow is not on loan; it may have already been returned."
+                continue
+            if item.available_quantity + log.quantity > item.total_quantity:
+                result["error"] = "Returning this borrow would exceed the item's total quantity."
+                continue
+            item.available_quantity += log.quantity
+            log.status = LogStatusEnum.RETURNED
+            if log.user_id:  # a deleted borrower's loans are not counted
+                delta = outstanding.setdefault((log.user_id, log.item_id), [0, 0])
+                delta[0] -= 1
+                delta[1] -= log.quantity
             return_log = Log(
-                user_id=borrow_log.user_id,
-                item_id=borrow_log.item_id,
-                quantity=borrow_log.quantity,
+                user_id=log.user_id,
+                item_id=log.item_id,
+                quantity=log.quantity,
                 action=LogActionEnum.RETURN,
                 status=LogStatusEnum.RETURNED,
-                admin_notes=data.get('adminNotes'),
-                related_log_id=borrow_log.id
+                admin_notes=notes,
+                related_log_id=log.id
             )
             db.session.add(return_log)
-            db.session.commit()
-            return jsonify({
-                "returnLog": return_log.to_dict(),
-                "updatedBorrowLog": borrow_log.to_dict(),
-                "updatedItem": item.to_dict()
-            })
-            
-        # --- Suggestions & Comments ---
-        @app.route('/api/suggestions', methods=['POST'])
-        def add_suggestion():
-            data = request.get_json()
-            new_suggestion = Suggestion(
-                user_id=uuid.UUID(data['userId']),
-                type=SuggestionTypeEnum[data['type']],
-                title=data['title'],
-                description=data['description']
-            )
-            db.session.add(new_suggestion)
-            db.session.commit()
-            return jsonify(new_suggestion.to_dict()), 201
-
-        @app.route('/api/suggestions/<uuid:suggestion_id>/approve-item', methods=['POST'])
-        def approve_item_suggestion(suggestion_id):
-            suggestion = db.session.get(Suggestion, suggestion_id)
-            if not suggestion: abort(404)
-            data = request.get_json()
-            
-            suggestion.status = SuggestionStatusEnum.APPROVED
-            suggestion.category = data['category']
-            
-            new_item = Item(
-                name=suggestion.title,
-                category=data['category'],
-                total_quantity=data['totalQuantity'],
-                available_quantity=data['totalQuantity']
-            )
-            db.session.add(new_item)
-            db.session.commit()
-            return jsonify({"updatedSuggestion": suggestion.to_dict(), "newItem": new_item.to_dict()})
+            return_logs[id(result)] = return_log
+            usage.append((log, return_log, {'returns': 1, 'returned_quantity': log.quantity}))
+        notify_borrower(log, item, action)
+        result["ok"] = True
+    db.session.flush()
+    # Counters go last and in key order, after the logs and items they follow.
+    for (user_id, item_id), (loans, quantity) in sorted(outstanding.items()):
+        if loans or quantity:
+            adjust_outstanding_loans(user_id, item_id, loans, quantity)
+    user_ids = {log.user_id for log, _, _ in usage if log.user_id}
+    sections = dict(db.session.execute(
+        db.select(User.id, User.section).where(User.id.in_(user_ids))).all()) if user_ids else {}
+    add_usage([(log.item_id, sections.get(log.user_id), usage_day(counted.timestamp), counts)
+               for log, counted, counts in usage])
+    db.session.commit()
 
-        @app.route('/api/suggestions/<uuid:suggestion_id>/approve-feature', methods=['POST'])
-        def approve_feature_suggestion(suggestion_id):
-            suggestion = db.session.get(Suggestion, suggestion_id)
-            if not suggestion: abort(404)
-            suggestion.status = SuggestionStatusEnum.APPROVED
-            db.session.commit()
-            return jsonify(suggestion.to_dict())
-
-        @app.route('/api/suggestions/<uuid:suggestion_id>/deny', methods=['POST'])
-        def deny_suggestion(suggestion_id):
-            suggestion = db.session.get(Suggestion, suggestion_id)
-            if not suggestion: abort(404)
-            data = request.get_json()
-            
-            suggestion.status = SuggestionStatusEnum.DENIED
-            
-            new_comment = Comment(
-                user_id=uuid.UUID(data['adminId']),
-                suggestion_id=suggestion_id,
-                text=f"Admin Note: {data['reason']}"
-            )
-            db.session.add(new_comment)
-            db.session.commit()
-            return jsonify({"updatedSuggestion": suggestion.to_dict(), "newComment": new_comment.to_dict()})
-
-        @app.route('/api/comments', methods=['POST'])
-        def add_comment():
-            data = request.get_json()
-            new_comment = Comment(
-                user_id=uuid.UUID(data['userId']),
-                suggestion_id=uuid.UUID(data['suggestionId']),
-                text=data['text']
-            )
-            db.session.add(new_comment)
-            db.session.commit()
-            return jsonify(new_comment.to_dict()), 201
-            
-        # --- AI Reports Route ---
-        @app.route('/api/reports/generate', methods=['POST'])
-        def generate_report():
-            if not os.getenv("API_KEY"):
-                abort(500, "The Gemini API key is not configured on the server.")
-            
-            data = request.get_json()
-            
-            prompt = f"""
-            Analyze the provided JSON data for a science laboratory inventory system and generate a status briefing.
-
-            **Instructions:**
-            1.  Provide a concise one-paragraph `overview` of the lab's general status.
-            2.  Identify `lowStockItems`: items where available quantity is less than 20% of total quantity.
-            3.  Summarize the 5 most `recentActivity` logs, including the item name, user's full name, action ('Borrowed' or 'Returned'), and quantity.
-            4.  Identify the top 3 `mostActiveItems` based on the number of 'BORROW' actions.
-            5.  Write a brief, actionable `conclusion`.
-
-            **Input Data:**
-            - Items: {json.dumps(data.get('items'))}
-            - Logs: {json.dumps(data.get('logs'))}
-            - Users: {json.dumps(data.get('users'))}
-
-            **Output Format:**
-            Return ONLY a valid JSON object matching this exact schema:
-            {{
-              "overview": "string",
-              "lowStockItems": [{{ "name": "string", "available": "number", "total": "number" }}],
-              "recentActivity": [{{ "itemName": "string", "userName": "string", "action": "string", "quantity": "number" }}],
-              "mostActiveItems": [{{ "name": "string", "borrowCount": "number" }}],
-              "conclusion": "string"
-            }}
-            """
-            
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                response = model.generate_content(
-                    prompt, 
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                # The response.text should already be a valid JSON string
-                return jsonify(json.loads(response.text))
-            except Exception as e:
-                print(f"Gemini API Error: {e}")
-                abort(500, "Failed to generate report from AI service.")
-
-    # --- CLI Commands ---
-    @app.cli.command("init-db")
-    def init_db_command():
-        """Creates the database tables and a default admin user."""
-        db.create_all()
-        if not User.query.filter_by(username='admin').first():
-            admin_user = User(
-                username='admin',
-                full_name='Admin User',
-                email='admin@olilab.app',
-                password_hash=bcrypt.generate_password_hash('password').decode('utf-8'),
-                role=UserRoleEnum.Admin,
-                is_admin=True,
-                status=UserStatusEnum.APPROVED
-            )
-            db.session.add(admin_user)
-            db.session.commit()
-            print('Initialized the database and created the default admin user.')
+    # Reload everything touched in two queries instead of one per object.
+    touched_logs = set(logs) | {log.id for log in return_logs.values()}
+    if touched_logs:
+        Log.query.filter(Log.id.in_(touched_logs)).all()
+        Item.query.filter(Item.id.in_(item_ids)).all()
+    for result, log_id, _, _ in parsed:
+        if result["ok"]:
+            result["updatedLog"] = logs[log_id].to_dict()
+            if id(result) in return_logs:
+                result["returnLog"] = return_logs[id(result)].to_dict()
+    updated_item_ids = {logs[log_id].item_id for result, log_id, _, _ in parsed if result["ok"]}
+    return jsonify({
+        "results": results,
+        "updatedItems": [items[item_id].to_dict() for item_id in updated_item_ids]
+    })
+    
+# --- Suggestions & Comments ---
+@suggestions_bp.route('/api/suggestions', methods=['GET'])
+def list_suggestions():
+    """Lists suggestions newest first, one keyset page at a time.
+
+    Filters: status, type, userId, from, to (ISO dates).
+    """
+    query = db.select(Suggestion)
+    status = parse_enum_arg('status', SuggestionStatusEnum)
+    if status:
+        query = query.filter(Suggestion.status == status)
+    suggestion_type = parse_enum_arg('type', SuggestionTypeEnum)
+    if suggestion_type:
+        query = query.filter(Suggestion.type == suggestion_type)
+    user_id = parse_uuid_arg('userId')
+    if user_id:
+        query = query.filter(Suggestion.user_id == user_id)
+    start, end = parse_datetime_arg('from'), parse_datetime_arg('to')
+    if start:
+        query = query.filter(Suggestion.timestamp >= start)
+    if end:
+        query = query.filter(Suggestion.timestamp <= end)
+    return keyset_page(query, SUGGESTION_ROW, (Suggestion.timestamp, Suggestion.id), (datetime.fromisoformat, uuid.UUID), descending=True)
+
+@suggestions_bp.route('/api/suggestions', methods=['POST'])
+def add_suggestion():
+    data = request.get_json()
+    new_suggestion = Suggestion(
+        user_id=uuid.UUID(data['userId']),
+        type=SuggestionTypeEnum[data['type']],
+        title=data['title'],
+        description=data['description']
+    )
+    db.session.add(new_suggestion)
+    db.session.commit()
+    return jsonify(new_suggestion.to_dict()), 201
+
+@suggestions_bp.route('/api/suggestions/<uuid:suggestion_id>/approve-item', methods=['POST'])
+def approve_item_suggestion(suggestion_id):
+    suggestion = db.session.get(Suggestion, suggestion_id)
+    if not suggestion: abort(404)
+    data = request.get_json()
+    
+    suggestion.status = SuggestionStatusEnum.APPROVED
+    suggestion.category = data['category']
+    
+    new_item = Item(
+        name=suggestion.title,
+        category=data['category'],
+        total_quantity=data['totalQuantity'],
+        available_quantity=data['totalQuantity']
+    )
+    db.session.add(new_item)
+    db.session.commit()
+    return jsonify({"updatedSuggestion": suggestion.to_dict(), "newItem": new_item.to_dict()})
+
+@suggestions_bp.route('/api/suggestions/<uuid:suggestion_id>/approve-feature', methods=['POST'])
+def approve_feature_suggestion(suggestion_id):
+    suggestion = db.session.get(Suggestion, suggestion_id)
+    if not suggestion: abort(404)
+    suggestion.status = SuggestionStatusEnum.APPROVED
+    db.session.commit()
+    return jsonify(suggestion.to_dict())
+
+@suggestions_bp.route('/api/suggestions/<uuid:suggestion_id>/deny', methods=['POST'])
+def deny_suggestion(suggestion_id):
+    suggestion = db.session.get(Suggestion, suggestion_id)
+    if not suggestion: abort(404)
+    data = request.get_json()
+    
+    suggestion.status = SuggestionStatusEnum.DENIED
+    
+    new_comment = Comment(
+        user_id=uuid.UUID(data['adminId']),
+        suggestion_id=suggestion_id,
+        text=f"Admin Note: {data['reason']}"
+    )
+    db.session.add(new_comment)
+    db.session.commit()
+    return jsonify({"updatedSuggestion": suggestion.to_dict(), "newComment": new_comment.to_dict()})
+
+@suggestions_bp.route('/api/comments', methods=['POST'])
+def add_comment():
+    data = request.get_json()
+    new_comment = Comment(
+        user_id=uuid.UUID(data['userId']),
+        suggestion_id=uuid.UUID(data['suggestionId']),
+        text=data['text']
+    )
+    db.session.add(new_comment)
+    db.session.commit()
+    return jsonify(new_comment.to_dict()), 201
+
+# --- Search ---
+@search_bp.route('/api/search', methods=['GET'])
+def search():
+    """Ranked, typo-tolerant search over items and users.
+
+    Items match on name and category; users on full name, username, LRN
+    and section. Words match as prefixes ("beak" finds "Beaker") and with
+    small typos ("beekar"). `?type=items|users` searches one kind only and
+    `?limit=` caps each list. A full item or user id returns that record.
+    While this worker is still building its index, the lists come back empty
+    with `warming: true`.
+    """
+    query = request.args.get('q', '').strip()
+    kinds = list(SEARCH_FIELDS)
+    if request.args.get('type'):
+        if request.args['type'] not in SEARCH_FIELDS: abort(400, "Invalid 'type' value.")
+        kinds = [request.args['type']]
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        abort(400, "Invalid 'limit' value.")
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+    try:
+        exact_id = uuid.UUID(query)
+    except ValueError:
+        exact_id = None
+    index = current_app.extensions['search']
+    if exact_id is None:
+        if index.version is None:
+            warm_search_index(current_app._get_current_object())
+            return jsonify({**{kind: [] for kind in kinds}, 'warming': True})
+        refresh_search_index(index)
+
+    hits = {} if exact_id is not None else index.search(query, limit, kinds)
+    results = {}
+    for kind in kinds:
+        model, serializer = SEARCH_FIELDS[kind][0], SEARCH_SERIALIZERS[kind]
+        ids = [exact_id] if exact_id is not None else [id for id, _ in hits.get(kind, [])]
+        # Serve the rows themselves from the database so they are never stale.
+        id_at = serializer.index(model.id)
+        rows = {row[id_at]: row for row in db.session.execute(
+            db.select(*serializer.columns).where(model.id.in_(ids)))} if ids else {}
+        results[kind] = [serializer.row(rows[i]) for i in ids if i in rows]
+    return jsonify(results)
+
+# --- Notifications & Live Events ---
+@notifications_bp.route('/api/notifications', methods=['GET'])
+def list_notifications():
+    """Lists a user's notifications newest first, one keyset page at a time.
+
+    Requires `?userId=`. Filter: unread=true.
+    """
+    user_id = parse_uuid_arg('userId')
+    if not user_id: abort(400, "The 'userId' parameter is required.")
+    query = db.select(Notification).filter(Notification.user_id == user_id)
+    if request.args.get('unread') == 'true':
+        query = query.filter(Notification.read.is_(False))
+    return keyset_page(query, NOTIFICATION_ROW, (Notification.timestamp, Notification.id),
+                       (datetime.fromisoformat, uuid.UUID), descending=True)
+
+@notifications_bp.route('/api/notifications/unread-count', methods=['GET'])
+def get_unread_count():
+    user_id = parse_uuid_arg('userId')
+    if not user_id: abort(400, "The 'userId' parameter is required.")
+    return jsonify({"unreadCount": unread_notification_count(user_id)})
+
+@notifications_bp.route('/api/notifications/read', methods=['POST'])
+def mark_notifications_read():
+    """Marks notifications as read. Takes {ids: [...]} and returns the ids it found."""
+    data = request.get_json()
+    try:
+        ids = [uuid.UUID(i) for i in data['ids']]
+    except (TypeError, KeyError, ValueError, AttributeError):
+        abort(400, "Expected a list of notification ids.")
+    if not ids:
+        return jsonify([])
+    marked = db.session.execute(
+        db.update(Notification).where(Notification.id.in_(ids)).values(read=True)
+        .returning(Notification.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    return jsonify([str(i) for i in marked])
+
+@notifications_bp.route('/api/events', methods=['GET'])
+def stream_events():
+    """Pushes a user's notifications as Server-Sent Events while they happen.
+
+    Requires `?userId=`. The stream opens with an `unread` event carrying the
+    current unread count, then sends a `notification` event for each new one
+    and a comment line every few seconds to keep proxies from closing it.
+    Each open stream holds a server thread. At most EVENTS_MAX_STREAMS are
+    served per process; past that the answer is 503 and the client polls
+    instead. Under asgi.py streams wait on the event loop and are not capped.
+    """
+    user_id = parse_uuid_arg('userId')
+    if not user_id: abort(400, "The 'userId' parameter is required.")
+    if not cached_get(User, user_id): abort(404)
+    slots = current_app.extensions['event_stream_slots']
+    if not slots.acquire(blocking=False):
+        abort(503, "Too many live connections; poll for notifications instead.")
+    listen_for_events()
+    db.session.close() # Don't hold a database connection for the life of the stream.
+    app = current_app._get_current_object() # The stream outlives this request's context.
+
+    def stream():
+        broadcaster = app.extensions['events']
+        key = str(user_id)
+        subscription = broadcaster.subscribe(key)
+        try:
+            # Count after subscribing so nothing lands between the count and the stream.
+            with app.app_context():
+                unread = unread_notification_count(user_id)
+            yield f"retry: {SSE_RETRY_MS}\n" + format_sse('unread', {"unreadCount": unread})
+            while True:
+                try:
+                    payload = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(payload['event'], payload['data'])
+        finally:
+            broadcaster.unsubscribe(key, subscription)
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # On close rather than in the generator, which never runs if the client leaves first.
+    response.call_on_close(slots.release)
+    return response
+
+# --- AI Reports Route ---
+@reports_bp.route('/api/reports/generate', methods=['POST'])
+def generate_report():
+    """Starts a lab status report as a background job.
+
+    The figures are always computed from SQL aggregates; the configured
+    report writer (Gemini, or a stub) only writes the overview and
+    conclusion. `?mode=basic` skips the AI for templated text. Reports are
+    cached on the data version, so an unchanged database answers at once
+    with status DONE; otherwise poll GET /api/reports/jobs/<jobId>.
+    """
+    mode = 'basic' if request.args.get('mode') == 'basic' else 'ai'
+    writer = current_app.extensions['report_writer']
+    if mode == 'ai' and writer.name == 'gemini' and not os.getenv("API_KEY"):
+        abort(500, "The Gemini API key is not configured on the server.")
+
+    cache_key = report_cache_key(mode, writer)
+    job = ReportJob.query.filter(
+        ReportJob.cache_key == cache_key, ReportJob.status != ReportJobStatusEnum.FAILED
+    ).order_by(ReportJob.created_at.desc()).first()
+    if job and not job.is_expired():
+        return jsonify(job.to_dict()), 200 if job.status == ReportJobStatusEnum.DONE else 202
+
+    now = datetime.now(timezone.utc)
+    ReportJob.query.filter(ReportJob.created_at < now - REPORT_JOB_RETENTION).delete()
+    job = ReportJob(cache_key=cache_key, mode=mode, status=ReportJobStatusEnum.QUEUED,
+                    created_at=now, deadline=now + timedelta(seconds=current_app.config['REPORT_TIMEOUT']))
+    db.session.add(job)
+    db.session.commit()
+    try:
+        current_app.extensions['report_pool'].submit(run_report_job, current_app._get_current_object(), job.id)
+    except ReportQueueFull:
+        job.status = ReportJobStatusEnum.FAILED
+        job.error = "Too many reports are being generated. Please try again shortly."
+        db.session.commit()
+        abort(503, job.error)
+    return jsonify(job.to_dict()), 202
+
+@reports_bp.route('/api/reports/jobs/<uuid:job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Returns a report job's status, and the report once it is DONE.
+
+    `?wait=<seconds>` waits until the job finishes or the wait runs out, for
+    at most MAX_THREADED_REPORT_WAIT_SECONDS: clients poll again with backoff.
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_THREADED_REPORT_WAIT_SECONDS)
+    except ValueError:
+        abort(400, "Invalid 'wait' value.")
+    give_up_at = time.monotonic() + wait
+    while True:
+        job = db.session.get(ReportJob, job_id)
+        if not job: abort(404)
+        if job.is_finished() or time.monotonic() >= give_up_at:
+            return jsonify(job.to_dict())
+        # End the transaction so the next read sees the worker's commit.
+        db.session.rollback()
+        time.sleep(REPORT_POLL_INTERVAL)
+
+# --- Export Routes ---
+@exports_bp.route('/api/export/items', methods=['GET'])
+def export_items():
+    """Downloads the inventory by name. Filters: category, from, to (when added)."""
+    query = export_select(ITEM_EXPORT)
+    if request.args.get('category'):
+        query = query.filter(Item.category == request.args['category'])
+    query = filter_created(query, Item.created_at)
+    return export_response('inventory', ITEM_EXPORT, query.order_by(Item.name, Item.id))
+
+@exports_bp.route('/api/export/users', methods=['GET'])
+def export_users():
+    """Downloads the users by full name. Filters: status, role, from, to (when joined)."""
+    query = export_select(USER_EXPORT)
+    status = parse_enum_arg('status', UserStatusEnum)
+    if status:
+        query = query.filter(User.status == status)
+    role = parse_enum_arg('role', UserRoleEnum)
+    if role:
+        query = query.filter(User.role == role)
+    query = filter_created(query, User.created_at)
+    return export_response('users', USER_EXPORT, query.order_by(User.full_name, User.id))
+
+@exports_bp.route('/api/export/logs', methods=['GET'])
+def export_logs():
+    """Downloads the logs newest first, with borrower and item names.
+
+    Filters: status, action, userId, itemId, from, to (ISO dates), as on /api/logs.
+    """
+    query = (export_select(LOG_EXPORT).select_from(Log)
+             .join(Item, Item.id == Log.item_id).outerjoin(User, User.id == Log.user_id))
+    query = filter_logs(query)
+    return export_response('logs', LOG_EXPORT, query.order_by(Log.timestamp.desc(), Log.id.desc()))
+
+# --- Usage Routes ---
+@usage_bp.route('/api/usage/series', methods=['GET'])
+def usage_series():
+    """Request, borrow and return counts per day, week or month, oldest first.
+
+    Filters: itemId or section (`section=` alone for borrowers without one),
+    from, to (ISO dates, the last 90 days by default), interval: day, week
+    (starting Monday) or month. Without itemId or section the counts are
+    lab-wide. Periods with no activity are included as zeros.
+    """
+    interval = request.args.get('interval', 'day')
+    if interval not in USAGE_INTERVALS: abort(400, "Invalid 'interval' value.")
+    item_id, section = parse_uuid_arg('itemId'), request.args.get('section')
+    if item_id and section is not None: abort(400, "Filter by itemId or section, not both.")
+    start, end = usage_range()
+
+    model = ItemUsageDaily if item_id else SectionUsageDaily
+    query = (db.select(model.day, *[db.func.sum(getattr(model, column)) for column in USAGE_METRICS.values()])
+             .where(model.day.between(start, end)))
+    if item_id:
+        query = query.where(ItemUsageDaily.item_id == item_id)
+    elif section is not None:
+        query = query.where(SectionUsageDaily.section == section)
+    totals = {}
+    for day, *counts in db.session.execute(query.group_by(model.day)):
+        period = totals.setdefault(usage_period(day, interval), [0] * len(USAGE_METRICS))
+        for index, count in enumerate(counts):
+            period[index] += count
+
+    points = []
+    period = usage_period(start, interval)
+    while period <= end:
+        points.append({"period": period.isoformat(),
+                       **dict(zip(USAGE_METRICS, totals.get(period, [0] * len(USAGE_METRICS))))})
+        period = next_usage_period(period, interval)
+    return jsonify({"interval": interval, "from": start.isoformat(), "to": end.isoformat(), "points": points})
+
+@usage_bp.route('/api/usage/top', methods=['GET'])
+def top_usage():
+    """The most used items or sections between `from` and `to`, busiest first.
+
+    Query: by (items or sections), metric (one of USAGE_METRICS, default
+    borrows), from, to (ISO dates, the last 90 days by default), limit. Each
+    entry carries every count; only entries with some of `metric` are listed.
+    """
+    by = request.args.get('by', 'items')
+    if by not in ('items', 'sections'): abort(400, "Invalid 'by' value.")
+    metric = request.args.get('metric', 'borrows')
+    if metric not in USAGE_METRICS: abort(400, "Invalid 'metric' value.")
+    try:
+        limit = int(request.args.get('limit', DEFAULT_TOP_USAGE_LIMIT))
+    except ValueError:
+        abort(400, "Invalid 'limit' value.")
+    limit = max(1, min(limit, MAX_TOP_USAGE_LIMIT))
+    start, end = usage_range()
+
+    model = ItemUsageDaily if by == 'items' else SectionUsageDaily
+    key = ItemUsageDaily.item_id if by == 'items' else SectionUsageDaily.section
+    sums = {name: db.func.sum(getattr(model, column)).label(column) for name, column in USAGE_METRICS.items()}
+    # Rank the rollup rows alone; only the top `limit` are joined to their items.
+    ranked = (db.select(key.label('key'), *sums.values()).where(model.day.between(start, end)).group_by(key)
+              .having(sums[metric] > 0).order_by(sums[metric].desc(), key).limit(limit).subquery())
+    counts = [ranked.c[column] for column in USAGE_METRICS.values()]
+    order = (ranked.c[USAGE_METRICS[metric]].desc(), ranked.c.key)
+    if by == 'items':
+        rows = db.session.execute(db.select(ranked.c.key, Item.name, Item.category, *counts)
+                                  .join(Item, Item.id == ranked.c.key).order_by(*order)).all()
+        entries = [{"itemId": item_id, "name": name, "category": category, **dict(zip(USAGE_METRICS, values))}
+                   for item_id, name, category, *values in rows]
+    else:
+        rows = db.session.execute(db.select(ranked.c.key, *counts).order_by(*order)).all()
+        entries = [{"section": section or None, **dict(zip(USAGE_METRICS, values))} for section, *values in rows]
+    return jsonify({"by": by, "metric": metric, "from": start.isoformat(), "to": end.isoformat(),
+                    "entries": entries})
+
+# --- Batch Route ---
+@batch_bp.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Runs a list of operations through their routes in one transaction and returns every result.
+
+    Takes {operations: [{method, path, body}], atomic}. Each operation is the
+    request its route would get on its own (the path may carry a query
+    string), and its result is that route's {status, body}. With `atomic`
+    (the default) the first failure rolls back the whole batch and the
+    operations after it are not run. Otherwise each failure is rolled back
+    on its own and the rest commit together.
+    """
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list): abort(400, "Expected a list of operations.")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        abort(400, f"At most {MAX_BATCH_OPERATIONS} operations can be sent at once.")
+    atomic = data.get('atomic', True) is not False
+
+    # Take the sync counter first, as every write does, so the operations'
+    # locks follow the usual order. On SQLite this write also opens the real
+    # transaction; a SAVEPOINT before it would start (and commit) one of its own.
+    next_row_version(db.session)
+    results, failed = [], False
+    for operation in operations:
+        if failed and atomic:
+            results.append({"status": 424, "body": {"message": "Not run: an earlier operation failed."}})
+            continue
+        status, body = run_batch_operation(operation)
+        results.append({"status": status, "body": body})
+        failed = failed or status >= 400
+    committed = not (failed and atomic)
+    if committed:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return jsonify({"committed": committed, "results": results})
+
+# --- CLI Commands ---
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Creates the database tables and a default admin user."""
+    db.create_all()
+    if not User.query.filter_by(username='admin').first():
+        admin_user = User(
+            username='admin',
+            full_name='Admin User',
+            email='admin@olilab.app',
+            password_hash=passwords.hash('password'),
+            role=UserRoleEnum.Admin,
+            is_admin=True,
+            status=UserStatusEnum.APPROVED
+        )
+        db.session.add(admin_user)
+        db.session.commit()
+        print('Initialized the database and created the default admin user.')
+    else:
+        print('Admin user already exists.')
+
+@click.command("rebuild-outstanding-loans")
+@with_appcontext
+def rebuild_outstanding_loans_command():
+    """Recomputes the outstanding-loan counters from the logs."""
+    rebuild_outstanding_loans()
+    db.session.commit()
+    print(f'Rebuilt outstanding loans for {OutstandingLoan.query.count()} user/item pairs.')
+
+@click.command("archive-logs")
+@click.option('--older-than', 'days', type=int, default=None,
+              help="Archive logs finished more than this many days ago (default: LOG_ARCHIVE_AFTER_DAYS).")
+@click.option('--batch-size', type=int, default=LOG_ARCHIVE_BATCH_SIZE, show_default=True,
+              help="Logs moved per transaction.")
+@click.option('--every', 'interval_hours', type=float, default=None,
+              help="Keep running and archive again every this many hours.")
+@with_appcontext
+def archive_logs_command(days, batch_size, interval_hours):
+    """Moves RETURNED and DENIED logs past the cutoff into the log archive."""
+    if days is None:
+        days = current_app.config['LOG_ARCHIVE_AFTER_DAYS']
+    while True:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        moved = archive_logs(cutoff, max(1, batch_size))
+        print(f'Archived {moved} logs finished before {cutoff:%Y-%m-%d %H:%M} UTC.')
+        if interval_hours is None:
+            return
+        db.session.close()
+        time.sleep(interval_hours * 3600)
+
+@click.command("rebuild-usage-rollups")
+@with_appcontext
+def rebuild_usage_rollups_command():
+    """Recomputes the daily usage rollups from the logs and the log archive."""
+    rebuild_usage_rollups()
+    db.session.commit()
+    print(f'Rebuilt usage rollups: {ItemUsageDaily.query.count()} item days, '
+          f'{SectionUsageDaily.query.count()} section days.')
+
+CLI_COMMANDS = (init_db_command, rebuild_outstanding_loans_command, archive_logs_command,
+                rebuild_usage_rollups_command)
+
+# --- Application Factory ---
+def create_app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}) # Allow all origins for simplicity
+
+    # Configure database
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    configure_engine(app, PoolMonitor())
+    db.init_app(app)
+    with app.app_context():
+        install_engine_hooks(app, db.engine)
+    passwords.init_app(app)
+    metrics.init_app(app, db)
+    if metrics.enabled and 'db_pool_monitor' in app.extensions:
+        metrics.register(app, app.extensions['db_pool_monitor'])
+    
+    # Configure Gemini API (the SDK itself is loaded by the first AI report)
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        print("Warning: API_KEY environment variable not found. AI features will be disabled.")
+
+    # Configure background report generation
+    app.config['REPORT_TIMEOUT'] = int(os.getenv('REPORT_TIMEOUT', 60))
+    app.extensions['report_pool'] = ReportWorkerPool(
+        workers=int(os.getenv('REPORT_WORKERS', 2)), queue_limit=int(os.getenv('REPORT_QUEUE_LIMIT', 8)))
+    if os.getenv('REPORT_WRITER') == 'stub':
+        app.extensions['report_writer'] = StubReportWriter()
+    else:
+        app.extensions['report_writer'] = GeminiReportWriter(api_key=api_key, timeout=app.config['REPORT_TIMEOUT'])
+
+    # Finished logs older than this move to the archive (flask archive-logs)
+    app.config.setdefault('LOG_ARCHIVE_AFTER_DAYS', int(os.getenv('LOG_ARCHIVE_AFTER_DAYS', 365)))
+
+    # Where the usage rollups' days begin and end; run `flask rebuild-usage-rollups` after changing it
+    app.config.setdefault('USAGE_TIMEZONE', os.getenv('USAGE_TIMEZONE', 'UTC'))
+    ZoneInfo(app.config['USAGE_TIMEZONE'])  # an unknown zone fails here, not on the first borrow
+
+    # Per-process read cache, kept coherent across workers by the change versions
+    app.config.setdefault('READ_CACHE_ENABLED', os.getenv('READ_CACHE_ENABLED', '1') != '0')
+    app.config.setdefault('READ_CACHE_MAX_ENTRIES', int(os.getenv('READ_CACHE_MAX_ENTRIES', 10000)))
+    app.config.setdefault('READ_CACHE_TTL', float(os.getenv('READ_CACHE_TTL', 300)))
+    app.config.setdefault('READ_CACHE_SECTION_MAX_ROWS', int(os.getenv('READ_CACHE_SECTION_MAX_ROWS', 5000)))
+    app.extensions['read_cache'] = ReadCache(max_entries=app.config['READ_CACHE_MAX_ENTRIES'],
+                                             ttl=app.config['READ_CACHE_TTL'],
+                                             enabled=app.config['READ_CACHE_ENABLED'])
+    if metrics.enabled:
+        metrics.register(app, app.extensions['read_cache'])
+        # Hit, miss and invalidation counts of this worker's read cache, as JSON.
+        metrics.add_stats_view(app, '/api/cache/stats', 'read_cache_stats', app.extensions['read_cache'])
+
+    # Per-process search index, built in the background by warm_search_index
+    app.extensions['search'] = SearchIndex()
+
+    # Live notifications pushed to connected clients. On Postgres they go out by
+    # NOTIFY to a LISTEN connection in each worker, which needs a session of its
+    # own: behind a transaction-mode pooler that is DB_LISTEN_URL.
+    app.extensions['events'] = EventBroadcaster(queue_size=int(os.getenv('EVENTS_QUEUE_SIZE', 100)))
+    # Each stream served here holds a thread: leave half of gunicorn's for requests.
+    app.config.setdefault('EVENTS_MAX_STREAMS', int(os.getenv(
+        'EVENTS_MAX_STREAMS', max(1, int(os.getenv('GUNICORN_THREADS', 16)) // 2))))
+    app.extensions['event_stream_slots'] = threading.BoundedSemaphore(app.config['EVENTS_MAX_STREAMS'])
+    app.config['EVENTS_VIA_NOTIFY'] = False
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if database_uri and make_url(database_uri).get_backend_name() == 'postgresql':
+        listen_url = app.config['DB_LISTEN_URL'] or (None if app.config['DB_PGBOUNCER'] else database_uri)
+        if listen_url is None:
+            print("Warning: DB_PGBOUNCER is set without DB_LISTEN_URL. Live notifications will only reach "
+                  "clients connected to the worker that made the change.")
+        elif make_url(listen_url).get_driver_name() not in LISTEN_DRIVERS:
+            print(f"Warning: the {make_url(listen_url).get_driver_name()} driver cannot LISTEN. Live notifications "
+                  "will only reach clients connected to the worker that made the change; use psycopg2 or psycopg.")
         else:
-            print('Admin user already exists.')
+            if app.config['DB_LISTEN_URL']:
+                app.extensions['events_engine'] = create_engine(listen_url, poolclass=NullPool)
+            app.config['EVENTS_VIA_NOTIFY'] = True
+
+    # Routes and commands were registered at import time; mount them.
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+    for command in CLI_COMMANDS:
+        app.cli.add_command(command)
 
     return app
 
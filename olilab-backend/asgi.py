@@ -0,0 +1,347 @@
+"""ASGI entry point for the OliLab API: `uvicorn asgi:app`.
+
+The Flask app stays the one definition of every route. The routes that spend
+their time waiting are served here as coroutines on an async SQLAlchemy
+session (asyncpg on Postgres, aiosqlite on SQLite): login (bcrypt), the item
+and log lists (the database), report long-polls (Gemini) and the live event
+stream. One process keeps hundreds of those in flight. Every other route runs
+its Flask view unchanged on a bounded thread pool. Both paths go through the
+Flask app's request hooks and error handlers, so CORS headers, metrics and
+error bodies are the same.
+
+Native routes only read. A write they need, such as upgrading an old password
+hash, goes through the Flask session on a thread, where the row-version and
+cache hooks run.
+
+Run one process per core, for example:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4 --timeout-graceful-shutdown 10
+
+Event streams stay open until the client leaves, so without a graceful
+shutdown timeout a restart waits for every connected browser.
+
+Configuration:
+  ASGI_THREADS  threads running the Flask views that have no native version (default 16)
+
+The async engine opens its own connections, so the database must be Postgres
+or a SQLite file, not `sqlite://` in memory.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from flask import Response, abort, current_app, jsonify, request
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app import (
+    MAX_REPORT_WAIT_SECONDS, REPORT_POLL_INTERVAL, SSE_HEARTBEAT_SECONDS, SSE_RETRY_MS,
+    ReportJob, User, UserStatusEnum, create_app, db, items_page, keyset_response,
+    keyset_statement, listen_for_events, login_user_query, logs_page, parse_uuid_arg, passwords,
+    unread_count_query, warm_search_index,
+)
+from events import format_sse
+from passwords import PasswordHasherBusy
+from storage import create_async_engine_for
+
+# Request bodies larger than this are spooled to disk (CSV and roster imports).
+MAX_BODY_IN_MEMORY = 1024 * 1024
+
+
+def build_environ(scope, body):
+    """Translates an ASGI HTTP scope and its request body into a WSGI environ."""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+
+class EventStream:
+    """Returned by a native view to stream `chunks` (an async iterator of str) after the headers."""
+
+    def __init__(self, chunks, **response_args):
+        self.chunks = chunks
+        self.response = Response(**response_args)
+
+
+class AsyncServer:
+    """Serves the Flask app over ASGI, with native coroutines for some of its endpoints."""
+
+    def __init__(self, flask_app, engine):
+        self.flask_app = flask_app
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        self.executor = ThreadPoolExecutor(flask_app.config['ASGI_THREADS'], thread_name_prefix='wsgi')
+        self.urls = flask_app.url_map.bind('localhost')
+        self.views = {}
+
+    def route(self, endpoint, method):
+        """Registers a coroutine that serves `method` requests to a Flask endpoint.
+
+        It is called with an AsyncSession and the URL's arguments inside the
+        Flask request context, and returns what a Flask view would, or an
+        EventStream.
+        """
+        def decorator(view):
+            self.views[endpoint, method] = view
+            return view
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        with SpooledTemporaryFile(MAX_BODY_IN_MEMORY) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = build_environ(scope, body)
+            view = self._match(scope)
+            if view is None:
+                await self._run_wsgi(environ, send)
+            else:
+                await self._run_native(view[0], view[1], environ, receive, send)
+
+    def _match(self, scope):
+        try:
+            endpoint, args = self.urls.match(scope['path'], scope['method'])
+        except (HTTPException, RequestRedirect):
+            return None  # Flask answers 404s, 405s and redirects itself.
+        view = self.views.get((endpoint, scope['method']))
+        return (view, args) if view else None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                warm_search_index(self.flask_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.executor, self._wsgi_response, environ, send_from_thread)
+
+    def _wsgi_response(self, environ, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), encode_headers(headers)]
+
+        output = self.flask_app(environ, start_response)
+        try:
+            # Headers go out with the first chunk: a streamed view sets them as it starts.
+            sent_headers = False
+            for chunk in output:
+                if not sent_headers:
+                    send({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+                    sent_headers = True
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_headers:
+                send({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+            send({'type': 'http.response.body'})
+        finally:
+            # Ends the request context of streamed responses.
+            if hasattr(output, 'close'):
+                output.close()
+
+    async def _run_native(self, view, args, environ, receive, send):
+        flask_app = self.flask_app
+        stream = None
+        # Flask keeps its request context in contextvars, so each task has its own.
+        with flask_app.request_context(environ):
+            # The same steps as Flask.full_dispatch_request, awaiting the view.
+            try:
+                try:
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        async with self.sessions() as session:
+                            rv = await view(session, **args)
+                    if isinstance(rv, EventStream):
+                        stream, rv = rv.chunks, rv.response
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                response = flask_app.finalize_request(rv)
+            except Exception as e:
+                response = flask_app.handle_exception(e)
+            headers = encode_headers(response.headers.items())
+            await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        if stream is None:
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+        else:
+            await self._stream(stream, receive, send)
+
+    async def _stream(self, chunks, receive, send):
+        """Sends `chunks` until they run out or the client disconnects."""
+        async def pump():
+            async for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body'})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await chunks.aclose()
+
+
+def save_password_hash(flask_app, user_id, password_hash):
+    with flask_app.app_context():
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user.password_hash = password_hash
+            db.session.commit()
+
+
+def create_asgi_app(flask_app=None):
+    """Builds the ASGI server around `flask_app` (by default a new create_app())."""
+    flask_app = flask_app or create_app()
+    flask_app.config.setdefault('ASGI_THREADS', int(os.getenv('ASGI_THREADS', 16)))
+    engine = create_async_engine_for(flask_app)
+    if 'metrics' in flask_app.extensions:
+        flask_app.extensions['metrics'].instrument_engine(engine.sync_engine)
+    server = AsyncServer(flask_app, engine)
+
+    @server.route('auth.login', 'POST')
+    async def login(session):
+        data = request.get_json()
+        if not data: abort(400, "Missing request body.")
+        identifier = data.get('identifier', '').lower()
+        password = data.get('password', '')
+
+        user = (await session.execute(login_user_query(identifier))).scalar()
+        try:
+            if not user or not await passwords.check_async(user.password_hash, password):
+                abort(401, "Invalid credentials.")
+            if user.status != UserStatusEnum.APPROVED:
+                abort(403, "Your account has not been approved by an administrator.")
+            # Upgrade hashes made with an older cost factor while we have the password.
+            if passwords.needs_rehash(user.password_hash):
+                user.password_hash = await passwords.hash_async(password)
+                await asyncio.to_thread(save_password_hash, flask_app, user.id, user.password_hash)
+        except PasswordHasherBusy:
+            abort(503, "The server is busy. Please try again in a moment.")
+        return jsonify(user.to_dict())
+
+    async def keyset_page(session, query, serializer, sort_columns, sort_types, descending=False):
+        stmt, limit = keyset_statement(query, serializer, sort_columns, sort_types, descending)
+        rows = (await session.execute(stmt)).all()
+        return keyset_response(rows, serializer, sort_columns, limit)
+
+    @server.route('items.list_items', 'GET')
+    async def list_items(session):
+        return await keyset_page(session, *items_page())
+
+    @server.route('logs.list_logs', 'GET')
+    async def list_logs(session):
+        return await keyset_page(session, *logs_page())
+
+    @server.route('reports.get_report_job', 'GET')
+    async def get_report_job(session, job_id):
+        try:
+            wait = min(float(request.args.get('wait', 0)), MAX_REPORT_WAIT_SECONDS)
+        except ValueError:
+            abort(400, "Invalid 'wait' value.")
+        give_up_at = time.monotonic() + wait
+        while True:
+            job = await session.get(ReportJob, job_id, populate_existing=True)
+            if not job: abort(404)
+            if job.is_finished() or time.monotonic() >= give_up_at:
+                return jsonify(job.to_dict())
+            # End the transaction so the next read sees the report worker's commit.
+            await session.rollback()
+            await asyncio.sleep(REPORT_POLL_INTERVAL)
+
+    @server.route('notifications.stream_events', 'GET')
+    async def stream_events(session):
+        user_id = parse_uuid_arg('userId')
+        if not user_id: abort(400, "The 'userId' parameter is required.")
+        if await session.get(User, user_id) is None: abort(404)
+        listen_for_events()
+        broadcaster = current_app.extensions['events']
+
+        async def stream():
+            key = str(user_id)
+            subscription = broadcaster.subscribe_async(key)
+            try:
+                # Count after subscribing so nothing lands between the count and the stream.
+                async with server.sessions() as counting:
+                    unread = await counting.scalar(unread_count_query(user_id))
+                yield f"retry: {SSE_RETRY_MS}\n" + format_sse('unread', {"unreadCount": unread})
+                while True:
+                    try:
+                        payload = await subscription.get(SSE_HEARTBEAT_SECONDS)
+                    except TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield format_sse(payload['event'], payload['data'])
+            finally:
+                broadcaster.unsubscribe(key, subscription)
+
+        return EventStream(stream(), mimetype='text/event-stream',
+                           headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return server
+
+
+app = create_asgi_app()
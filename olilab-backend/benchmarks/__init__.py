@@ -0,0 +1,9 @@
+"""Benchmarks for the OliLab backend.
+
+Run each module from the `olilab-backend` directory, e.g.
+`python -m benchmarks.bench_serializers`. They default to an in-memory SQLite
+database; set DATABASE_URL to benchmark against Postgres instead.
+`bench_endpoints`, `bench_asgi` and `bench_startup` are the exceptions: their
+server workers need a shared database, so they default to a SQLite file in the
+temp directory.
+"""
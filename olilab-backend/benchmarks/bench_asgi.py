@@ -0,0 +1,199 @@
+"""How many requests one server process keeps in flight: the ASGI server against the sync workers.
+
+Starts one process at a time on the same seeded SQLite file:
+
+  sync     gunicorn, one sync worker (what each worker of the default deployment does)
+  gthread  gunicorn, one worker with --threads threads
+  asgi     uvicorn on asgi.py, one process
+
+and drives it with rising numbers of concurrent clients on:
+
+  longpoll  GET /api/reports/jobs/<id>?wait=--wait on a job that never finishes:
+            a request that only waits, as one on Gemini or a distant database does
+  login     POST /api/auth/login, which waits on bcrypt in the hashing pool
+  items     GET /api/items, a short database read
+
+"In flight" is the throughput times the latency with a single client: how
+many requests the process was working on at once (Little's law). The loaded
+latency would overstate it, since it includes time spent queued in the
+socket backlog. A request that gets no reply within --timeout is an error. Each
+scenario gets a fresh server, so a backlog left by one cannot slow the next.
+Last, it opens --streams live event streams against a fresh server of each
+kind and checks whether a list request still gets through while they stay open.
+
+Usage: python -m benchmarks.bench_asgi [--clients 1 8 32 128] [--duration 5] [--wait 1] [--timeout 10]
+           [--threads 8] [--streams 100] [--only sync gthread asgi]
+"""
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'asgi.db')
+os.environ.setdefault('REPORT_WRITER', 'stub')
+
+from app import create_app, db, passwords, ReportJob, ReportJobStatusEnum
+from benchmarks.bench_endpoints import HttpDriver, percentile, start_server
+from benchmarks.datagen import BENCH_PASSWORD, seed_scale
+
+SCENARIOS = {
+    'longpoll': lambda fx, n, args: ('GET', f"/api/reports/jobs/{fx['pending_job_id']}?wait={args.wait}", None),
+    'login': lambda fx, n, args: ('POST', '/api/auth/login', {
+        'identifier': f"member{n % len(fx['member_ids'])}", 'password': BENCH_PASSWORD}),
+    'items': lambda fx, n, args: ('GET', '/api/items?limit=50', None),
+}
+
+
+def seed():
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fixtures = seed_scale('tiny', 10, passwords.hash(BENCH_PASSWORD))
+        # A report that stays queued for the whole run, so long-polls always wait them out.
+        now = datetime.now(timezone.utc)
+        job = ReportJob(cache_key='bench-pending', mode='ai', status=ReportJobStatusEnum.QUEUED,
+                        created_at=now, deadline=now + timedelta(days=1))
+        db.session.add(job)
+        db.session.commit()
+        fixtures['pending_job_id'] = job.id
+        db.engine.dispose()
+    return fixtures
+
+
+def drive(driver, scenario, fixtures, clients, args):
+    """Runs `clients` client threads for --duration seconds and summarizes what they saw."""
+    statuses, latencies, lock = Counter(), [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def client(offset):
+        n = offset
+        while time.monotonic() < deadline:
+            method, path, body = SCENARIOS[scenario](fixtures, n, args)
+            n += clients
+            started = time.perf_counter()
+            try:
+                status = driver.send(method, path, body)
+            except OSError:
+                status = 'no reply'
+            with lock:
+                statuses[status] += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {
+        'rate': statuses[200] / elapsed,
+        'p50': percentile(latencies, 50) * 1000 if latencies else 0,
+        'p95': percentile(latencies, 95) * 1000 if latencies else 0,
+        'errors': {status: count for status, count in statuses.items() if status != 200},
+    }
+
+
+def open_stream(port, user_id, timeout):
+    """Opens a live event stream; returns the socket once the first event arrives, or None."""
+    connection = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+    try:
+        connection.sendall(f"GET /api/events?userId={user_id} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+        received = b''
+        while b'event: unread' not in received:
+            chunk = connection.recv(4096)
+            if not chunk:
+                raise OSError("closed")
+            received += chunk
+        return connection
+    except OSError:
+        connection.close()
+        return None
+
+
+def hold_streams(driver, fixtures, args):
+    """Opens --streams event streams at once, then times a list request while they stay open."""
+    results = [None] * args.streams
+    admin_id = fixtures['admin_id']
+
+    def opener(n):
+        results[n] = open_stream(driver.port, admin_id, args.timeout)
+
+    threads = [threading.Thread(target=opener, args=(n,)) for n in range(args.streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    started = time.perf_counter()
+    try:
+        status = driver.send('GET', '/api/items?limit=50', None)
+    except OSError:
+        status = 'no reply'
+    elapsed = (time.perf_counter() - started) * 1000
+    for connection in results:
+        if connection is not None:
+            connection.close()
+    return sum(1 for connection in results if connection is not None), status, elapsed
+
+
+@contextmanager
+def serving(options, args):
+    """Runs one server process for the duration of the block."""
+    process, driver = start_server(1, **options)
+    try:
+        yield HttpDriver(driver.host, driver.port, timeout=args.timeout)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--duration', type=float, default=5, help='seconds per client count')
+    parser.add_argument('--wait', type=float, default=1, help='long-poll wait in seconds')
+    parser.add_argument('--timeout', type=float, default=10, help='client timeout in seconds')
+    parser.add_argument('--threads', type=int, default=8, help='threads of the gthread worker')
+    parser.add_argument('--streams', type=int, default=100)
+    parser.add_argument('--only', nargs='+', choices=('sync', 'gthread', 'asgi'), default=('sync', 'gthread', 'asgi'))
+    parser.add_argument('--scenarios', nargs='+', choices=tuple(SCENARIOS), default=tuple(SCENARIOS))
+    args = parser.parse_args()
+    args.clients = sorted(set(args.clients) | {1})
+
+    fixtures = seed()
+    servers = {'sync': {'threads': 1}, 'gthread': {'threads': args.threads}, 'asgi': {'asgi': True}}
+    print(f"{'server':<8} {'scenario':<9} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'in flight':>9}  errors")
+    peaks, streams = {}, {}
+    for name in args.only:
+        for scenario in args.scenarios:
+            with serving(servers[name], args) as driver:
+                unloaded = None
+                for clients in args.clients:
+                    result = drive(driver, scenario, fixtures, clients, args)
+                    unloaded = unloaded or result['p50'] / 1000
+                    result['in_flight'] = result['rate'] * unloaded
+                    errors = ', '.join(f'{status}: {count}' for status, count in sorted(result['errors'].items(), key=str))
+                    print(f"{name:<8} {scenario:<9} {clients:>7} {result['rate']:>8.1f} {result['p50']:>8.1f} "
+                          f"{result['p95']:>8.1f} {result['in_flight']:>9.1f}  {errors or '-'}", flush=True)
+                    if not result['errors']:
+                        peaks[name, scenario] = max(peaks.get((name, scenario), 0), result['in_flight'])
+        with serving(servers[name], args) as driver:
+            streams[name] = hold_streams(driver, fixtures, args)
+
+    print("\nMost requests in flight with no errors, one process:")
+    for scenario in args.scenarios:
+        print(f"  {scenario:<9} " + '  '.join(f"{name} {peaks.get((name, scenario), 0):.1f}" for name in args.only))
+    print(f"\nWith {args.streams} event streams open:")
+    for name, (opened, status, elapsed) in streams.items():
+        print(f"  {name:<8} {opened} streams open, GET /api/items -> {status} in {elapsed:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compares database backends on the main endpoints: SQLite (WAL) against Postgres.
+
+Runs the endpoint benchmark once per backend, each in its own process, with
+the same scale, request count and concurrency. It then prints p50/p95 side by
+side. With --server, each run goes through a multi-worker gunicorn, which is
+how a single-node SQLite deployment shares the database file.
+
+The Postgres database is dropped and re-seeded, so point --postgres (or
+BENCH_POSTGRES_URL) at a scratch database. Without one, only SQLite runs.
+
+Usage: python -m benchmarks.bench_backends [--postgres URL] [--sqlite PATH] [--scale small]
+           [--requests 200] [--concurrency 1] [--server] [--workers 4] [--only PATTERN ...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# The endpoints most screens hit; --only overrides.
+MAIN_ENDPOINTS = ('GET /api/data', 'GET /api/items', 'GET /api/logs', 'GET /api/users/<uuid:user_id>/borrows',
+                  'GET /api/search', 'POST /api/auth/login', 'PUT /api/items', 'POST /api/logs/borrow',
+                  'POST /api/logs/<uuid:log_id>/approve', 'POST /api/logs/return')
+
+
+def run(label, url, args, out):
+    command = [sys.executable, '-m', 'benchmarks.bench_endpoints', '--scale', args.scale,
+               '--requests', str(args.requests), '--concurrency', str(args.concurrency), '--save', out,
+               '--only', *(args.only or MAIN_ENDPOINTS)]
+    if args.server:
+        command += ['--server', '--workers', str(args.workers)]
+    if not url.startswith('sqlite'):
+        command.append('--reset')
+    print(f"--- {label}: {url.split('@')[-1]}", flush=True)
+    subprocess.run(command, env={**os.environ, 'DATABASE_URL': url}, check=True)
+    with open(out) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--postgres', default=os.getenv('BENCH_POSTGRES_URL'), help='scratch Postgres URL')
+    parser.add_argument('--sqlite', default=os.path.join(tempfile.gettempdir(), 'olilab-bench-backends.db'))
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--server', action='store_true', help='go through a gunicorn server')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--only', nargs='+', help='endpoint name patterns (default: the main endpoints)')
+    args = parser.parse_args()
+
+    backends = [('sqlite', f'sqlite:///{os.path.abspath(args.sqlite)}')]
+    if args.postgres:
+        backends.append(('postgres', args.postgres))
+    else:
+        print("No --postgres or BENCH_POSTGRES_URL given; running SQLite only.")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for label, url in backends:
+            results[label] = run(label, url, args, os.path.join(scratch, f'{label}.json'))['endpoints']
+
+    labels = list(results)
+    print(f"\n{'endpoint':<58}" + ''.join(f" {label + ' p50':>14} {label + ' p95':>14}" for label in labels)
+          + (f" {'p50 ratio':>10}" if len(labels) == 2 else ''))
+    for name in results[labels[0]]:
+        runs = [results[label].get(name) for label in labels]
+        line = f"{name:<58}" + ''.join(
+            f" {stats['p50_ms']:>14.1f} {stats['p95_ms']:>14.1f}" if stats else f" {'-':>14} {'-':>14}"
+            for stats in runs)
+        if len(runs) == 2 and all(runs) and runs[0]['p50_ms']:
+            # Above 1 means Postgres is slower than SQLite.
+            line += f" {runs[1]['p50_ms'] / runs[0]['p50_ms']:>10.2f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measures the read cache: full /api/data loads and hot item/user lookups, cache on vs off.
+
+Seeds --items items and --users users with no log history, so /api/data is all
+catalog and roster. Each pass alternates reads with an occasional write, which
+forces the cache to catch up through the change versions as it would behind
+other workers. Prints latency and the cache's hit rate for each pass.
+
+Usage: python -m benchmarks.bench_cache [--items 20000] [--users 5000] [--requests 200] [--write-every 10]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'cache.db')
+
+from app import create_app, db, Item, User, UserStatusEnum
+from benchmarks.datagen import CATEGORIES, insert_batched
+
+
+def seed(items, users):
+    item_ids = [uuid.uuid4() for _ in range(items)]
+    insert_batched(Item, ({
+        'id': item_id, 'name': f'Item {n}', 'category': CATEGORIES[n % len(CATEGORIES)],
+        'total_quantity': 1_000_000, 'available_quantity': 1_000_000,
+    } for n, item_id in enumerate(item_ids)))
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    insert_batched(User, ({
+        'id': user_id, 'username': f'member{n}', 'full_name': f'Member {n}', 'email': f'member{n}@olilab.app',
+        'password_hash': 'x', 'status': UserStatusEnum.APPROVED,
+    } for n, user_id in enumerate(user_ids)))
+    db.session.commit()
+    return item_ids, user_ids
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+def run_pass(app, item_ids, user_ids, args, rng):
+    client = app.test_client()
+    hot_items, hot_users = item_ids[:20], user_ids[:20]
+    timings = {'GET /api/data': [], 'GET /api/users/<id>/borrows': []}
+    for n in range(args.requests):
+        if n % args.write_every == 0:
+            client.put(f'/api/items/{rng.choice(item_ids)}',
+                       json={'name': f'Item renamed {n}', 'category': 'Glassware', 'totalQuantity': 1_000_000})
+        for label, url in (('GET /api/data', '/api/data'),
+                           ('GET /api/users/<id>/borrows', f'/api/users/{rng.choice(hot_users)}/borrows')):
+            started = time.perf_counter()
+            response = client.get(url)
+            body = response.get_data()  # /api/data streams; read it all
+            timings[label].append(time.perf_counter() - started)
+            assert response.status_code == 200, body
+        # A borrow request reads its item before writing, the cached lookup most routes share.
+        client.post('/api/logs/borrow', json={'itemId': str(rng.choice(hot_items)), 'userId': str(rng.choice(hot_users)),
+                                              'quantity': 1})
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--write-every', type=int, default=10, help='one item edit per this many iterations')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        item_ids, user_ids = seed(args.items, args.users)
+    cache = app.extensions['read_cache']
+
+    print(f"{args.items:,} items, {args.users:,} users; one write every {args.write_every} iterations")
+    for enabled in (False, True):
+        cache.enabled = enabled
+        cache.clear()
+        timings = run_pass(app, item_ids, user_ids, args, random.Random(0))
+        print(f"cache {'on' if enabled else 'off'}:")
+        for label, values in timings.items():
+            print(f"  {label:30} p50 {percentile(values, 0.5):8.1f} ms   p95 {percentile(values, 0.95):8.1f} ms")
+        if enabled:
+            for namespace, stats in sorted(cache.stats()['namespaces'].items()):
+                lookups = stats['hits'] + stats['misses']
+                print(f"  {namespace:10} hit rate {stats['hits'] / lookups if lookups else 0:.0%} "
+                      f"({stats['hits']} hits, {stats['misses']} misses, {stats['invalidations']} invalidations)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+"""Endpoint load benchmark: throughput and p50/p95/p99 latency for every route.
+
+Seeds a database at one of the datagen scales, then sends --requests calls to
+each API route. Requests go in-process through the Flask test client, or with
+--server over HTTP to a multi-worker gunicorn started on the same database.
+Read routes run first and write routes after them. Each write route uses
+its own freshly seeded targets, so every call does real work.
+
+Results print as a table. They can be saved as JSON (--save) and compared with
+an earlier run (--compare). A regression beyond --threshold makes the run exit
+with status 1, so this can gate a change.
+
+The default database is a SQLite file in the temp directory, which the server
+workers can share. The tables are dropped and re-seeded on every run, so a
+non-SQLite DATABASE_URL also needs --reset.
+
+Usage: python -m benchmarks.bench_endpoints [--scale small] [--requests 200] [--concurrency 1]
+           [--server] [--workers 4] [--only PATTERN ...] [--save out.json]
+           [--compare baseline.json] [--threshold 0.2] [--reset]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'olilab-bench.db')}")
+os.environ.setdefault('REPORT_WRITER', 'stub')
+
+from app import create_app, db, passwords, warm_search_index
+from benchmarks.datagen import SCALES, BENCH_PASSWORD, BULK_LOG_BATCH, CATEGORIES, seed_scale
+
+# Differences below this many milliseconds are noise, whatever the ratio.
+NOISE_FLOOR_MS = 1.0
+
+# Routes the suite deliberately does not time, with the reason.
+EXCLUDED = {
+    ('GET', '/api/events'): 'an event stream never completes',
+}
+
+# `build(fixtures, n)` returns (path, body) for the n-th request. The body is
+# None, a JSON value, or a (content type, bytes) pair. `limit` caps the
+# request count for routes too slow to repeat at large scales.
+Endpoint = namedtuple('Endpoint', 'method rule build label limit', defaults=('', None))
+
+
+SEARCH_TERMS = ('beak', 'flsk', 'member1', 'glass', 'item 12')
+
+def _pick(values, n):
+    return str(values[n % len(values)])
+
+def _pool(name):
+    return lambda fx, n: fx['pools'][name][n]
+
+def _csv_items(n):
+    rows = ''.join(f'Imported {n}-{k},{CATEGORIES[k % len(CATEGORIES)]},5\n' for k in range(50))
+    return ('text/csv', f'name,category,totalQuantity\n{rows}'.encode('utf-8'))
+
+
+READ_ENDPOINTS = [
+    Endpoint('GET', '/api/data', lambda fx, n: ('/api/data', None), limit=5),
+    Endpoint('GET', '/api/data', lambda fx, n: ('/api/data?since=0', None), label='delta'),
+    Endpoint('GET', '/api/items', lambda fx, n: ('/api/items?limit=50', None)),
+    Endpoint('GET', '/api/items', lambda fx, n: (f'/api/items?limit=50&category={CATEGORIES[n % len(CATEGORIES)]}', None),
+             label='category'),
+    Endpoint('GET', '/api/users', lambda fx, n: ('/api/users?limit=50', None)),
+    Endpoint('GET', '/api/logs', lambda fx, n: ('/api/logs?limit=50', None)),
+    Endpoint('GET', '/api/logs', lambda fx, n: (f"/api/logs?limit=50&userId={_pick(fx['member_ids'], n)}", None),
+             label='user'),
+    Endpoint('GET', '/api/logs', lambda fx, n: (f"/api/logs?limit=50&itemId={_pick(fx['item_ids'], n)}", None),
+             label='item'),
+    Endpoint('GET', '/api/logs/archive', lambda fx, n: ('/api/logs/archive?limit=50', None)),
+    Endpoint('GET', '/api/users/<uuid:user_id>/borrows',
+             lambda fx, n: (f"/api/users/{_pick(fx['member_ids'], n)}/borrows", None)),
+    Endpoint('GET', '/api/search', lambda fx, n: (f"/api/search?q={SEARCH_TERMS[n % len(SEARCH_TERMS)]}", None)),
+    Endpoint('GET', '/api/suggestions', lambda fx, n: ('/api/suggestions?limit=50', None)),
+    Endpoint('GET', '/api/notifications', lambda fx, n: (f"/api/notifications?userId={fx['admin_id']}&limit=50", None)),
+    Endpoint('GET', '/api/notifications/unread-count',
+             lambda fx, n: (f"/api/notifications/unread-count?userId={fx['admin_id']}", None)),
+    Endpoint('POST', '/api/auth/login', lambda fx, n: (
+        '/api/auth/login', {'identifier': f"member{n % len(fx['member_ids'])}", 'password': BENCH_PASSWORD})),
+    Endpoint('POST', '/api/reports/generate', lambda fx, n: ('/api/reports/generate?mode=basic', None)),
+    Endpoint('GET', '/api/reports/jobs/<uuid:job_id>', lambda fx, n: (f"/api/reports/jobs/{fx['report_job_id']}", None)),
+    Endpoint('GET', '/api/cache/stats', lambda fx, n: ('/api/cache/stats', None)),
+    Endpoint('GET', '/api/export/items', lambda fx, n: ('/api/export/items', None), limit=5),
+    Endpoint('GET', '/api/export/users', lambda fx, n: ('/api/export/users', None), limit=5),
+    Endpoint('GET', '/api/export/logs', lambda fx, n: ('/api/export/logs', None), limit=5),
+    Endpoint('GET', '/api/export/logs', lambda fx, n: ('/api/export/logs?format=xlsx', None), label='xlsx', limit=5),
+    Endpoint('GET', '/api/usage/series', lambda fx, n: ('/api/usage/series?interval=week', None)),
+    Endpoint('GET', '/api/usage/series',
+             lambda fx, n: (f"/api/usage/series?itemId={fx['item_ids'][n % len(fx['item_ids'])]}", None),
+             label='item'),
+    Endpoint('GET', '/api/usage/top', lambda fx, n: ('/api/usage/top?metric=requests&limit=20', None)),
+    Endpoint('GET', '/api/usage/top', lambda fx, n: ('/api/usage/top?by=sections', None), label='sections'),
+]
+
+WRITE_ENDPOINTS = [
+    Endpoint('POST', '/api/items', lambda fx, n: (
+        '/api/items', {'name': f'New Item {n}', 'category': 'Equipment', 'totalQuantity': 10})),
+    Endpoint('PUT', '/api/items/<uuid:item_id>', lambda fx, n: (
+        f"/api/items/{_pick(fx['item_ids'], n)}", {'name': f'Item {n}', 'category': 'Equipment', 'totalQuantity': 1_000})),
+    Endpoint('DELETE', '/api/items/<uuid:item_id>', lambda fx, n: (f"/api/items/{_pool('delete_item')(fx, n)}", None)),
+    Endpoint('POST', '/api/items/import', lambda fx, n: (
+        '/api/items/import', [{'name': f'Listed {n}-{k}', 'category': 'Safety', 'totalQuantity': 3} for k in range(50)])),
+    Endpoint('POST', '/api/items/import', lambda fx, n: ('/api/items/import', _csv_items(n)), label='csv'),
+    Endpoint('POST', '/api/users', lambda fx, n: ('/api/users', {
+        'username': f'signup{n}', 'fullName': f'Signup {n}', 'email': f'signup{n}@bench.olilab.app',
+        'password': BENCH_PASSWORD})),
+    Endpoint('POST', '/api/users/bulk', lambda fx, n: ('/api/users/bulk', {'approve': True, 'users': [{
+        'username': f'roster{n}-{k}', 'fullName': f'Roster {n}-{k}', 'email': f'roster{n}-{k}@bench.olilab.app',
+        'password': BENCH_PASSWORD} for k in range(10)]}), limit=20),
+    Endpoint('PUT', '/api/users/<uuid:user_id>', lambda fx, n: (
+        f"/api/users/{_pick(fx['member_ids'], n)}",
+        {'username': f"member{n % len(fx['member_ids'])}", 'fullName': f'Renamed Member {n}'})),
+    Endpoint('POST', '/api/users/<uuid:user_id>/approve', lambda fx, n: (
+        f"/api/users/{_pool('approve_user')(fx, n)}/approve", None)),
+    Endpoint('POST', '/api/users/<uuid:user_id>/deny', lambda fx, n: (f"/api/users/{_pool('deny_user')(fx, n)}/deny", None)),
+    Endpoint('DELETE', '/api/users/<uuid:user_id>', lambda fx, n: (f"/api/users/{_pool('delete_user')(fx, n)}", None)),
+    Endpoint('POST', '/api/logs/borrow', lambda fx, n: (
+        '/api/logs/borrow', {'userId': _pick(fx['member_ids'], n), 'itemId': str(fx['bench_item_id']), 'quantity': 1})),
+    Endpoint('POST', '/api/logs/<uuid:log_id>/approve', lambda fx, n: (
+        f"/api/logs/{_pool('approve_log')(fx, n)}/approve", None)),
+    Endpoint('POST', '/api/logs/<uuid:log_id>/deny', lambda fx, n: (
+        f"/api/logs/{_pool('deny_log')(fx, n)}/deny", {'reason': 'Benchmark'})),
+    Endpoint('POST', '/api/logs/<uuid:log_id>/request-return', lambda fx, n: (
+        f"/api/logs/{_pool('request_return')(fx, n)}/request-return", None)),
+    Endpoint('POST', '/api/logs/return', lambda fx, n: (
+        '/api/logs/return', {'borrowLog': {'id': str(_pool('return_log')(fx, n))}, 'adminNotes': 'Benchmark'})),
+    Endpoint('POST', '/api/logs/bulk', lambda fx, n: ('/api/logs/bulk', [
+        {'logId': str(log_id), 'action': 'approve'}
+        for log_id in fx['pools']['bulk_log'][n * BULK_LOG_BATCH:(n + 1) * BULK_LOG_BATCH]])),
+    Endpoint('POST', '/api/batch', lambda fx, n: ('/api/batch', {'operations': [
+        {'path': f'/api/logs/{log_id}/approve'}
+        for log_id in fx['pools']['batch_log'][n * BULK_LOG_BATCH:(n + 1) * BULK_LOG_BATCH]]})),
+    Endpoint('POST', '/api/suggestions', lambda fx, n: ('/api/suggestions', {
+        'userId': _pick(fx['member_ids'], n), 'type': 'ITEM', 'title': f'Idea {n}', 'description': 'Benchmark'})),
+    Endpoint('POST', '/api/suggestions/<uuid:suggestion_id>/approve-item', lambda fx, n: (
+        f"/api/suggestions/{_pool('approve_item_suggestion')(fx, n)}/approve-item",
+        {'category': 'Equipment', 'totalQuantity': 5})),
+    Endpoint('POST', '/api/suggestions/<uuid:suggestion_id>/approve-feature', lambda fx, n: (
+        f"/api/suggestions/{_pool('approve_feature_suggestion')(fx, n)}/approve-feature", None)),
+    Endpoint('POST', '/api/suggestions/<uuid:suggestion_id>/deny', lambda fx, n: (
+        f"/api/suggestions/{_pool('deny_suggestion')(fx, n)}/deny", {'reason': 'Benchmark', 'adminId': str(fx['admin_id'])})),
+    Endpoint('POST', '/api/comments', lambda fx, n: ('/api/comments', {
+        'userId': _pick(fx['member_ids'], n), 'suggestionId': _pick(fx['suggestion_ids'], n), 'text': 'Benchmark'})),
+    Endpoint('POST', '/api/notifications/read', lambda fx, n: (
+        '/api/notifications/read', {'ids': [str(i) for i in fx['pools']['read_notifications'][n * 10:(n + 1) * 10]]})),
+]
+
+ENDPOINTS = READ_ENDPOINTS + WRITE_ENDPOINTS
+
+
+def endpoint_name(endpoint):
+    name = f'{endpoint.method} {endpoint.rule}'
+    return f'{name} [{endpoint.label}]' if endpoint.label else name
+
+
+def _encode(body):
+    """Returns (content type, bytes) for a request body."""
+    if body is None:
+        return None, None
+    if isinstance(body, tuple):
+        return body
+    return 'application/json', json.dumps(body).encode('utf-8')
+
+
+class TestClientDriver:
+    """Sends requests in-process; each thread gets its own test client."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        content_type, data = _encode(body)
+        response = self._local.client.open(path, method=method, data=data, content_type=content_type)
+        response.get_data()
+        return response.status_code
+
+
+class HttpDriver:
+    """Sends requests over HTTP with one keep-alive connection per thread."""
+
+    def __init__(self, host, port, timeout=120):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._local = threading.local()
+
+    def send(self, method, path, body):
+        content_type, data = _encode(body)
+        headers = {'Content-Type': content_type} if content_type else {}
+        for attempt in range(2):
+            if not hasattr(self._local, 'connection'):
+                self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._local.connection.request(method, path, body=data, headers=headers)
+                response = self._local.connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the idle connection; reconnect once.
+                self._local.connection.close()
+                del self._local.connection
+                if attempt:
+                    raise
+            except TimeoutError:
+                # The reply may still arrive; never read it as the next request's.
+                self._local.connection.close()
+                del self._local.connection
+                raise
+
+
+def start_server(workers, threads=1, asgi=False):
+    """Starts gunicorn on a free local port and waits until it answers.
+
+    With `threads` above 1, each worker serves that many requests at once (gthread).
+    With `asgi`, it starts uvicorn on asgi.py instead and `threads` is ignored.
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if asgi:
+        command = ['uvicorn', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port),
+                   '--timeout-graceful-shutdown', '2', '--log-level', 'warning', 'asgi:app']
+    else:
+        command = ['gunicorn', '--workers', str(workers), '--threads', str(threads),
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:create_app()']
+    process = subprocess.Popen([sys.executable, '-m', *command], cwd=backend_dir, env=os.environ.copy())
+    driver = HttpDriver('127.0.0.1', port)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if driver.send('GET', '/api/items?limit=1', None) == 200:
+                return process, driver
+        except OSError:
+            pass
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit("The benchmark server did not start.")
+        time.sleep(0.2)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_endpoint(driver, endpoint, fixtures, requests, concurrency):
+    count = min(requests, endpoint.limit) if endpoint.limit else requests
+    calls = [endpoint.build(fixtures, n) for n in range(count)]
+
+    def timed(call):
+        path, body = call
+        started = time.perf_counter()
+        try:
+            status = driver.send(endpoint.method, path, body)
+        except OSError:
+            status = None
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(timed, calls))
+        elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if status is None or status >= 400)
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput': round(count / elapsed, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def uncovered_routes(app):
+    """Lists API routes that neither ENDPOINTS nor EXCLUDED account for."""
+    covered = {(e.method, e.rule) for e in ENDPOINTS} | set(EXCLUDED)
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if not rule.rule.startswith('/api/'):
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.rule) not in covered:
+                missing.append(f'{method} {rule.rule}')
+    return missing
+
+
+def compare(results, baseline, threshold):
+    """Returns a description of each endpoint that got slower than `baseline`."""
+    regressions = []
+    for key in ('scale', 'mode', 'concurrency', 'database'):
+        if results['meta'].get(key) != baseline['meta'].get(key):
+            print(f"warning: baseline {key} is {baseline['meta'].get(key)!r}, this run is {results['meta'][key]!r}")
+    for name, current in results['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if not before:
+            continue
+        slower = current['p95_ms'] - before['p95_ms']
+        if slower > NOISE_FLOOR_MS and current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        elif current['throughput'] < before['throughput'] * (1 - threshold) and slower > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {current['throughput']:.1f} req/s")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per endpoint')
+    parser.add_argument('--server', action='store_true', help='benchmark a gunicorn server instead of the test client')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers with --server')
+    parser.add_argument('--only', nargs='+', help='run only endpoints whose name contains one of these')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before flagging, e.g. 0.2 = 20%%')
+    parser.add_argument('--reset', action='store_true', help='allow dropping and re-seeding a non-SQLite database')
+    args = parser.parse_args()
+    if not os.environ['DATABASE_URL'].startswith('sqlite') and not args.reset:
+        parser.error("this drops every table in DATABASE_URL; pass --reset to confirm")
+    if os.environ['DATABASE_URL'] == 'sqlite://' and (args.server or args.concurrency > 1):
+        parser.error("an in-memory database cannot be shared; use a file or Postgres DATABASE_URL")
+
+    app = create_app()
+    missing = uncovered_routes(app)
+    if missing:
+        print(f"warning: no benchmark for {', '.join(missing)}")
+
+    started = time.perf_counter()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fixtures = seed_scale(args.scale, args.requests, passwords.hash(BENCH_PASSWORD))
+        dialect = db.engine.dialect.name
+    print(f"seeded '{args.scale}' {SCALES[args.scale]} in {time.perf_counter() - started:.1f}s")
+
+    server = None
+    if args.server:
+        server, driver = start_server(args.workers)
+    else:
+        driver = TestClientDriver(app)
+        # Time searches against a built index, as a started server's workers have.
+        warmer = warm_search_index(app)
+        if warmer is not None:
+            warmer.join()
+
+    results = {
+        'meta': {
+            'scale': args.scale, 'sizes': SCALES[args.scale], 'requests': args.requests,
+            'concurrency': args.concurrency, 'mode': f'server x{args.workers}' if args.server else 'test client',
+            'database': dialect,
+            'revision': git_revision(), 'python': platform.python_version(),
+            'started': datetime.now(timezone.utc).isoformat(),
+        },
+        'endpoints': {},
+    }
+    try:
+        # A finished report for the job-status route to return.
+        job = json.loads(app.test_client().post('/api/reports/generate?mode=basic').get_data())
+        while job['status'] in ('QUEUED', 'RUNNING'):
+            job = json.loads(app.test_client().get(f"/api/reports/jobs/{job['jobId']}?wait=2").get_data())
+        fixtures['report_job_id'] = job['jobId']
+
+        print(f"{'endpoint':<58} {'reqs':>5} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for endpoint in ENDPOINTS:
+            name = endpoint_name(endpoint)
+            if args.only and not any(pattern in name for pattern in args.only):
+                continue
+            stats = run_endpoint(driver, endpoint, fixtures, args.requests, args.concurrency)
+            results['endpoints'][name] = stats
+            print(f"{name:<58} {stats['requests']:>5} {stats['errors']:>5} {stats['throughput']:>8.1f} "
+                  f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"saved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"  [regression] {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Times the streaming item import on a large CSV catalog.
+
+Generates N rows (100k by default) where every tenth row repeats an earlier
+(name, category) pair, posts them as text/csv and reports rows/sec.
+
+Usage: python -m benchmarks.bench_import [--rows 100000] [--chunk-size 1000]
+"""
+import argparse
+import io
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db, Item
+
+CATEGORIES = ('Glassware', 'Chemicals', 'Equipment', 'Consumables', 'Safety')
+
+
+def make_csv(rows):
+    out = io.StringIO()
+    out.write('name,category,totalQuantity\n')
+    for n in range(rows):
+        key = n - 1 if n % 10 == 9 else n
+        out.write(f'Item {key},{CATEGORIES[key % len(CATEGORIES)]},{1 + n % 20}\n')
+    return out.getvalue().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    body = make_csv(args.rows)
+
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post(f'/api/items/import?chunkSize={args.chunk_size}', data=body, content_type='text/csv')
+    elapsed = time.perf_counter() - started
+    report = response.get_json()
+
+    with app.app_context():
+        stored = db.session.query(Item).count()
+    print(f"{args.rows:,} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec), chunk size {args.chunk_size}")
+    print(f"inserted {report['inserted']:,}, merged {report['merged']:,}, failed {report['failed']:,}; {stored:,} items stored")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Login load benchmark: p50/p99 latency for N concurrent logins.
+
+Seeds one approved user per concurrent client and logs them all in at once,
+either in-process through the Flask test client or against a running server
+(--url http://localhost:5000). Compare --workers 0 (bcrypt inline on the
+request thread) with the default process pool.
+
+Usage: python -m benchmarks.bench_login [--concurrency 50] [--rounds 3] [--workers N] [--url URL]
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=3, help='waves of concurrent logins')
+    parser.add_argument('--workers', type=int, help='PASSWORD_HASH_WORKERS (0 = inline)')
+    parser.add_argument('--url', help='base URL of a running server; users must already exist')
+    args = parser.parse_args()
+    if args.workers is not None:
+        os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+
+    from app import create_app, db, passwords, User, UserStatusEnum
+
+    app = create_app()
+    users = [f'loadtest{n}' for n in range(args.concurrency)]
+    if args.url:
+        def login(username):
+            request = urllib.request.Request(
+                f'{args.url.rstrip("/")}/api/auth/login', method='POST',
+                data=json.dumps({'identifier': username, 'password': 'password'}).encode(),
+                headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request) as response:
+                return response.status
+    else:
+        with app.app_context():
+            db.create_all()
+            password_hash = passwords.hash('password')
+            db.session.add_all(User(username=u, full_name=u, email=f'{u}@olilab.app', password_hash=password_hash,
+                                    status=UserStatusEnum.APPROVED) for u in users)
+            db.session.commit()
+        local = threading.local()
+        def login(username):
+            if not hasattr(local, 'client'):
+                local.client = app.test_client()
+            return local.client.post('/api/auth/login', json={'identifier': username, 'password': 'password'}).status_code
+
+    latencies, statuses = [], []
+    def timed_login(username):
+        started = time.perf_counter()
+        status = login(username)
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for latency, status in pool.map(timed_login, users):
+                latencies.append(latency)
+                statuses.append(status)
+        elapsed = time.perf_counter() - started
+
+    print(f"{len(latencies)} logins, {args.concurrency} concurrent, cost {passwords.rounds}, "
+          f"{passwords.workers} hash workers")
+    print(f"throughput {len(latencies) / elapsed:.1f} logins/sec; statuses {dict((s, statuses.count(s)) for s in set(statuses))}")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms, "
+          f"mean {statistics.mean(latencies) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Times /api/search on a large catalog: index build, then per-query latency.
+
+Seeds --rows items and as many users with names made from a fixed vocabulary.
+It times the index build, which a worker runs as it starts, and then a mix of
+prefix, typo and multi-word queries. It also times a search right after a write, when
+the index has to catch up.
+
+Usage: python -m benchmarks.bench_search [--rows 100000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+import uuid
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db, Item, User, UserStatusEnum, warm_search_index
+from benchmarks.datagen import CATEGORIES, insert_batched
+
+NOUNS = ('Beaker', 'Flask', 'Burette', 'Pipette', 'Funnel', 'Crucible', 'Microscope', 'Thermometer', 'Balance',
+         'Magnet', 'Prism', 'Lens', 'Spatula', 'Tongs', 'Goggles', 'Condenser', 'Desiccator', 'Centrifuge')
+ADJECTIVES = ('Graduated', 'Volumetric', 'Conical', 'Digital', 'Analytical', 'Borosilicate', 'Compound',
+              'Magnetic', 'Heat-resistant', 'Disposable', 'Precision', 'Student')
+FIRST_NAMES = ('Maria', 'Jose', 'Angelo', 'Andrea', 'Miguel', 'Sofia', 'Gabriel', 'Isabella', 'Rafael', 'Camille')
+LAST_NAMES = ('Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Villanueva', 'Ramos', 'Aquino')
+QUERIES = ('beak', 'beakr', 'graduated cylinder', 'volumetric flsk', 'micro', 'termometer', 'santos', 'maria cruz',
+           'vilanueva', 'grade 10', 'centrifuge 42')
+
+
+def seed(rows, rng):
+    insert_batched(Item, ({
+        'id': uuid.uuid4(), 'name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {n}',
+        'category': CATEGORIES[n % len(CATEGORIES)], 'total_quantity': 5, 'available_quantity': 5,
+    } for n in range(rows)))
+    insert_batched(User, ({
+        'id': uuid.uuid4(), 'username': f'student{n}', 'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'email': f'student{n}@olilab.app', 'password_hash': 'x', 'lrn': f'{n:012d}', 'section': f'Grade {7 + n % 6}',
+        'status': UserStatusEnum.APPROVED,
+    } for n in range(rows)))
+    db.session.commit()
+
+
+def timed_get(client, url):
+    started = time.perf_counter()
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000, help='items, and as many users')
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(args.rows, rng)
+    client = app.test_client()
+
+    started = time.perf_counter()
+    warm_search_index(app).join()
+    build = time.perf_counter() - started
+    print(f"{args.rows:,} items + {args.rows:,} users; index build {build:.2f}s")
+
+    latencies = [timed_get(client, f'/api/search?q={rng.choice(QUERIES)}&limit=20') for _ in range(args.queries)]
+    ordered = sorted(latencies)
+    print(f"{len(latencies)} searches: p50 {ordered[len(ordered) // 2] * 1000:.1f} ms, "
+          f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:.1f} ms, mean {statistics.mean(latencies) * 1000:.1f} ms")
+
+    client.post('/api/items', json={'name': 'Refractometer', 'category': 'Equipment', 'totalQuantity': 1})
+    catch_up = timed_get(client, '/api/search?q=refractometer')
+    print(f"search after a write (index catches up): {catch_up * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
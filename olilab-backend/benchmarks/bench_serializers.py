@@ -0,0 +1,72 @@
+"""Compares legacy ORM `to_dict` serialization with the precompiled row serializers.
+
+Seeds N logs (100k by default) and reports rows/sec for:
+  * before: hydrate ORM objects, reflect over columns per row, encode with stdlib json
+  * after:  select column tuples, convert with LOG_ROW, encode with the fast encoder
+
+Usage: python -m benchmarks.bench_serializers [--rows 100000]
+"""
+import argparse
+import enum
+import json
+import os
+import time
+import uuid
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db, Log, LOG_ROW
+import serializers
+from benchmarks.datagen import seed_logs
+
+
+def legacy_log_dict(log):
+    """The reflection-based Log.to_dict this benchmark measures against."""
+    d = {c.name: getattr(log, c.name) for c in log.__table__.columns}
+    for key, value in d.items():
+        if isinstance(value, enum.Enum): d[key] = value.value
+        if isinstance(value, uuid.UUID): d[key] = str(value)
+    if 'timestamp' in d and hasattr(d['timestamp'], 'isoformat'):
+        d['timestamp'] = d['timestamp'].isoformat()
+    return {
+        'id': d['id'], 'userId': d['user_id'], 'itemId': d['item_id'], 'quantity': d['quantity'],
+        'timestamp': d['timestamp'], 'action': d['action'], 'status': d['status'],
+        'adminNotes': d['admin_notes'], 'relatedLogId': d['related_log_id'], 'returnRequested': d['return_requested']
+    }
+
+
+def timed(label, rows, fn):
+    db.session.expunge_all()
+    started = time.perf_counter()
+    payload = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8} {elapsed * 1000:9.1f} ms  {rows / elapsed:12,.0f} rows/sec  {len(payload):,} bytes")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_logs(args.rows)
+
+        def before():
+            logs = Log.query.order_by(Log.timestamp.desc()).all()
+            return json.dumps([legacy_log_dict(l) for l in logs]).encode('utf-8')
+
+        def after():
+            result = db.session.execute(db.select(*LOG_ROW.columns).order_by(Log.timestamp.desc()))
+            return serializers.dumps(LOG_ROW.rows(result))
+
+        print(f"Serializing {args.rows:,} logs ({'orjson' if serializers.orjson else 'stdlib json'} encoder)")
+        slow = timed('before', args.rows, before)
+        fast = timed('after', args.rows, after)
+        print(f"speedup  {slow / fast:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
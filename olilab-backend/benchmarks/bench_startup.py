@@ -0,0 +1,213 @@
+"""Startup benchmark: import time, time to first response and memory per worker.
+
+Measures a cold start the way the host does one, on a seeded SQLite file:
+
+  import   `import app` in a fresh interpreter (median of --runs), with the
+           slowest top-level imports from `python -X importtime`
+  create   create_app() right after that import
+  first    launching gunicorn with --workers workers until its first 200 on
+           GET /api/items: import, create_app, fork and the first query
+  memory   after a few requests, each worker's resident memory (RSS) and the
+           part of it no other process shares (USS, private pages)
+
+The server runs twice: with --preload, where the master builds the app once and
+forks it into the workers, and without, where every worker builds its own.
+Results can be saved as JSON (--save) and compared with an earlier run
+(--compare); anything slower or bigger by more than --threshold exits with
+status 1.
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--workers 4] [--save out.json]
+           [--compare baseline.json] [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+os.environ.setdefault('REPORT_WRITER', 'stub')
+
+from benchmarks.bench_endpoints import git_revision
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Differences smaller than these are noise, whatever the threshold says.
+NOISE_FLOOR = {'ms': 50, 'mb': 2}
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def python(*args, **kwargs):
+    return subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, env=os.environ.copy(),
+                          capture_output=True, text=True, check=True, **kwargs)
+
+
+def seed():
+    python('-W', 'ignore', '-c', 'import app\nwith (a := app.create_app()).app_context(): app.db.create_all()')
+
+
+def measure_import(runs):
+    imports, creates = [], []
+    for _ in range(runs):
+        imported, created = map(float, python('-W', 'ignore', '-c', IMPORT_SCRIPT).stdout.split()[-2:])
+        imports.append(imported * 1000)
+        creates.append(created * 1000)
+    return statistics.median(imports), statistics.median(creates)
+
+
+def heaviest_imports(count=5):
+    """The top-level imports of app.py with the most cumulative import time, in ms."""
+    stderr = python('-W', 'ignore', '-X', 'importtime', '-c', 'import app').stderr
+    parent = None
+    totals = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)', line)
+        if not match:
+            continue
+        depth = len(match.group(2)) // 2
+        if depth == 0 and match.group(3) == 'app':
+            parent = totals
+        elif depth == 1:
+            totals.append((int(match.group(1)) / 1000, match.group(3)))
+    # Children print before their parent, so only the lines before `app` belong to it.
+    return sorted(parent or totals, reverse=True)[:count]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(port, path):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=10) as response:
+        response.read()
+        return response.status
+
+
+def workers_of(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory_mb(pid):
+    """(RSS, USS) of a process in MB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def start_gunicorn(workers, preload):
+    """Launches gunicorn and returns (process, port, ms until its first 200)."""
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+               '--log-level', 'warning']
+    if preload:
+        command.append('--preload')
+    command.append('app:create_app()')
+    env = {**os.environ, 'GUNICORN_PRELOAD': '1' if preload else '0'}
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if get(port, '/api/items?limit=1') == 200:
+                return process, port, (time.perf_counter() - started) * 1000
+        except OSError:
+            pass
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit("gunicorn did not start.")
+        time.sleep(0.01)
+
+
+def measure_server(workers, preload, runs):
+    first_responses, rss, uss = [], [], []
+    for _ in range(runs):
+        process, port, first = start_gunicorn(workers, preload)
+        try:
+            first_responses.append(first)
+            for _ in range(workers * 10):
+                get(port, '/api/items?limit=50')
+            samples = [memory_mb(pid) for pid in workers_of(process.pid)]
+            rss.append(statistics.mean(r for r, _ in samples))
+            uss.append(statistics.mean(u for _, u in samples))
+        finally:
+            process.terminate()
+            process.wait()
+    return {'first_response_ms': statistics.median(first_responses),
+            'worker_rss_mb': statistics.median(rss), 'worker_uss_mb': statistics.median(uss)}
+
+
+def compare(results, baseline, threshold):
+    """Returns a description of each figure that got worse than in `baseline`."""
+    regressions = []
+    for name, value in results['figures'].items():
+        before = baseline['figures'].get(name)
+        if before is None:
+            continue
+        floor = NOISE_FLOOR['mb' if name.endswith('_mb') else 'ms']
+        if value - before > floor and value > before * (1 + threshold):
+            regressions.append(f"{name}: {before:.1f} -> {value:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed growth before flagging, e.g. 0.2 = 20%%')
+    args = parser.parse_args()
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        raise SystemExit("Memory figures need Linux's /proc/<pid>/smaps_rollup.")
+
+    seed()
+    figures = {}
+    figures['import_ms'], figures['create_app_ms'] = measure_import(args.runs)
+    print(f"import app       {figures['import_ms']:8.0f} ms")
+    print(f"create_app()     {figures['create_app_ms']:8.0f} ms")
+    print("heaviest imports: " + ', '.join(f"{name} {ms:.0f} ms" for ms, name in heaviest_imports()))
+    for mode, preload in (('fork', False), ('preload', True)):
+        server = measure_server(args.workers, preload, max(1, args.runs // 2))
+        for name, value in server.items():
+            figures[f'{mode}_{name}'] = value
+        print(f"{mode:<8} {args.workers} workers: first response {server['first_response_ms']:.0f} ms, "
+              f"per worker RSS {server['worker_rss_mb']:.1f} MB, private {server['worker_uss_mb']:.1f} MB")
+
+    results = {'meta': {'workers': args.workers, 'revision': git_revision(), 'python': sys.version.split()[0]},
+               'figures': figures}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"saved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"  [regression] {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Measures peak Python memory while serving /api/data and the log exports at growing log counts.
+
+The streamed responses should keep peak memory roughly flat as the table grows,
+while building the whole payload up front (the old behaviour) grows linearly.
+
+Usage: python -m benchmarks.bench_streaming [--sizes 10000 50000 100000]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app, db
+from benchmarks.datagen import seed_logs
+
+
+def measure(client, url):
+    """Consumes the response chunk by chunk and returns (peak bytes, body bytes, seconds)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 50_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'logs':>9} {'format':>12} {'peak MiB':>9} {'body MiB':>9} {'seconds':>8}")
+    for size in args.sizes:
+        app = create_app()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed_logs(size)
+        client = app.test_client()
+        for label, url in (('json', '/api/data?format=json'), ('ndjson', '/api/data?format=ndjson'),
+                           ('export csv', '/api/export/logs'), ('export xlsx', '/api/export/logs?format=xlsx')):
+            peak, body, elapsed = measure(client, url)
+            print(f"{size:>9,} {label:>12} {peak / 2**20:>9.1f} {body / 2**20:>9.1f} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
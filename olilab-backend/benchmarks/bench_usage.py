@@ -0,0 +1,109 @@
+"""Times the usage endpoints on the daily rollups against GROUP BYs over the logs, at growing log counts.
+
+For each size the lab keeps the same items and sections and only the history
+grows, so the rollups stay about the same size: the endpoints should take
+about the same time at every size, while the same rankings computed from the
+logs grow with them. `rebuild` is the one-off backfill of the rollups.
+
+Usage: python -m benchmarks.bench_usage [--sizes 10000 100000 500000] [--items 200] [--runs 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import (create_app, db, User, Item, Log, LogActionEnum, LogStatusEnum, UserStatusEnum,
+                 rebuild_usage_rollups)
+from benchmarks.datagen import CATEGORIES, SECTIONS, insert_batched
+
+USERS = 600
+QUERIES = {
+    'series': '/api/usage/series?interval=week',
+    'series item': '/api/usage/series?itemId={item_id}',
+    'top items': '/api/usage/top?metric=requests',
+    'top sections': '/api/usage/top?by=sections',
+}
+
+
+def seed(logs, items, rng):
+    """Seeds `items` items, USERS users across the SECTIONS and `logs` borrows over the past year."""
+    user_ids = [uuid.uuid4() for _ in range(USERS)]
+    insert_batched(User, ({
+        'id': user_id, 'username': f'user{n}', 'full_name': f'User {n}', 'email': f'user{n}@bench.olilab.app',
+        'password_hash': 'x', 'section': SECTIONS[n % len(SECTIONS)], 'status': UserStatusEnum.APPROVED,
+    } for n, user_id in enumerate(user_ids)))
+    item_ids = [uuid.uuid4() for _ in range(items)]
+    insert_batched(Item, ({
+        'id': item_id, 'name': f'Item {n}', 'category': CATEGORIES[n % len(CATEGORIES)],
+        'total_quantity': 1_000, 'available_quantity': 1_000,
+    } for n, item_id in enumerate(item_ids)))
+    now = datetime.now(timezone.utc)
+    statuses = (LogStatusEnum.RETURNED, LogStatusEnum.RETURNED, LogStatusEnum.DENIED)
+    insert_batched(Log, ({
+        'id': uuid.uuid4(), 'user_id': rng.choice(user_ids), 'item_id': rng.choice(item_ids),
+        'quantity': rng.randint(1, 3), 'timestamp': now - timedelta(minutes=rng.randrange(525_600)),
+        'action': LogActionEnum.BORROW, 'status': rng.choice(statuses), 'return_requested': False,
+    } for _ in range(logs)))
+    db.session.commit()
+    return item_ids
+
+
+def from_logs(by):
+    """The /api/usage/top ranking for the last 90 days computed from the logs instead."""
+    since = datetime.now(timezone.utc) - timedelta(days=90)
+    key = Log.item_id if by == 'items' else User.section
+    query = db.select(key, db.func.count(Log.id).label('requests')).where(
+        Log.action == LogActionEnum.BORROW, Log.timestamp >= since)
+    if by == 'sections':
+        query = query.join(User, User.id == Log.user_id)
+    db.session.execute(query.group_by(key).order_by(db.desc('requests')).limit(10)).all()
+
+
+def median_ms(call, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    labels = ['rebuild', *QUERIES, 'logs: top items', 'logs: top sections']
+    print(f"{'logs':>9} {'rollup rows':>12} " + ' '.join(f"{label:>18}" for label in labels) + "   (median ms)")
+    for size in args.sizes:
+        app = create_app()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            item_ids = seed(size, args.items, random.Random(size))
+            started = time.perf_counter()
+            rebuild_usage_rollups()
+            db.session.commit()
+            timings = [(time.perf_counter() - started) * 1000]
+            rows = db.session.execute(db.text(
+                "SELECT (SELECT count(*) FROM item_usage_daily) + (SELECT count(*) FROM section_usage_daily)"
+            )).scalar()
+        client = app.test_client()
+        for label, url in QUERIES.items():
+            url = url.format(item_id=item_ids[0])
+            timings.append(median_ms(lambda: client.get(url).close(), args.runs))
+        with app.app_context():
+            for by in ('items', 'sections'):
+                timings.append(median_ms(lambda: from_logs(by), max(1, args.runs // 4)))
+        print(f"{size:>9,} {rows:>12,} " + ' '.join(f"{ms:>18.1f}" for ms in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Synthetic data for the benchmarks, inserted with core executemany for speed."""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app import (db, User, Item, Log, Suggestion, Comment, Notification, LogActionEnum, LogStatusEnum,
+                 UserStatusEnum, UserRoleEnum, SuggestionTypeEnum, SuggestionStatusEnum, rebuild_outstanding_loans,
+                 rebuild_usage_rollups)
+
+BATCH_SIZE = 10_000
+
+# Dataset sizes for `seed_scale`. Every seeded account uses BENCH_PASSWORD.
+SCALES = {
+    'tiny': {'users': 100, 'items': 50, 'logs': 2_000},
+    'small': {'users': 1_000, 'items': 5_000, 'logs': 100_000},
+    'medium': {'users': 10_000, 'items': 5_000, 'logs': 100_000},
+    'large': {'users': 10_000, 'items': 5_000, 'logs': 1_000_000},
+}
+BENCH_PASSWORD = 'password'
+BULK_LOG_BATCH = 10
+CATEGORIES = ('Glassware', 'Chemicals', 'Equipment', 'Consumables', 'Safety')
+SECTIONS = ('Curie', 'Darwin', 'Einstein', 'Faraday', 'Newton', 'Pasteur')
+
+
+def insert_batched(model, rows):
+    """Inserts an iterable of row dicts in fixed-size executemany batches."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+
+
+def seed_logs(rows):
+    """Creates one user and one item with `rows` borrow logs between them."""
+    user_id, item_id = uuid.uuid4(), uuid.uuid4()
+    db.session.execute(db.insert(User).values(
+        id=user_id, username='bench', full_name='Bench User', email='bench@olilab.app',
+        password_hash='x', status=UserStatusEnum.APPROVED))
+    db.session.execute(db.insert(Item).values(
+        id=item_id, name='Beaker', category='Glassware', total_quantity=10, available_quantity=10))
+    start = datetime(2025, 6, 1)
+    statuses = list(LogStatusEnum)
+    insert_batched(Log, ({
+        'id': uuid.uuid4(), 'user_id': user_id, 'item_id': item_id, 'quantity': 1,
+        'timestamp': start + timedelta(minutes=n), 'action': LogActionEnum.BORROW,
+        'status': random.choice(statuses), 'return_requested': False,
+    } for n in range(rows)))
+    db.session.commit()
+
+
+def seed_scale(scale, pool_size, password_hash, seed=0):
+    """Seeds a whole lab at one of the SCALES, plus fresh targets for write routes.
+
+    The history (users, items, closed loans, suggestions, comments) is sized by
+    the scale. Routes that consume their target, such as approving a pending
+    request or deleting a user, each get a private pool of `pool_size` rows so
+    every benchmark request succeeds. Returns the ids the requests need.
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    pools = {}
+
+    def users(prefix, count, status=UserStatusEnum.APPROVED, **values):
+        rows = [{
+            'id': uuid.uuid4(), 'username': f'{prefix}{n}', 'full_name': f'{prefix.title()} {n}',
+            'email': f'{prefix}{n}@bench.olilab.app', 'password_hash': password_hash, 'status': status,
+            'section': SECTIONS[n % len(SECTIONS)], 'role': UserRoleEnum.Member, 'is_admin': False, **values,
+        } for n in range(count)]
+        insert_batched(User, rows)
+        return [row['id'] for row in rows]
+
+    admin_id = users('admin', 1, role=UserRoleEnum.Admin, is_admin=True)[0]
+    member_ids = users('member', sizes['users'])
+    pools['approve_user'] = users('pendinga', pool_size, UserStatusEnum.PENDING)
+    pools['deny_user'] = users('pendingd', pool_size, UserStatusEnum.PENDING)
+    pools['delete_user'] = users('leaver', pool_size)
+
+    def items(prefix, count, quantity):
+        rows = [{
+            'id': uuid.uuid4(), 'name': f'{prefix} {n}', 'category': CATEGORIES[n % len(CATEGORIES)],
+            'total_quantity': quantity, 'available_quantity': quantity,
+        } for n in range(count)]
+        insert_batched(Item, rows)
+        return [row['id'] for row in rows]
+
+    item_ids = items('Item', sizes['items'], 1_000)
+    pools['delete_item'] = items('Surplus', pool_size, 1)
+
+    # Closed history spread over the past year; none of it holds stock.
+    history = (LogStatusEnum.RETURNED, LogStatusEnum.DENIED)
+    insert_batched(Log, ({
+        'id': uuid.uuid4(), 'user_id': rng.choice(member_ids), 'item_id': rng.choice(item_ids), 'quantity': 1,
+        'timestamp': now - timedelta(minutes=rng.randrange(525_600)), 'action': LogActionEnum.BORROW,
+        'status': rng.choice(history), 'return_requested': False,
+    } for _ in range(sizes['logs'])))
+
+    # Open requests and loans all point at one well-stocked item, two pools of them on loan.
+    bench_item_id = uuid.uuid4()
+    stock = 1_000_000_000
+    db.session.execute(db.insert(Item).values(
+        id=bench_item_id, name='Bench Beaker', category='Glassware', total_quantity=stock,
+        available_quantity=stock - 2 * pool_size))
+    def logs(count, status):
+        rows = [{
+            'id': uuid.uuid4(), 'user_id': rng.choice(member_ids), 'item_id': bench_item_id, 'quantity': 1,
+            'timestamp': now - timedelta(seconds=n), 'action': LogActionEnum.BORROW, 'status': status,
+            'return_requested': False,
+        } for n in range(count)]
+        insert_batched(Log, rows)
+        return [row['id'] for row in rows]
+
+    pools['approve_log'] = logs(pool_size, LogStatusEnum.PENDING)
+    pools['deny_log'] = logs(pool_size, LogStatusEnum.PENDING)
+    pools['bulk_log'] = logs(pool_size * BULK_LOG_BATCH, LogStatusEnum.PENDING)
+    pools['batch_log'] = logs(pool_size * BULK_LOG_BATCH, LogStatusEnum.PENDING)
+    pools['request_return'] = logs(pool_size, LogStatusEnum.APPROVED)
+    pools['return_log'] = logs(pool_size, LogStatusEnum.APPROVED)
+    rebuild_outstanding_loans()
+    rebuild_usage_rollups()
+
+    def suggestions(count, status, type):
+        rows = [{
+            'id': uuid.uuid4(), 'user_id': rng.choice(member_ids), 'type': type, 'status': status,
+            'title': f'Suggestion {uuid.uuid4().hex[:8]}', 'description': 'Generated for benchmarks.',
+            'timestamp': now - timedelta(minutes=rng.randrange(525_600)),
+        } for _ in range(count)]
+        insert_batched(Suggestion, rows)
+        return [row['id'] for row in rows]
+
+    suggestion_ids = suggestions(max(sizes['users'] // 10, 1), SuggestionStatusEnum.APPROVED, SuggestionTypeEnum.ITEM)
+    pools['approve_item_suggestion'] = suggestions(pool_size, SuggestionStatusEnum.PENDING, SuggestionTypeEnum.ITEM)
+    pools['approve_feature_suggestion'] = suggestions(pool_size, SuggestionStatusEnum.PENDING, SuggestionTypeEnum.FEATURE)
+    pools['deny_suggestion'] = suggestions(pool_size, SuggestionStatusEnum.PENDING, SuggestionTypeEnum.ITEM)
+    insert_batched(Comment, ({
+        'id': uuid.uuid4(), 'user_id': rng.choice(member_ids), 'suggestion_id': rng.choice(suggestion_ids),
+        'text': 'Generated for benchmarks.', 'timestamp': now - timedelta(minutes=rng.randrange(525_600)),
+    } for _ in range(len(suggestion_ids) * 2)))
+
+    notification_rows = [{
+        'id': uuid.uuid4(), 'user_id': admin_id, 'message': 'Generated for benchmarks.', 'type': 'new_user',
+        'read': False, 'timestamp': now - timedelta(seconds=n),
+    } for n in range(pool_size * 10)]
+    insert_batched(Notification, notification_rows)
+    pools['read_notifications'] = [row['id'] for row in notification_rows]
+    db.session.commit()
+
+    return {
+        'admin_id': admin_id, 'member_ids': member_ids, 'item_ids': item_ids, 'bench_item_id': bench_item_id,
+        'suggestion_ids': suggestion_ids, 'pools': pools,
+    }
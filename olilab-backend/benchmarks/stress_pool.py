@@ -0,0 +1,177 @@
+"""Load test for connection pooling: N workers x M concurrent requests, no exhaustion.
+
+Starts gunicorn with --workers processes of --threads threads each, sized with
+the DB_* pool settings given here. M client threads then send a mix of reads
+and writes for --duration seconds. The test fails if any request gets a 5xx
+(a pool timeout answers 503). On Postgres it also samples pg_stat_activity and
+fails if the app ever held more connections than its budget.
+
+After the run it scrapes /metrics a few times, from whichever workers answer,
+and prints the pool's checkout waits and its peak use.
+
+Uses a temporary SQLite file unless DATABASE_URL is set. A Postgres database is
+dropped and re-seeded, so point it at a scratch database.
+
+Usage: python -m benchmarks.stress_pool [--workers 4] [--threads 8] [--concurrency 64] [--duration 20]
+           [--pool-size 2] [--max-overflow 2] [--pool-timeout 10] [--max-connections N]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'pool.db')
+os.environ.setdefault('REPORT_WRITER', 'stub')
+
+from app import create_app, db, passwords
+from benchmarks.bench_endpoints import start_server
+from benchmarks.datagen import BENCH_PASSWORD, seed_scale
+
+
+def requests_for(fixtures):
+    """Yields (method, path, body) forever: mostly reads, one borrow request in five."""
+    members, items = fixtures['member_ids'], fixtures['item_ids']
+    n = 0
+    while True:
+        n += 1
+        member, item = members[n % len(members)], items[n % len(items)]
+        yield from (
+            ('GET', '/api/items?limit=50', None),
+            ('GET', f'/api/logs?limit=50&userId={member}', None),
+            ('GET', f'/api/users/{member}/borrows', None),
+            ('GET', '/api/data?since=0', None),
+            ('POST', '/api/logs/borrow', {'itemId': str(item), 'userId': str(member), 'quantity': 1}),
+        )
+
+
+def sample_connections(engine, stop, peak):
+    """Tracks the most Postgres backends connected to this database at once, this sampler excluded."""
+    with engine.connect() as connection:
+        while not stop.is_set():
+            count = connection.exec_driver_sql(
+                "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            ).scalar()
+            peak[0] = max(peak[0], count)
+            connection.rollback()
+            time.sleep(0.1)
+
+
+def scrape(port, names):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=30) as response:
+        text = response.read().decode()
+    values = {}
+    for name in names:
+        match = re.search(rf'^{name} (\S+)$', text, re.MULTILINE)
+        values[name] = float(match.group(1)) if match else None
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='request threads per worker')
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--max-overflow', type=int, default=2)
+    parser.add_argument('--pool-timeout', type=int, default=10)
+    parser.add_argument('--max-connections', type=int, help='DB_MAX_CONNECTIONS budget for all workers')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'WEB_CONCURRENCY': str(args.workers), 'DB_POOL_SIZE': str(args.pool_size),
+        'DB_MAX_OVERFLOW': str(args.max_overflow), 'DB_POOL_TIMEOUT': str(args.pool_timeout),
+    })
+    if args.max_connections:
+        os.environ['DB_MAX_CONNECTIONS'] = str(args.max_connections)
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fixtures = seed_scale('tiny', 10, passwords.hash(BENCH_PASSWORD))
+        postgres = db.engine.dialect.name == 'postgresql'
+        engine = db.engine
+    engine.dispose()  # Only the server's connections should count.
+    per_worker = app.config['DB_POOL_SIZE'] + app.config['DB_MAX_OVERFLOW']
+    # Each worker may also hold its live-event LISTEN connection.
+    budget = args.workers * (per_worker + (1 if postgres else 0))
+    print(f"{args.workers} workers x {args.threads} threads, {args.concurrency} clients, {args.duration:.0f}s; "
+          f"pool {app.config['DB_POOL_SIZE']}+{app.config['DB_MAX_OVERFLOW']} per worker, "
+          f"at most {budget} connections")
+
+    server, driver = start_server(args.workers, args.threads)
+    port = driver.port
+    statuses, latencies, lock = Counter(), [], threading.Lock()
+    stop, peak = threading.Event(), [0]
+    sampler = None
+    if postgres:
+        sampler = threading.Thread(target=sample_connections, args=(engine, stop, peak))
+        sampler.start()
+
+    def client(offset):
+        calls = requests_for(fixtures)
+        for _ in range(offset):
+            next(calls)
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            method, path, body = next(calls)
+            started = time.perf_counter()
+            try:
+                status = driver.send(method, path, body)
+            except OSError:
+                status = 'connection error'
+            with lock:
+                statuses[status] += 1
+                latencies.append(time.perf_counter() - started)
+
+    try:
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        if sampler is not None:
+            sampler.join()
+        scrapes = [scrape(port, ('olilab_db_pool_checkout_seconds_sum', 'olilab_db_pool_checkout_seconds_count',
+                                 'olilab_db_pool_timeouts_total', 'olilab_db_pool_checked_out_peak'))
+                   for _ in range(args.workers * 3)]
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(statuses.values())
+    latencies.sort()
+    print(f"{total} requests, {total / args.duration:.0f} req/s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print("statuses: " + ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str)))
+    waits = [s['olilab_db_pool_checkout_seconds_sum'] / s['olilab_db_pool_checkout_seconds_count']
+             for s in scrapes if s['olilab_db_pool_checkout_seconds_count']]
+    if waits:
+        print(f"pool (per scraped worker): mean checkout {max(waits) * 1000:.2f} ms at worst, "
+              f"peak {max(s['olilab_db_pool_checked_out_peak'] or 0 for s in scrapes):.0f}/{per_worker} connections, "
+              f"{max(s['olilab_db_pool_timeouts_total'] or 0 for s in scrapes):.0f} timeouts")
+
+    failures = []
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 500)
+    if errors:
+        failures.append(f"{errors} requests failed with a 5xx or a dropped connection")
+    if postgres:
+        print(f"postgres: at most {peak[0]} connections at once")
+        if peak[0] > budget:
+            failures.append(f"the app held {peak[0]} connections, over its budget of {budget}")
+    for failure in failures:
+        print(f"  [fail] {failure}")
+    if failures:
+        sys.exit(1)
+    print("No connection exhaustion.")
+
+
+if __name__ == '__main__':
+    main()
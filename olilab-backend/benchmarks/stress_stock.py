@@ -0,0 +1,132 @@
+"""Concurrency stress test for stock reservation, approvals and returns.
+
+Fires hundreds of parallel approvals at a single scarce item, then submits
+every return twice at once, and checks that stock was never oversold, no
+loan was returned twice and the outstanding-loan counters and usage rollups
+agree with the logs. Exits non-zero if an invariant is violated.
+
+Uses a temporary SQLite file unless DATABASE_URL points at a local Postgres.
+
+Usage: python -m benchmarks.stress_stock [--requests 300] [--stock 50] [--threads 32]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+
+from app import (create_app, db, User, Item, Log, OutstandingLoan, ItemUsageDaily, LogActionEnum, LogStatusEnum,
+                 UserStatusEnum)
+
+
+def seed(requests, stock):
+    user = User(username=f'stress-{uuid.uuid4().hex[:8]}', full_name='Stress Tester',
+                email=f'{uuid.uuid4().hex[:8]}@olilab.app', password_hash='x', status=UserStatusEnum.APPROVED)
+    item = Item(name='Scarce Beaker', category='Glassware', total_quantity=stock, available_quantity=stock)
+    db.session.add_all([user, item])
+    db.session.flush()
+    logs = [Log(user_id=user.id, item_id=item.id, quantity=1 + n % 3,
+                action=LogActionEnum.BORROW, status=LogStatusEnum.PENDING) for n in range(requests)]
+    db.session.add_all(logs)
+    db.session.commit()
+    return user.id, item.id, [log.id for log in logs]
+
+
+def fire(app, threads, calls):
+    """Runs (method, url, json) calls in parallel and returns a Counter of status codes."""
+    def call(spec):
+        method, url, body = spec
+        return app.test_client().open(url, method=method, json=body).status_code
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return Counter(pool.map(call, calls))
+
+
+def outstanding(user_id, item_id):
+    counter = db.session.get(OutstandingLoan, (user_id, item_id))
+    return (counter.loans, counter.quantity) if counter else (0, 0)
+
+
+def usage(item_id):
+    """An item's (borrows, returns, borrowed units, returned units) summed over every day."""
+    columns = (ItemUsageDaily.borrows, ItemUsageDaily.returns, ItemUsageDaily.borrowed_quantity,
+               ItemUsageDaily.returned_quantity)
+    return tuple(db.session.execute(
+        db.select(*[db.func.coalesce(db.func.sum(column), 0) for column in columns])
+        .where(ItemUsageDaily.item_id == item_id)
+    ).one())
+
+
+def check(failures, condition, message):
+    print(f"  [{'ok' if condition else 'FAIL'}] {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user_id, item_id, log_ids = seed(args.requests, args.stock)
+
+    failures = []
+    # Every approval is sent twice so duplicate clicks race each other as well.
+    approvals = [('POST', f'/api/logs/{log_id}/approve', None) for log_id in log_ids * 2]
+    print(f"Approving {args.requests} requests (x2) against stock of {args.stock} with {args.threads} threads")
+    print(f"  responses: {dict(fire(app, args.threads, approvals))}")
+
+    with app.app_context():
+        item = db.session.get(Item, item_id)
+        approved = Log.query.filter_by(item_id=item_id, status=LogStatusEnum.APPROVED).all()
+        lent = sum(log.quantity for log in approved)
+        check(failures, item.available_quantity >= 0, f"available never negative ({item.available_quantity})")
+        check(failures, item.total_quantity - item.available_quantity == lent,
+              f"stock matches approved loans ({item.total_quantity - item.available_quantity} == {lent})")
+        check(failures, outstanding(user_id, item_id) == (len(approved), lent),
+              f"loan counters match approved loans ({outstanding(user_id, item_id)} == {(len(approved), lent)})")
+        approved_ids = [log.id for log in approved]
+
+    returns = [('POST', '/api/logs/return', {'borrowLog': {'id': str(log_id)}}) for log_id in approved_ids * 2]
+    print(f"Returning {len(approved_ids)} loans, each submitted twice")
+    print(f"  responses: {dict(fire(app, args.threads, returns))}")
+
+    with app.app_context():
+        item = db.session.get(Item, item_id)
+        return_counts = Counter(
+            log.related_log_id for log in Log.query.filter_by(item_id=item_id, action=LogActionEnum.RETURN)
+        )
+        still_out = Log.query.filter_by(item_id=item_id, status=LogStatusEnum.APPROVED).count()
+        returned_quantity = sum(
+            log.quantity for log in Log.query.filter_by(item_id=item_id, action=LogActionEnum.RETURN)
+        )
+        check(failures, all(count == 1 for count in return_counts.values()), "no loan returned twice")
+        check(failures, item.available_quantity <= item.total_quantity,
+              f"available never exceeds total ({item.available_quantity} <= {item.total_quantity})")
+        check(failures, item.total_quantity - item.available_quantity ==
+              sum(log.quantity for log in Log.query.filter_by(item_id=item_id, status=LogStatusEnum.APPROVED)),
+              f"stock matches loans still out ({still_out} outstanding, {returned_quantity} units returned)")
+        check(failures, outstanding(user_id, item_id)[0] == still_out,
+              f"loan counters match loans still out ({outstanding(user_id, item_id)[0]} == {still_out})")
+        returned = sum(return_counts.values())
+        expected = (len(approved_ids), returned, lent, returned_quantity)
+        check(failures, usage(item_id) == expected,
+              f"usage rollups count each approval and return once ({usage(item_id)} == {expected})")
+
+    if failures:
+        print(f"{len(failures)} invariant(s) violated")
+        sys.exit(1)
+    print("All invariants hold")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Read-through cache for the OliLab API.
+
+`ReadCache` keeps recently read rows and assembled response sections in
+process memory, with a TTL and LRU eviction. It never guesses what is stale.
+The app moves it forward along the delta-sync change versions and drops
+exactly the entries whose rows changed. So every gunicorn worker picks up
+every other worker's writes on its next request, with no cross-process
+messaging.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+STAT_EVENTS = ('hits', 'misses', 'stores', 'rejected', 'evictions', 'expirations', 'invalidations')
+
+
+class ReadCache:
+    """An LRU cache with a TTL whose entries are invalidated by change version.
+
+    Entries are keyed by (namespace, key), e.g. ('items', item_id). A value is
+    only stored if it was read at the version the cache currently reflects,
+    so a slow reader can never put back a row that a newer change has
+    already invalidated.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300.0, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.version = None
+        self._entries = OrderedDict()  # (namespace, key) -> (value, expires_at)
+        self._stats = {}  # namespace -> {event: count}
+        self._lock = threading.Lock()
+        # Held while the cache catches up to a new version, so only one thread does it.
+        self.advance_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, namespace, event, amount=1):
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = dict.fromkeys(STAT_EVENTS, 0)
+        stats[event] += amount
+
+    def get(self, namespace, key):
+        """Returns the cached value, or MISSING."""
+        if not self.enabled:
+            return MISSING
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[(namespace, key)]
+                self._count(namespace, 'expirations')
+                entry = None
+            if entry is None:
+                self._count(namespace, 'misses')
+                return MISSING
+            self._entries.move_to_end((namespace, key))
+            self._count(namespace, 'hits')
+            return entry[0]
+
+    def put(self, namespace, key, value, version):
+        """Stores a value read at `version`; dropped if the cache has moved past it."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self.version:
+                self._count(namespace, 'rejected')
+                return
+            self._entries[(namespace, key)] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end((namespace, key))
+            self._count(namespace, 'stores')
+            while len(self._entries) > self.max_entries:
+                (evicted, _), _ = self._entries.popitem(last=False)
+                self._count(evicted, 'evictions')
+
+    def advance(self, version, changed):
+        """Moves the cache to `version`, dropping the entries in `changed`.
+
+        `changed` is an iterable of (namespace, key) pairs, or None to drop
+        everything (the first sync, or too many changes to list). A key of None
+        drops the whole namespace.
+        """
+        with self._lock:
+            if changed is None:
+                for namespace, _ in self._entries:
+                    self._count(namespace, 'invalidations')
+                self._entries.clear()
+            else:
+                for namespace, key in changed:
+                    if key is None:
+                        doomed = [k for k in self._entries if k[0] == namespace]
+                    else:
+                        doomed = [(namespace, key)] if (namespace, key) in self._entries else []
+                    for k in doomed:
+                        del self._entries[k]
+                    self._count(namespace, 'invalidations', len(doomed))
+            self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+    def stats(self):
+        """Returns {namespace: {event: count}} plus the entry count and settings."""
+        with self._lock:
+            namespaces = {namespace: dict(stats) for namespace, stats in self._stats.items()}
+            entries = len(self._entries)
+        return {"enabled": self.enabled, "entries": entries, "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl, "version": self.version, "namespaces": namespaces}
+
+    def render(self):
+        """Prometheus lines for /metrics."""
+        name = 'olilab_read_cache_events_total'
+        lines = [f'# HELP {name} Read cache lookups and maintenance, by namespace.', f'# TYPE {name} counter']
+        for namespace, stats in sorted(self.stats()["namespaces"].items()):
+            lines.extend(f'{name}{{namespace="{namespace}",event="{event}"}} {count}'
+                         for event, count in stats.items())
+        lines += ['# HELP olilab_read_cache_entries Entries held in the read cache.',
+                  '# TYPE olilab_read_cache_entries gauge', f'olilab_read_cache_entries {len(self)}']
+        return lines
@@ -0,0 +1,153 @@
+"""Server-Sent Events for the OliLab API.
+
+Routes queue events while they work and nothing is sent until the transaction
+commits. Each server process has one `EventBroadcaster` that hands events to
+the SSE clients connected to it. On Postgres, events go out with NOTIFY
+instead, which the database only delivers on commit. Every gunicorn worker
+then picks them up over a single LISTEN connection, so a client gets its
+events no matter which worker served the change. Under the ASGI server,
+streams wait on an `AsyncSubscription` on the event loop instead of holding
+a thread each.
+"""
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+CHANNEL = 'olilab_events'
+# The Postgres drivers the LISTEN relay can read notifications from.
+LISTEN_DRIVERS = ('psycopg2', 'psycopg')
+
+
+def format_sse(event, data):
+    """Encodes one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class AsyncSubscription:
+    """A subscriber's queue for an asyncio task. Events may be published from any thread."""
+
+    def __init__(self, size):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(size)
+
+    def put_nowait(self, payload):
+        try:
+            self._loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:  # The loop has shut down.
+            pass
+
+    def _put(self, payload):
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        """Waits for the next event; raises TimeoutError after `timeout` seconds."""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class EventBroadcaster:
+    """Fans events out to the SSE clients connected to this process.
+
+    Every event is a dict with the recipient's `userId`, an `event` name and its
+    `data`. Each client gets a bounded queue. A client that stops reading loses
+    events instead of holding up everyone else, and it can refetch the
+    persisted notifications when it reconnects.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def subscribe(self, user_id):
+        return self._add(user_id, queue.Queue(self.queue_size))
+
+    def subscribe_async(self, user_id):
+        """Subscribes from a coroutine; the events arrive on its event loop."""
+        return self._add(user_id, AsyncSubscription(self.queue_size))
+
+    def _add(self, user_id, subscription):
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, payload):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(payload['userId'], ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(payload)
+            except queue.Full:
+                pass
+
+    def listen(self, engine):
+        """Starts relaying Postgres NOTIFY messages into this broadcaster.
+
+        Safe to call on every request. Threads do not survive fork, so each
+        server worker starts its own listener the first time a client connects.
+        The engine must use one of the LISTEN_DRIVERS.
+        """
+        pid = os.getpid()
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+        threading.Thread(target=self._listen, args=(engine,), name='event-listener', daemon=True).start()
+
+    def _listen(self, engine):
+        while True:
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach() # This connection lives for the whole process; keep it out of the pool.
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                if engine.dialect.driver == 'psycopg':
+                    self._relay_psycopg(connection)
+                else:
+                    self._relay_psycopg2(connection)
+            except Exception as e:
+                print(f"Event listener lost its connection, reconnecting: {e}")
+                time.sleep(5)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def _relay_psycopg2(self, connection):
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                self.publish(json.loads(connection.notifies.pop(0).payload))
+
+    def _relay_psycopg(self, connection):
+        # psycopg 3 hands notifications out from a generator that blocks until
+        # the next one arrives and raises once the connection is lost.
+        for notify in connection.notifies():
+            self.publish(json.loads(notify.payload))
+        raise ConnectionError("the notification stream ended")
@@ -0,0 +1,35 @@
+"""Gunicorn settings for the OliLab API, picked up from this directory by `gunicorn "app:create_app()"`.
+
+The master imports app.py and builds the app once, then forks the workers
+from it: a worker starts in milliseconds instead of repeating the import, and
+the workers share the imported code's memory until they write to it. Set
+GUNICORN_PRELOAD=0 to have each worker build its own app instead, e.g. so that
+`kill -HUP` on the master picks up new code.
+
+Workers are threaded (gthread, GUNICORN_THREADS threads each). A signed-in
+browser keeps a live notification stream open, which holds a thread for as
+long as it stays; with the sync worker class it would hold the whole worker,
+and gunicorn would kill it as timed out. The app keeps at most half of each
+worker's threads for streams (EVENTS_MAX_STREAMS), so requests always have
+room.
+
+Each worker builds its search index in the background as it starts.
+"""
+import gc
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+
+def when_ready(server):
+    # Move everything built so far out of the collector's reach. A collection in
+    # a worker would otherwise write to those objects and unshare their pages.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Build the search index before searches arrive instead of in the first one.
+    from app import warm_search_index
+    warm_search_index(worker.wsgi)
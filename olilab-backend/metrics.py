@@ -0,0 +1,283 @@
+"""Request and database instrumentation for the OliLab API.
+
+`Metrics` times every request by route and counts the SQL statements it runs
+and the time spent in them, using SQLAlchemy engine events. It logs slow
+statements with their parameters left out, and times calls to outside
+services such as Gemini. Everything is exposed in the Prometheus text format
+on /metrics.
+
+Metrics live in process memory, so each gunicorn worker reports only the
+requests it served. Scrape each worker, or sum across scrapes, when running
+more than one.
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+EXTERNAL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class Histogram:
+    """A Prometheus histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, label_names, buckets):
+        self.name, self.help = name, help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le="+Inf")} {cumulative + counts[-1]}')
+            lines.append(f'{self.name}_sum{base} {total}')
+            lines.append(f'{self.name}_count{base} {cumulative + counts[-1]}')
+        return lines
+
+
+class Counter:
+    """A Prometheus counter keyed by a tuple of label values."""
+
+    def __init__(self, name, help, label_names=()):
+        self.name, self.help = name, help
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.label_names, labels)} {value}' for labels, value in values)
+        return lines
+
+
+class PoolMonitor:
+    """Reports the database connection pool: checkout waits, timeouts and how full it is.
+
+    storage.MonitoredQueuePool feeds it checkouts. `limit` is the pool's size
+    plus overflow, the most connections this worker will ever open.
+    """
+
+    def __init__(self):
+        self.limit = 0
+        self.engine = None
+        self.peak = 0
+        self.checkout_wait = Histogram(
+            'olilab_db_pool_checkout_seconds', 'Time to get a pooled connection, including any wait for a free one.',
+            (), POOL_WAIT_BUCKETS)
+        self.timeouts = Counter(
+            'olilab_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection (answered 503).')
+
+    def observe_checkout(self, pool, seconds):
+        self.checkout_wait.observe((), seconds)
+        checked_out = pool.checkedout()
+        if checked_out > self.peak:
+            self.peak = checked_out
+
+    def observe_timeout(self, pool, seconds):
+        self.timeouts.inc()
+        print(f"Timed out after {seconds:.1f}s waiting for a database connection; all {self.limit} are in use. "
+              f"Raise DB_POOL_SIZE/DB_MAX_OVERFLOW or add workers within DB_MAX_CONNECTIONS.")
+
+    def stats(self):
+        pool = self.engine.pool if self.engine is not None else None
+        checked_out = pool.checkedout() if pool is not None else 0
+        return {"size": pool.size() if pool is not None else 0, "checkedOut": checked_out,
+                "overflow": pool.overflow() if pool is not None else 0, "limit": self.limit, "peak": self.peak,
+                "saturation": checked_out / self.limit if self.limit else 0.0}
+
+    def render(self):
+        lines = self.checkout_wait.render() + self.timeouts.render()
+        stats = self.stats()
+        for key, name, help in (('checkedOut', 'checked_out', 'Connections in use right now.'),
+                                ('peak', 'checked_out_peak', 'Most connections in use at once since start.'),
+                                ('limit', 'limit', 'Pool size plus overflow: the most connections this worker opens.'),
+                                ('saturation', 'saturation', 'Connections in use as a share of the limit.')):
+            lines += [f'# HELP olilab_db_pool_{name} {help}', f'# TYPE olilab_db_pool_{name} gauge',
+                      f'olilab_db_pool_{name} {stats[key]}']
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def redact_statement(statement, parameters):
+    """Returns a one-line statement for the log, mentioning but never showing its parameters.
+
+    Statements reach the engine with placeholders, so only the parameters ever
+    carry user data (names, emails, password hashes).
+    """
+    text = _WHITESPACE.sub(' ', statement).strip()
+    if len(text) > 1000:
+        text = text[:1000] + '...'
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f'{text} [{len(parameters)} parameter sets redacted]'
+    count = len(parameters) if parameters else 0
+    return f'{text} [{count} parameters redacted]' if count else text
+
+
+class Metrics:
+    """Flask extension that records request, SQL and external-call metrics.
+
+    Configuration:
+      METRICS_ENABLED     serve /metrics and record metrics (default on; 0 turns it off)
+      METRICS_TOKEN       if set, /metrics and the stats views require
+                          `Authorization: Bearer <token>`
+      SLOW_QUERY_MS       log statements slower than this (default 250)
+      QUERY_COUNT_HEADER  1 adds X-Query-Count and X-DB-Time-Ms to responses (for development)
+    """
+
+    def __init__(self, app=None, db=None):
+        self.request_duration = Histogram(
+            'olilab_http_request_duration_seconds', 'Time to handle a request, by route.',
+            ('method', 'route'), LATENCY_BUCKETS)
+        self.requests = Counter(
+            'olilab_http_requests_total', 'Requests handled, by route and status.', ('method', 'route', 'status'))
+        self.request_queries = Histogram(
+            'olilab_http_request_queries', 'SQL statements run per request, by route.',
+            ('method', 'route'), QUERY_COUNT_BUCKETS)
+        self.request_db_time = Histogram(
+            'olilab_http_request_db_seconds', 'Time spent in SQL per request, by route.',
+            ('method', 'route'), LATENCY_BUCKETS)
+        self.queries = Counter('olilab_db_queries_total', 'SQL statements run, including background work.')
+        self.slow_queries = Counter('olilab_db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.')
+        self.external_duration = Histogram(
+            'olilab_external_call_duration_seconds', 'Calls to outside services such as Gemini.',
+            ('service', 'outcome'), EXTERNAL_BUCKETS)
+        self.slow_query_seconds = 0.25
+        self.enabled = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('METRICS_ENABLED', os.getenv('METRICS_ENABLED', '1') != '0')
+        app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))
+        app.config.setdefault('SLOW_QUERY_MS', float(os.getenv('SLOW_QUERY_MS', 250)))
+        app.config.setdefault('QUERY_COUNT_HEADER', os.getenv('QUERY_COUNT_HEADER', '0') == '1')
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+        self.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+
+        with app.app_context():
+            self.instrument_engine(db.engine)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        app.extensions['metrics'] = self
+
+    def instrument_engine(self, engine):
+        """Counts and times the SQL run on another engine, such as the ASGI server's async one."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        self.queries.inc()
+        if has_request_context() and 'query_count' in g:
+            g.query_count += 1
+            g.query_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            print(f"Slow query ({elapsed * 1000:.0f} ms): {redact_statement(statement, parameters)}")
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute; drop its start time.
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+
+    def _after_request(self, response):
+        if 'request_started' not in g:
+            return response
+        # Label by the URL rule, not the path, so ids don't create a series per row.
+        # Streamed bodies are timed up to the first byte; the rest is sent later.
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (request.method, route)
+        self.request_duration.observe(labels, time.perf_counter() - g.request_started)
+        self.requests.inc((request.method, route, response.status_code))
+        self.request_queries.observe(labels, g.query_count)
+        self.request_db_time.observe(labels, g.query_seconds)
+        if request.url_rule is not None and request.url_rule.endpoint != 'metrics':
+            if current_app.config['QUERY_COUNT_HEADER']:
+                response.headers['X-Query-Count'] = str(g.query_count)
+                response.headers['X-DB-Time-Ms'] = f'{g.query_seconds * 1000:.1f}'
+        return response
+
+    def observe_external(self, service, seconds, ok=True):
+        """Records the duration of one call to an outside service."""
+        if self.enabled:
+            self.external_duration.observe((service, 'ok' if ok else 'error'), seconds)
+
+    def register(self, app, collector):
+        """Adds an object whose render() returns more Prometheus lines to this app's /metrics."""
+        app.extensions.setdefault('metrics_collectors', []).append(collector)
+
+    def add_stats_view(self, app, rule, endpoint, source):
+        """Serves `source.stats()` as JSON on `rule`, behind the same token as /metrics."""
+        def view():
+            self._check_token()
+            return jsonify(source.stats())
+        app.add_url_rule(rule, endpoint, view)
+
+    def render(self, collectors=()):
+        lines = []
+        for metric in (self.request_duration, self.requests, self.request_queries, self.request_db_time,
+                       self.queries, self.slow_queries, self.external_duration, *collectors):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _check_token(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401, "A metrics token is required.")
+
+    def _metrics_view(self):
+        self._check_token()
+        collectors = current_app.extensions.get('metrics_collectors', ())
+        return Response(self.render(collectors), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,170 @@
+"""Password hashing for the OliLab API, kept off the request threads.
+
+bcrypt is deliberately slow (~250 ms at the default cost). `PasswordHasher`
+runs it in a small process pool so request workers only wait on a future, and
+caps how many hashes can be queued so a login burst gets a quick 503 instead of
+stalling every worker. The `*_async` methods await the same pool from an
+event loop. It also tracks the configured cost factor so old
+hashes can be upgraded transparently on the next successful login.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# bcrypt only uses the first 72 bytes; newer releases raise instead of truncating.
+_MAX_PASSWORD_BYTES = 72
+# How often a coroutine waiting for a hashing slot checks again.
+_SLOT_POLL_SECONDS = 0.01
+# Pool processes start from a fresh interpreter rather than a fork of a threaded
+# worker, which would copy its memory and any locks other threads held.
+_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full and the caller should retry later."""
+
+
+def _encode(password):
+    return password.encode('utf-8')[:_MAX_PASSWORD_BYTES]
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode('utf-8'))
+    except ValueError:  # Malformed hash in the database.
+        return False
+
+
+class PasswordHasher:
+    """Flask extension that hashes and verifies passwords in a bounded process pool.
+
+    Configuration:
+      BCRYPT_LOG_ROUNDS      bcrypt cost factor for new hashes (default 12)
+      PASSWORD_HASH_WORKERS  pool size per server process (default 2); 0 hashes
+                             inline in the calling thread
+      PASSWORD_HASH_QUEUE    max hashes waiting or running at once per process
+      PASSWORD_HASH_TIMEOUT  seconds to wait for a queue slot and for the result
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.timeout = 10.0
+        self._slots = None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Every gunicorn worker starts its own pool, so keep each one small.
+        workers = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', int(os.getenv('BCRYPT_LOG_ROUNDS', 12)))
+        app.config.setdefault('PASSWORD_HASH_WORKERS', workers)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', int(os.getenv('PASSWORD_HASH_QUEUE', max(workers, 1) * 4)))
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', float(os.getenv('PASSWORD_HASH_TIMEOUT', 10)))
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+
+    def _executor(self):
+        # Pools do not survive fork, so each gunicorn worker lazily starts its own.
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(_POOL_START_METHOD))
+                    self._pool_pid = pid
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            return self._executor().submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+        finally:
+            self._slots.release()
+
+    async def _run_async(self, fn, *args):
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        # A blocking acquire would stall the event loop, so poll for a free slot instead.
+        give_up_at = time.monotonic() + self.timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= give_up_at:
+                raise PasswordHasherBusy()
+            await asyncio.sleep(_SLOT_POLL_SECONDS)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self._executor().submit(fn, *args)), self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Returns a bcrypt hash of `password` at the configured cost."""
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, password_hash, password):
+        """Returns True if `password` matches `password_hash`."""
+        return self._run(_check_password, password_hash, password)
+
+    async def hash_async(self, password):
+        """hash(), awaited without blocking the event loop."""
+        return await self._run_async(_hash_password, password, self.rounds)
+
+    async def check_async(self, password_hash, password):
+        """check(), awaited without blocking the event loop."""
+        return await self._run_async(_check_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different cost than is configured now."""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def hash_many(self, passwords):
+        """Hashes a batch of passwords in parallel across the pool, preserving order.
+
+        Each hash takes its own queue slot, so a batch waits its turn alongside
+        logins instead of holding the pool, and each result is waited for at
+        most PASSWORD_HASH_TIMEOUT. Raises PasswordHasherBusy like hash().
+        """
+        if self.workers <= 0:
+            return [_hash_password(p, self.rounds) for p in passwords]
+        futures = []
+        try:
+            for password in passwords:
+                if not self._slots.acquire(timeout=self.timeout):
+                    raise PasswordHasherBusy()
+                try:
+                    future = self._executor().submit(_hash_password, password, self.rounds)
+                except BaseException:
+                    self._slots.release()
+                    raise
+                future.add_done_callback(self._release_slot)
+                futures.append(future)
+            return [future.result(timeout=self.timeout) for future in futures]
+        except TimeoutError:
+            raise PasswordHasherBusy()
+        finally:
+            for future in futures:
+                future.cancel()  # After a failure, drops the hashes not started yet.
+
+    def _release_slot(self, future):
+        self._slots.release()
@@ -0,0 +1,110 @@
+"""Background report generation for the OliLab API.
+
+Report jobs run on a small thread pool so a slow Gemini call never ties up a
+request worker. The text-writing step is pluggable: `GeminiReportWriter` calls
+the real model, `StubReportWriter` returns canned text for tests and offline use.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReportQueueFull(Exception):
+    """Raised when the report queue is at capacity and the caller should retry later."""
+
+
+class GeminiReportWriter:
+    """Writes the overview and conclusion for a report summary with Gemini.
+
+    The Gemini SDK takes over half a second to import, so it is loaded and
+    configured on the first report rather than when each worker starts.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, api_key=None, model_name='gemini-2.5-flash', timeout=60):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self._genai = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        with self._lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                if self.api_key:
+                    genai.configure(api_key=self.api_key)
+                self._genai = genai
+            return self._genai
+
+    def write(self, summary):
+        prompt = f"""
+        You are given a precomputed summary of a science laboratory inventory system. Write a status briefing.
+
+        **Instructions:**
+        1.  Provide a concise one-paragraph `overview` of the lab's general status.
+        2.  Write a brief, actionable `conclusion`, mentioning low-stock items and pending requests where relevant.
+
+        **Summary:**
+        {json.dumps(summary)}
+
+        **Output Format:**
+        Return ONLY a valid JSON object matching this exact schema:
+        {{
+          "overview": "string",
+          "conclusion": "string"
+        }}
+        """
+        model = self._client().GenerativeModel(self.model_name)
+        response = model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"},
+            request_options={"timeout": self.timeout},
+        )
+        # The response.text should already be a valid JSON string
+        text = json.loads(response.text)
+        if not isinstance(text, dict):
+            raise ValueError(f"Unexpected response: {response.text[:200]}")
+        return text.get('overview', ''), text.get('conclusion', '')
+
+
+class StubReportWriter:
+    """Deterministic stand-in for Gemini, for tests and deployments without an API key."""
+
+    name = 'stub'
+
+    def write(self, summary):
+        return (
+            f"Stub overview: {summary['itemCount']} items, {summary['activeLoans']} active loans.",
+            f"Stub conclusion: {summary['lowStockCount']} low-stock items, "
+            f"{summary['pendingRequests']} pending requests.",
+        )
+
+
+class ReportWorkerPool:
+    """Runs report jobs on a few threads and refuses work beyond a queue limit."""
+
+    def __init__(self, workers=2, queue_limit=8):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Threads do not survive fork, so each server worker starts its own pool.
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report')
+                self._executor_pid = pid
+        return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ReportQueueFull()
+        future = self._pool().submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
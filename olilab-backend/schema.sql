@@ -12,13 +12,14 @@ CREATE TABLE users (
     full_name VARCHAR(120) NOT NULL,
     email VARCHAR(120) UNIQUE NOT NULL,
     password_hash VARCHAR(255) NOT NULL,
-    lrn VARCHAR(12),
+    lrn VARCHAR(12) UNIQUE,
     grade_level VARCHAR(50),
     section VARCHAR(50),
     role VARCHAR(20) NOT NULL DEFAULT 'Member',
     is_admin BOOLEAN NOT NULL DEFAULT FALSE,
     status VARCHAR(20) NOT NULL DEFAULT 'PENDING', -- PENDING, APPROVED, DENIED
-    timestamp TIMESTAMPTZ DEFAULT NOW()
+    timestamp TIMESTAMPTZ DEFAULT NOW(),
+    row_version BIGINT NOT NULL DEFAULT 0 -- Change version for delta sync
 );
 
 -- -----------------------------------------------------------------------------
@@ -31,7 +32,8 @@ CREATE TABLE items (
     total_quantity INTEGER NOT NULL,
     available_quantity INTEGER NOT NULL,
     category VARCHAR(100) NOT NULL,
-    timestamp TIMESTAMPTZ DEFAULT NOW()
+    timestamp TIMESTAMPTZ DEFAULT NOW(),
+    row_version BIGINT NOT NULL DEFAULT 0
 );
 
 -- -----------------------------------------------------------------------------
@@ -48,20 +50,88 @@ CREATE TABLE logs (
     status VARCHAR(20), -- PENDING, APPROVED, DENIED, RETURNED
     admin_notes TEXT,
     related_log_id UUID, -- Links a RETURN to its original BORROW log
-    return_requested BOOLEAN DEFAULT FALSE
+    return_requested BOOLEAN DEFAULT FALSE,
+    row_version BIGINT NOT NULL DEFAULT 0
+);
+
+-- -----------------------------------------------------------------------------
+-- Table for the Log Archive
+-- RETURNED and DENIED logs older than LOG_ARCHIVE_AFTER_DAYS, moved here by
+-- `flask archive-logs` so the logs table only holds the active window.
+-- Partitioned by year; the command creates each year's partition as needed.
+-- -----------------------------------------------------------------------------
+CREATE TABLE log_archive (
+    id UUID NOT NULL,
+    user_id UUID, -- No foreign keys: archived history outlives its users and items
+    item_id UUID NOT NULL,
+    quantity INTEGER NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    status VARCHAR(20),
+    admin_notes TEXT,
+    related_log_id UUID,
+    return_requested BOOLEAN DEFAULT FALSE,
+    user_name VARCHAR(120), -- Copied in when archived
+    item_name VARCHAR(255),
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (timestamp, id)
+) PARTITION BY RANGE (timestamp);
+
+-- -----------------------------------------------------------------------------
+-- Table for Outstanding Loans
+-- Per-user, per-item count of approved loans not yet returned. Updated in the
+-- same transaction as the approve and return that change it. Fill it with
+-- `flask rebuild-outstanding-loans` when added to a live database.
+-- -----------------------------------------------------------------------------
+CREATE TABLE outstanding_loans (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    item_id UUID NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    loans INTEGER NOT NULL DEFAULT 0, -- Approved BORROW logs still out
+    quantity INTEGER NOT NULL DEFAULT 0, -- Units across those loans
+    PRIMARY KEY (user_id, item_id)
+);
+
+-- -----------------------------------------------------------------------------
+-- Tables for Usage Rollups
+-- Borrow and return counts per item per day and per section per day, kept up
+-- to date by the borrow, approve and return routes. Days are calendar days in
+-- USAGE_TIMEZONE. Fill them with `flask rebuild-usage-rollups` when added to a
+-- live database or after changing USAGE_TIMEZONE.
+-- -----------------------------------------------------------------------------
+CREATE TABLE item_usage_daily (
+    item_id UUID NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0, -- Borrow requests made
+    borrows INTEGER NOT NULL DEFAULT 0, -- Of those, approved (counted on the request's day)
+    returns INTEGER NOT NULL DEFAULT 0, -- Loans returned
+    borrowed_quantity INTEGER NOT NULL DEFAULT 0, -- Units across the approved borrows
+    returned_quantity INTEGER NOT NULL DEFAULT 0, -- Units across the returns
+    PRIMARY KEY (item_id, day)
+);
+
+CREATE TABLE section_usage_daily (
+    section VARCHAR(50) NOT NULL, -- The borrower's section; '' when they have none
+    day DATE NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    borrows INTEGER NOT NULL DEFAULT 0,
+    returns INTEGER NOT NULL DEFAULT 0,
+    borrowed_quantity INTEGER NOT NULL DEFAULT 0,
+    returned_quantity INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (section, day)
 );
 
 -- -----------------------------------------------------------------------------
 -- Table for Notifications
--- Stores system-generated notifications for users. (Note: current implementation is frontend-only)
--- This table is included for future backend notification management.
+-- Stores system-generated notifications, one row per recipient.
+-- New rows are also pushed live to connected clients over /api/events.
 -- -----------------------------------------------------------------------------
 CREATE TABLE notifications (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE, -- The recipient
     message TEXT NOT NULL,
     type VARCHAR(50) NOT NULL, -- e.g., 'new_user', 'return_request'
     read BOOLEAN NOT NULL DEFAULT FALSE,
-    timestamp TIMESTAMPTZ DEFAULT NOW(),
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     related_log_id UUID
 );
 
@@ -77,7 +147,8 @@ CREATE TABLE suggestions (
     description TEXT NOT NULL,
     category VARCHAR(100), -- For approved ITEM suggestions
     status VARCHAR(20) NOT NULL DEFAULT 'PENDING', -- PENDING, APPROVED, DENIED
-    timestamp TIMESTAMPTZ DEFAULT NOW()
+    timestamp TIMESTAMPTZ DEFAULT NOW(),
+    row_version BIGINT NOT NULL DEFAULT 0
 );
 
 -- -----------------------------------------------------------------------------
@@ -89,14 +160,87 @@ CREATE TABLE comments (
     user_id UUID REFERENCES users(id) ON DELETE SET NULL,
     suggestion_id UUID REFERENCES suggestions(id) ON DELETE CASCADE, -- Delete comments if suggestion is deleted
     text TEXT NOT NULL,
-    timestamp TIMESTAMPTZ DEFAULT NOW()
+    timestamp TIMESTAMPTZ DEFAULT NOW(),
+    row_version BIGINT NOT NULL DEFAULT 0
+);
+
+-- -----------------------------------------------------------------------------
+-- Tables for Delta Sync
+-- `sync_counter` holds a single row that hands out change versions in commit
+-- order; `tombstones` remembers deleted rows so clients can drop them locally.
+-- -----------------------------------------------------------------------------
+CREATE TABLE sync_counter (
+    id INTEGER PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO sync_counter (id, value) VALUES (1, 0);
+
+CREATE TABLE tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(32) NOT NULL, -- items, users, logs, suggestions, comments
+    entity_id UUID NOT NULL,
+    row_version BIGINT NOT NULL
 );
 
+-- -----------------------------------------------------------------------------
+-- Table for Report Jobs
+-- Background report generation. Finished reports double as a cache keyed on
+-- the data version, so repeat requests on unchanged data are instant.
+-- -----------------------------------------------------------------------------
+CREATE TABLE report_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    cache_key VARCHAR(64) NOT NULL,
+    mode VARCHAR(16) NOT NULL, -- ai, basic
+    status VARCHAR(20) NOT NULL DEFAULT 'QUEUED', -- QUEUED, RUNNING, DONE, FAILED
+    result TEXT, -- The finished report as JSON
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    deadline TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX idx_report_jobs_cache_key ON report_jobs(cache_key);
+
 -- Add indexes for frequently queried columns to improve performance
-CREATE INDEX idx_logs_user_id ON logs(user_id);
-CREATE INDEX idx_logs_item_id ON logs(item_id);
-CREATE INDEX idx_suggestions_user_id ON suggestions(user_id);
 CREATE INDEX idx_comments_suggestion_id ON comments(suggestion_id);
+CREATE INDEX idx_users_row_version ON users(row_version);
+CREATE INDEX idx_items_row_version ON items(row_version);
+CREATE INDEX idx_logs_row_version ON logs(row_version);
+CREATE INDEX idx_suggestions_row_version ON suggestions(row_version);
+CREATE INDEX idx_comments_row_version ON comments(row_version);
+CREATE INDEX idx_tombstones_row_version ON tombstones(row_version);
+
+-- Composite indexes backing the keyset-paginated list endpoints. Each one
+-- matches a filter + sort order, so every page is a single index range scan.
+-- The (user_id, ...) and (item_id, ...) indexes also serve plain lookups by
+-- user or item.
+CREATE INDEX idx_logs_timestamp_id ON logs(timestamp DESC, id DESC);
+CREATE INDEX idx_logs_status_timestamp_id ON logs(status, timestamp DESC, id DESC);
+CREATE INDEX idx_logs_action_timestamp_id ON logs(action, timestamp DESC, id DESC);
+CREATE INDEX idx_logs_user_timestamp_id ON logs(user_id, timestamp DESC, id DESC);
+CREATE INDEX idx_logs_user_status_timestamp_id ON logs(user_id, status, timestamp DESC, id DESC);
+CREATE INDEX idx_logs_item_timestamp_id ON logs(item_id, timestamp DESC, id DESC);
+CREATE INDEX idx_logs_related_log_id ON logs(related_log_id) WHERE related_log_id IS NOT NULL;
+CREATE INDEX idx_log_archive_user_timestamp_id ON log_archive(user_id, timestamp DESC, id DESC);
+CREATE INDEX idx_log_archive_item_timestamp_id ON log_archive(item_id, timestamp DESC, id DESC);
+CREATE INDEX idx_outstanding_loans_item_id ON outstanding_loans(item_id);
+-- Covers the whole row, so ranking items over a date range never visits the table.
+CREATE INDEX idx_item_usage_daily_day ON item_usage_daily(day, item_id, requests, borrows, returns,
+                                                          borrowed_quantity, returned_quantity);
+CREATE INDEX idx_section_usage_daily_day ON section_usage_daily(day);
+CREATE INDEX idx_items_name_id ON items(name, id);
+CREATE INDEX idx_items_category_name_id ON items(category, name, id);
+CREATE INDEX idx_users_full_name_id ON users(full_name, id);
+CREATE INDEX idx_users_status_full_name_id ON users(status, full_name, id);
+
+-- Expression indexes for the case-insensitive login and signup lookups.
+CREATE INDEX idx_users_lower_username ON users(lower(username));
+CREATE INDEX idx_users_lower_email ON users(lower(email));
+CREATE INDEX idx_suggestions_timestamp_id ON suggestions(timestamp DESC, id DESC);
+CREATE INDEX idx_suggestions_status_timestamp_id ON suggestions(status, timestamp DESC, id DESC);
+CREATE INDEX idx_suggestions_user_timestamp_id ON suggestions(user_id, timestamp DESC, id DESC);
+CREATE INDEX idx_notifications_user_timestamp_id ON notifications(user_id, timestamp DESC, id DESC);
+
+-- Partial index holding only unread rows, so unread counts stay cheap as history grows.
+CREATE INDEX idx_notifications_user_unread ON notifications(user_id) WHERE NOT read;
 
 -- Notify that the script has completed.
 -- (This part is not executable SQL but serves as a confirmation message)
@@ -0,0 +1,223 @@
+"""In-process search index for the OliLab API.
+
+`SearchIndex` keeps an inverted index of normalized words, plus a trigram index
+over those words, so one lookup handles prefix matches ("beak" finds "Beaker")
+and typos ("beekar" finds "Beaker") without scanning rows. The index knows
+nothing about the database. The app feeds it documents and keeps it current
+from the delta-sync change versions, so every worker stays in step with
+every other worker's writes.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+_WORD = re.compile(r'\w+')
+
+# A fuzzy match must share this share of trigrams, or be within a few edits.
+MIN_SIMILARITY = 0.3
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+
+
+def normalize(text):
+    """Lowercases and strips accents so 'Bürette' matches 'burette'."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def words(text):
+    return _WORD.findall(normalize(text)) if text else []
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_typos(word):
+    return 0 if len(word) < 4 else 1 if len(word) < 7 else 2
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance counting swapped neighbours as one edit; gives up past `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class SearchIndex:
+    """Ranks documents against short free-text queries.
+
+    A document is a key plus a list of (text, weight) fields. Each query word
+    has to match some word of the document, exactly, as a prefix, or closely
+    enough by trigram similarity. A document's score is the sum, over the query
+    words, of its best match times that field's weight.
+    """
+
+    def __init__(self):
+        self.version = None
+        # Documents are numbered internally. Int ids hash fast, and dicts that
+        # hold only ints, strings and floats stay out of the garbage
+        # collector's sight, which keeps full collections short.
+        self._keys = []  # doc id -> key, None once removed
+        self._doc_ids = {}  # key -> doc id
+        self._documents = {}  # doc id -> {word: best field weight}
+        self._postings = {}  # word -> {doc id: best field weight}
+        self._sorted_words = []
+        self._word_trigrams = {}  # trigram -> set of words
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def clear(self):
+        with self.lock:
+            self.__init__()
+
+    def add(self, key, fields):
+        """Indexes (or re-indexes) a document."""
+        self.add_many([(key, fields)])
+
+    def add_many(self, documents):
+        """Indexes an iterable of (key, fields) pairs, sorting new words in once at the end."""
+        with self.lock:
+            new_words = []
+            for key, fields in documents:
+                doc_id = self._doc_ids.get(key)
+                if doc_id is None:
+                    doc_id = self._doc_ids[key] = len(self._keys)
+                    self._keys.append(key)
+                else:
+                    self._unindex(doc_id)
+                weights = {}
+                for text, weight in fields:
+                    for word in words(text):
+                        weights[word] = max(weights.get(word, 0), weight)
+                self._documents[doc_id] = weights
+                for word, weight in weights.items():
+                    postings = self._postings.get(word)
+                    if postings is None:
+                        postings = self._postings[word] = {}
+                        new_words.append(word)
+                        for trigram in trigrams(word):
+                            self._word_trigrams.setdefault(trigram, set()).add(word)
+                    postings[doc_id] = weight
+            new_words = [word for word in dict.fromkeys(new_words) if word in self._postings]
+            if len(new_words) < 100:
+                for word in new_words:
+                    insort(self._sorted_words, word)
+            elif new_words:
+                self._sorted_words.extend(new_words)
+                self._sorted_words.sort()
+
+    def remove(self, key):
+        with self.lock:
+            doc_id = self._doc_ids.pop(key, None)
+            if doc_id is not None:
+                self._keys[doc_id] = None
+                self._unindex(doc_id)
+
+    def _unindex(self, doc_id):
+        weights = self._documents.pop(doc_id, None)
+        if weights:
+            for word in weights:
+                postings = self._postings[word]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[word]
+                    i = bisect_left(self._sorted_words, word)
+                    # A word added earlier in the same add_many call is not sorted in yet.
+                    if i < len(self._sorted_words) and self._sorted_words[i] == word:
+                        del self._sorted_words[i]
+                    for trigram in trigrams(word):
+                        self._word_trigrams[trigram].discard(word)
+
+    def _matching_words(self, query_word):
+        """Returns {indexed word: match score} for one query word."""
+        matches = {}
+        sorted_words = self._sorted_words
+        for i in range(bisect_left(sorted_words, query_word), len(sorted_words)):
+            word = sorted_words[i]
+            if not word.startswith(query_word):
+                break
+            # Exact words score 1; longer completions score less, down to PREFIX_SCORE.
+            matches[word] = PREFIX_SCORE + (1 - PREFIX_SCORE) * len(query_word) / len(word)
+        typos = max_typos(query_word)
+        if not typos:
+            return matches
+        query_trigrams = trigrams(query_word)
+        # An edit breaks at most four trigrams (a swap), so a close word shares at
+        # least `needed` of them, and therefore at least one of the rarest
+        # len - needed + 1. Only those postings are read, which skips the huge
+        # ones for trigrams like "  s".
+        needed = max(2, len(query_trigrams) - 4 * typos)
+        rarest = sorted(query_trigrams, key=lambda t: len(self._word_trigrams.get(t, ())))
+        candidates = set()
+        for trigram in rarest[:len(query_trigrams) - needed + 1]:
+            candidates.update(self._word_trigrams.get(trigram, ()))
+        for word in candidates:
+            if word in matches:
+                continue
+            shared = len(query_trigrams & trigrams(word))
+            if shared < needed:
+                continue
+            similarity = shared / (len(query_trigrams) + len(word) + 1 - shared)
+            distance = edit_distance(query_word, word, typos)
+            if distance <= typos:
+                similarity = max(similarity, 1 - distance / len(query_word))
+            if similarity >= MIN_SIMILARITY:
+                matches[word] = FUZZY_SCORE * similarity
+        return matches
+
+    def search(self, query, limit=20, kinds=None):
+        """Returns {kind: [(id, score), ...]}, the best `limit` matches of each kind.
+
+        Keys are (kind, id) pairs; `kinds` restricts the search to some kinds.
+        """
+        query_words = words(query)
+        if not query_words:
+            return {}
+        with self.lock:
+            matched = [self._matching_words(word) for word in query_words]
+            # Start from the most selective word; later words only rescore the
+            # documents still in the running instead of walking their postings.
+            matched.sort(key=lambda matches: sum(len(self._postings[word]) for word in matches))
+            scores = {}
+            for word, match in matched[0].items():
+                for doc_id, weight in self._postings[word].items():
+                    score = match * weight
+                    if score > scores.get(doc_id, 0):
+                        scores[doc_id] = score
+            for matches in matched[1:]:
+                rescored = {}
+                if len(matches) <= 4:
+                    # A handful of words: look each document up in their postings.
+                    lookups = [(self._postings[word], match) for word, match in matches.items()]
+                    for doc_id, score in scores.items():
+                        best = max(postings.get(doc_id, 0) * match for postings, match in lookups)
+                        if best:
+                            rescored[doc_id] = score + best
+                else:
+                    for doc_id, score in scores.items():
+                        best = max((matches[word] * weight for word, weight in self._documents[doc_id].items()
+                                    if word in matches), default=0)
+                        if best:
+                            rescored[doc_id] = score + best
+                scores = rescored
+            by_kind = {}
+            for doc_id, score in scores.items():
+                kind, id = self._keys[doc_id]
+                if kinds is None or kind in kinds:
+                    by_kind.setdefault(kind, []).append((id, score))
+        return {kind: heapq.nlargest(limit, hits, key=itemgetter(1)) for kind, hits in by_kind.items()}
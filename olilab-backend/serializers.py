@@ -0,0 +1,158 @@
+"""Fast row serialization for the OliLab API.
+
+Models describe their JSON shape once as a list of (key, column) pairs. A
+`RowSerializer` turns that into a per-column converter at import time, so
+serializing a row is a single pass over a plain tuple: no ORM hydration, no
+per-row column reflection and no repeated isinstance checks.
+"""
+import enum
+import json
+import uuid
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder.
+    orjson = None
+
+
+def _uuid_to_str(value):
+    return str(value)
+
+def _enum_to_value(value):
+    return value.value
+
+def _datetime_to_iso(value):
+    return value.isoformat()
+
+def _converter_for(column):
+    """Picks the conversion needed to make a column's Python value JSON-safe."""
+    column_type = column.type
+    if isinstance(column_type, sa.Enum) and column_type.enum_class is not None:
+        return _enum_to_value
+    if isinstance(column_type, sa.Uuid) and column_type.as_uuid:
+        return _uuid_to_str
+    if isinstance(column_type, (sa.DateTime, sa.Date)):
+        return _datetime_to_iso
+    return None
+
+
+class RowSerializer:
+    """Converts selected column tuples (or model instances) into API dicts.
+
+    `fields` is an ordered list of (json_key, column) pairs. Use `columns` in a
+    select()/with_entities() call, then feed the resulting rows to `row()` or
+    `rows()`.
+    """
+
+    def __init__(self, fields):
+        self.keys = tuple(key for key, _ in fields)
+        self.columns = tuple(column for _, column in fields)
+        self._attrs = tuple(column.key for column in self.columns)
+        self._converters = tuple(_converter_for(column) for column in self.columns)
+        # Fast path: columns that need no conversion are copied as-is.
+        self._plan = tuple(zip(self.keys, self._converters))
+
+    def index(self, column):
+        """Returns the position of `column` in each selected row."""
+        return self.columns.index(column)
+
+    def row(self, values):
+        out = {}
+        for (key, convert), value in zip(self._plan, values):
+            out[key] = convert(value) if convert is not None and value is not None else value
+        return out
+
+    def rows(self, result):
+        row = self.row
+        return [row(values) for values in result]
+
+    def from_object(self, obj):
+        """Serializes an already-loaded model instance with the same plan."""
+        return self.row([getattr(obj, attr) for attr in self._attrs])
+
+
+def _default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def dumps(obj):
+    """Encodes `obj` to JSON bytes with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+class RowStream:
+    """Marks a value to be streamed as a JSON array from an iterator of row batches."""
+
+    def __init__(self, batches):
+        self.batches = batches
+
+
+def iter_json_object(fields):
+    """Yields a JSON object as bytes, one chunk per row batch.
+
+    `fields` is a sequence of (key, value) pairs. `RowStream` values are written
+    as arrays batch by batch, so only one batch is ever held in memory; other
+    values are encoded whole.
+    """
+    separator = b'{'
+    for key, value in fields:
+        yield separator + dumps(key) + b':'
+        separator = b','
+        if not isinstance(value, RowStream):
+            yield dumps(value)
+            continue
+        opening = b'['
+        for batch in value.batches:
+            if batch:
+                yield opening + b','.join(dumps(row) for row in batch)
+                opening = b','
+        yield b'[]' if opening == b'[' else b']'
+    yield b'{}' if separator == b'{' else b'}'
+
+
+def iter_ndjson(fields):
+    """Yields the same fields as newline-delimited JSON.
+
+    Each streamed row becomes `{"collection": key, "data": row}`; other values
+    become a single `{key: value}` line.
+    """
+    for key, value in fields:
+        if not isinstance(value, RowStream):
+            yield dumps({key: value}) + b'\n'
+            continue
+        for batch in value.batches:
+            if batch:
+                yield b''.join(dumps({'collection': key, 'data': row}) + b'\n' for row in batch)
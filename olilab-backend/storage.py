@@ -0,0 +1,343 @@
+"""Database portability for the OliLab API.
+
+The models run on Postgres (Supabase) or on a local SQLite file. Column types
+come from here so that both backends store the same values:
+
+- `TZDateTime` holds UTC timestamps. SQLite has no timezone type, so its
+  values are written as naive UTC and given back their UTC tzinfo on the way
+  out.
+- `utcnow()` is the server-side "now". SQLite's CURRENT_TIMESTAMP only has
+  whole seconds, which ties every row written in the same second; here it
+  keeps the fraction.
+- `Enum` is a native enum type on Postgres and a CHECK-constrained VARCHAR
+  elsewhere, so SQLite rejects values Postgres would reject.
+
+`configure_engine` sizes each worker's connection pool from the environment,
+so N gunicorn workers stay inside the database's connection limit. On
+Postgres it also replaces connections the server dropped while idle, and it
+can run behind a transaction-mode pooler such as PgBouncer. It tunes SQLite
+for a small single-node server. WAL lets readers never wait on the writer and
+gunicorn workers share the file, and a busy timeout makes a worker wait its
+turn to write instead of failing.
+
+`install_engine_hooks` also makes the pool safe to inherit. When gunicorn
+preloads the app, the master builds the engine once and forks the workers, and
+a connection the master opened must not be shared by two processes.
+
+`create_async_engine_for` opens the same database through asyncpg or
+aiosqlite for the ASGI server, with the same pool and connection settings.
+"""
+import os
+import time
+import weakref
+from datetime import timezone
+
+from sqlalchemy import event, make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import sqltypes
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator
+
+
+class _SQLiteUTCDateTime(TypeDecorator):
+    impl = sqltypes.DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
+def TZDateTime():
+    """A timezone-aware timestamp column type, read back as UTC on every backend."""
+    return sqltypes.DateTime(timezone=True).with_variant(_SQLiteUTCDateTime(), 'sqlite')
+
+
+def Enum(enum_class):
+    """An enum column type: native on Postgres, VARCHAR with a CHECK constraint elsewhere."""
+    return sqltypes.Enum(enum_class, create_constraint=True)
+
+
+class utcnow(FunctionElement):
+    """The current time as the database sees it, for server defaults and onupdate."""
+    type = sqltypes.DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    return 'now()'
+
+@compiles(utcnow, 'sqlite')
+def _utcnow_sqlite(element, compiler, **kw):
+    # Same text layout SQLAlchemy writes for Python datetimes (microseconds,
+    # no offset), so server- and client-set timestamps sort together.
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+def database_url(uri):
+    """Accepts the postgres:// scheme that Supabase and Heroku hand out, which SQLAlchemy rejects."""
+    if uri and uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def is_sqlite(uri):
+    return bool(uri) and uri.startswith('sqlite')
+
+def is_memory_sqlite(uri):
+    return bool(uri) and (uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri)
+
+def is_busy_error(error):
+    """True for SQLite's "database is locked": the busy timeout ran out waiting to write."""
+    return isinstance(error, OperationalError) and 'database is locked' in str(error.orig)
+
+
+class MonitoredQueuePool(QueuePool):
+    """A QueuePool that reports how long each checkout took, waiting included.
+
+    `configure_engine` subclasses it with a `monitor` (see metrics.PoolMonitor).
+    The pool is rebuilt from its class on dispose, which keeps the monitor.
+    """
+    monitor = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.monitor.observe_timeout(self, time.perf_counter() - started)
+            raise
+        self.monitor.observe_checkout(self, time.perf_counter() - started)
+        return connection
+
+
+def _env_flag(name, default):
+    return os.getenv(name, '1' if default else '0') not in ('0', 'false', 'False', '')
+
+
+def configure_engine(app, monitor=None):
+    """Sets engine options for the configured database. Call before db.init_app.
+
+    Pooling (Postgres and SQLite files), per worker process:
+      DB_POOL_SIZE            connections kept open (default 5; 0 opens one per checkout)
+      DB_MAX_OVERFLOW         extra connections allowed under load (default 10)
+      DB_POOL_TIMEOUT         seconds to wait for a free connection before answering 503 (default 10)
+      DB_MAX_CONNECTIONS      if set, the server's connection budget for the whole app;
+                              with WEB_CONCURRENCY workers, caps each worker's size + overflow
+    Postgres:
+      DB_POOL_RECYCLE         replace connections older than this many seconds (default 1800)
+      DB_POOL_PRE_PING        test a connection before use, so one the server dropped while idle
+                              is replaced instead of failing the request (default on)
+      DB_STATEMENT_TIMEOUT_MS cancel statements running longer than this (default 0, off)
+      DB_PGBOUNCER            1 when DATABASE_URL is a transaction-mode pooler (PgBouncer,
+                              Supabase port 6543): no session state or prepared statements
+      DB_LISTEN_URL           a direct (or session-mode) URL for the live-event LISTEN
+                              connection, which a transaction-mode pooler cannot carry
+    SQLite:
+      SQLITE_BUSY_TIMEOUT_MS  how long a write waits for the lock (default 5000)
+      SQLITE_SYNCHRONOUS      NORMAL (default; durable up to the last checkpoint in WAL) or FULL
+      SQLITE_CACHE_MB         page cache per connection (default 64)
+      SQLITE_MMAP_MB          memory-mapped I/O per connection (default 256; 0 turns it off)
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI'] = database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if not uri:
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    connect_args = options.setdefault('connect_args', {})
+    url = make_url(uri)
+    postgres = url.get_backend_name() == 'postgresql'
+
+    app.config.setdefault('DB_PGBOUNCER', postgres and _env_flag('DB_PGBOUNCER', False))
+    app.config.setdefault('DB_LISTEN_URL', database_url(os.getenv('DB_LISTEN_URL')))
+    app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0)))
+    if not is_memory_sqlite(uri):
+        _configure_pool(app, options, postgres, monitor)
+    if postgres:
+        _configure_postgres(app, options, connect_args, url)
+    elif is_sqlite(uri):
+        _configure_sqlite(app, connect_args, uri)
+
+
+def _configure_pool(app, options, postgres, monitor):
+    app.config.setdefault('DB_POOL_SIZE', int(os.getenv('DB_POOL_SIZE', 5)))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.getenv('DB_MAX_OVERFLOW', 10)))
+    app.config.setdefault('DB_POOL_TIMEOUT', int(os.getenv('DB_POOL_TIMEOUT', 10)))
+    app.config.setdefault('DB_MAX_CONNECTIONS', int(os.getenv('DB_MAX_CONNECTIONS', 0)))
+    size, overflow = app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW']
+    budget = app.config['DB_MAX_CONNECTIONS']
+    if budget:
+        workers = int(os.getenv('WEB_CONCURRENCY', 1))
+        per_worker = budget // workers
+        if postgres:
+            per_worker -= 1  # The live-event LISTEN connection sits outside the pool.
+        if per_worker < 1:
+            raise ValueError(f"DB_MAX_CONNECTIONS={budget} leaves no connections for {workers} workers")
+        size = min(size, per_worker)
+        overflow = min(overflow, per_worker - size)
+    app.config['DB_POOL_SIZE'], app.config['DB_MAX_OVERFLOW'] = size, overflow
+    if size == 0:
+        options.setdefault('poolclass', NullPool)
+        return
+    if monitor is not None:
+        monitor.limit = size + overflow
+        app.extensions['db_pool_monitor'] = monitor
+        options.setdefault('poolclass', type('MonitoredQueuePool', (MonitoredQueuePool,), {'monitor': monitor}))
+    else:
+        options.setdefault('poolclass', QueuePool)
+    options.setdefault('pool_size', size)
+    options.setdefault('max_overflow', overflow)
+    options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+
+
+def _configure_postgres(app, options, connect_args, url):
+    app.config.setdefault('DB_POOL_RECYCLE', int(os.getenv('DB_POOL_RECYCLE', 1800)))
+    app.config.setdefault('DB_POOL_PRE_PING', _env_flag('DB_POOL_PRE_PING', True))
+    options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    # Reuse the most recent connection first, so the ones left idle at quiet times
+    # age out (recycle, server idle timeout) instead of being kept warm.
+    if issubclass(options.get('poolclass', QueuePool), QueuePool):
+        options.setdefault('pool_use_lifo', True)
+    timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if app.config['DB_PGBOUNCER']:
+        # Transaction-mode poolers hand each transaction to any server connection:
+        # startup options and prepared statements would leak between clients.
+        driver = url.get_driver_name()
+        if driver == 'psycopg':
+            connect_args.setdefault('prepare_threshold', None)
+        elif driver == 'asyncpg':
+            connect_args.setdefault('statement_cache_size', 0)
+            connect_args.setdefault('prepared_statement_cache_size', 0)
+        if timeout:
+            app.extensions['db_transaction_settings'] = [f'SET LOCAL statement_timeout = {timeout}']
+    elif timeout:
+        connect_args.setdefault('options', f'-c statement_timeout={timeout}')
+
+
+def _configure_sqlite(app, connect_args, uri):
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)))
+    app.config.setdefault('SQLITE_SYNCHRONOUS', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper())
+    app.config.setdefault('SQLITE_CACHE_MB', int(os.getenv('SQLITE_CACHE_MB', 64)))
+    app.config.setdefault('SQLITE_MMAP_MB', int(os.getenv('SQLITE_MMAP_MB', 256)))
+    if app.config['SQLITE_SYNCHRONOUS'] not in ('NORMAL', 'FULL'):
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be NORMAL or FULL, not {app.config['SQLITE_SYNCHRONOUS']!r}")
+
+    # Connections are pooled and handed between threads (report workers, streamed
+    # responses), never used by two at once.
+    connect_args.setdefault('check_same_thread', False)
+    connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    pragmas = ['PRAGMA foreign_keys = ON']
+    if not is_memory_sqlite(uri):
+        pragmas += [
+            'PRAGMA journal_mode = WAL',
+            f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA cache_size = {-1024 * app.config['SQLITE_CACHE_MB']}",
+            f"PRAGMA mmap_size = {1024 * 1024 * app.config['SQLITE_MMAP_MB']}",
+            'PRAGMA temp_store = MEMORY',
+        ]
+    app.extensions['sqlite_pragmas'] = pragmas
+
+
+def install_engine_hooks(app, engine):
+    """Adds the per-connection and per-transaction settings chosen by configure_engine."""
+    monitor = app.extensions.get('db_pool_monitor')
+    if monitor is not None:
+        monitor.engine = engine
+    _install_connection_hooks(app, engine)
+    _dispose_after_fork(engine)
+
+
+def _dispose_after_fork(engine):
+    """Gives a forked worker an empty pool instead of the parent's open connections.
+
+    `close=False` leaves those connections to the parent: closing them here would
+    send a terminate message down a socket the parent still uses.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+    engine_ref = weakref.ref(engine)
+
+    def dispose():
+        engine = engine_ref()
+        if engine is not None:
+            engine.dispose(close=False)
+    os.register_at_fork(after_in_child=dispose)
+
+
+def _install_connection_hooks(app, engine):
+    pragmas = app.extensions.get('sqlite_pragmas')
+    if pragmas:
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    settings = app.extensions.get('db_transaction_settings')
+    if settings:
+        # One extra round trip per transaction; prefer `ALTER ROLE ... SET
+        # statement_timeout` on the server when you can.
+        @event.listens_for(engine, 'begin')
+        def _set_transaction_settings(connection):
+            for setting in settings:
+                connection.exec_driver_sql(setting)
+
+
+# The asyncio driver for each backend, used by the ASGI server (asgi.py).
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+_SHARED_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_pre_ping', 'pool_use_lifo')
+
+def async_database_url(uri):
+    """The same database through its asyncio driver: asyncpg for Postgres, aiosqlite for SQLite."""
+    url = make_url(database_url(uri))
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver is configured for {backend} databases")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def create_async_engine_for(app):
+    """Creates an asyncio engine for the app's database. Call after configure_engine.
+
+    It gets its own pool with the same DB_POOL_* sizing and the same
+    per-connection and per-transaction settings as the app's engine. An ASGI
+    worker can hold both pools at once, so count it as two workers in
+    WEB_CONCURRENCY when sizing against DB_MAX_CONNECTIONS.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not uri:
+        raise RuntimeError("DATABASE_URL must be set: the async engine connects to the app's database")
+    if is_memory_sqlite(uri):
+        raise ValueError("An in-memory SQLite database cannot be shared with the async engine; use a file")
+    url = async_database_url(uri)
+    sync_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options = {key: sync_options[key] for key in _SHARED_POOL_OPTIONS if key in sync_options}
+    if sync_options.get('poolclass') is NullPool:
+        options['poolclass'] = NullPool
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+        if app.config['DB_PGBOUNCER']:
+            connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+        elif timeout:
+            connect_args['server_settings'] = {'statement_timeout': str(timeout)}
+    else:
+        connect_args.update(sync_options.get('connect_args', {}))
+
+    engine = create_async_engine(url, connect_args=connect_args, **options)
+    _install_connection_hooks(app, engine.sync_engine)
+    return engine
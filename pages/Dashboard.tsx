@@ -118,14 +118,14 @@ export const Dashboard: React.FC = () => {
     setReport(null);
     setReportError('');
     try {
-        const result = await generateInventoryReport(state.items, state.logs, state.users);
+        const result = await generateInventoryReport();
         setReport(result);
     } catch (error: any) {
         setReportError(error.message || 'An unknown error occurred while generating the report.');
     } finally {
         setIsLoading(false);
     }
-  }, [state.items, state.logs, state.users]);
+  }, []);
   
   const recentLogs = React.useMemo(() => {
       return state.logs.slice(0, 5).map(log => {
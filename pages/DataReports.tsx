@@ -3,37 +3,16 @@ import { useInventory } from '../context/InventoryContext';
 import { IconDownload, IconPrinter, IconUpload, IconDeviceFloppy } from '../components/icons';
 import { Item, User } from '../types';
 import { useSettings } from '../context/SettingsContext';
+import api from '../services/apiService';
 
-const downloadCSV = (csvContent: string, fileName: string) => {
-    const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-    const url = URL.createObjectURL(blob);
+const downloadFile = (url: string) => {
     const link = document.createElement("a");
     link.setAttribute("href", url);
-    link.setAttribute("download", fileName);
+    link.setAttribute("download", "");
     link.style.visibility = 'hidden';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
-    URL.revokeObjectURL(url);
-};
-
-const convertToCSV = <T extends object>(data: T[]): string => {
-    if (data.length === 0) return "";
-    const headers = Object.keys(data[0]);
-    const csvRows = [headers.join(',')];
-    for (const row of data) {
-        const values = headers.map(header => {
-            const value = (row as any)[header];
-            const stringValue = String(value ?? '');
-            // Escape commas and quotes by enclosing in double quotes
-            if (/[",\n]/.test(stringValue)) {
-                return `"${stringValue.replace(/"/g, '""')}"`;
-            }
-            return stringValue;
-        });
-        csvRows.push(values.join(','));
-    }
-    return csvRows.join('\n');
 };
 
 // A more robust CSV parser that handles quoted fields with commas.
@@ -71,12 +50,13 @@ const parseCSV = (csvText: string): Record<string, string>[] => {
 };
 
 export const DataReports: React.FC = () => {
-    const { state, importItems } = useInventory();
+    const { importItems } = useInventory();
     const { settings, updateSettings } = useSettings();
 
     const [importStatus, setImportStatus] = React.useState<{ message: string; type: 'success' | 'error' } | null>(null);
     const [localSettings, setLocalSettings] = React.useState(settings);
     const [saveStatus, setSaveStatus] = React.useState('');
+    const [exportFormat, setExportFormat] = React.useState<'csv' | 'xlsx'>('csv');
 
     const inventoryInputRef = React.useRef<HTMLInputElement>(null);
 
@@ -99,19 +79,16 @@ export const DataReports: React.FC = () => {
     };
 
     const handleExportInventory = React.useCallback(() => {
-        const csvData = convertToCSV(state.items);
-        downloadCSV(csvData, 'olilab_inventory.csv');
-    }, [state.items]);
+        downloadFile(api.exportUrl('items', exportFormat));
+    }, [exportFormat]);
 
     const handleExportUsers = React.useCallback(() => {
-        const csvData = convertToCSV(state.users);
-        downloadCSV(csvData, 'olilab_users.csv');
-    }, [state.users]);
+        downloadFile(api.exportUrl('users', exportFormat));
+    }, [exportFormat]);
 
     const handleExportLogs = React.useCallback(() => {
-        const csvData = convertToCSV(state.logs);
-        downloadCSV(csvData, 'olilab_logs.csv');
-    }, [state.logs]);
+        downloadFile(api.exportUrl('logs', exportFormat));
+    }, [exportFormat]);
 
     const handleInventoryFileChange = async (e: React.ChangeEvent<HTMLInputElement>) => {
         const file = e.target.files?.[0];
@@ -176,7 +153,14 @@ export const DataReports: React.FC = () => {
                 <div className="space-y-8">
                     <div className="bg-slate-800 p-6 rounded-lg border border-slate-700">
                         <h2 className="text-xl font-semibold text-white mb-4">Export Data</h2>
-                        <p className="text-slate-400 mb-6">Download your laboratory data in CSV format for backups or external analysis.</p>
+                        <p className="text-slate-400 mb-4">Download your laboratory data for backups or external analysis.</p>
+                        <div className="flex items-center gap-3 mb-6">
+                            <label htmlFor="export-format" className="text-slate-300 text-sm">Format</label>
+                            <select id="export-format" value={exportFormat} onChange={e => setExportFormat(e.target.value as 'csv' | 'xlsx')} className="bg-slate-700 border border-slate-600 text-white rounded-lg px-3 py-1.5">
+                                <option value="csv">CSV</option>
+                                <option value="xlsx">Excel (.xlsx)</option>
+                            </select>
+                        </div>
                         <div className="grid grid-cols-1 sm:grid-cols-3 gap-4">
                             <button onClick={handleExportInventory} className="flex items-center justify-center w-full px-4 py-2 bg-slate-600 text-white font-semibold rounded-lg shadow-md hover:bg-slate-700 transition-colors">
                                 <IconDownload /><span>Inventory</span>
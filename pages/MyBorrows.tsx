@@ -1,8 +1,9 @@
 import * as React from 'react';
 import { useInventory } from '../context/InventoryContext';
-import { LogAction, LogEntry, User, LogStatus } from '../types';
+import { LogEntry, LogStatus, BorrowEntry } from '../types';
 import { IconPrinter } from '../components/icons';
 import { useAuth } from '../context/AuthContext';
+import api from '../services/apiService';
 
 const OverdueReminder: React.FC<{ overdueItems: { itemName: string }[] }> = ({ overdueItems }) => {
     if (overdueItems.length === 0) return null;
@@ -54,22 +55,26 @@ export const MyBorrows: React.FC = () => {
   const { state } = useInventory();
   const { currentUser } = useAuth();
 
-  const myLogs = React.useMemo(() => {
-    if (!currentUser) return [];
+  const [myLogs, setMyLogs] = React.useState<BorrowEntry[]>([]);
 
-    return state.logs
-        .filter(log => log.userId === currentUser.id && log.action === LogAction.BORROW)
-        .map(log => {
-            const item = state.items.find(i => i.id === log.itemId);
-            const returnLog = state.logs.find(l => l.action === LogAction.RETURN && l.relatedLogId === log.id);
-            return {
-                ...log,
-                itemName: item?.name || 'Unknown Item',
-                returnNotes: returnLog?.adminNotes,
-            };
+  // The server keeps this user's ledger indexed; refetch it whenever a log changes locally.
+  React.useEffect(() => {
+    if (!currentUser) {
+      setMyLogs([]);
+      return;
+    }
+    let cancelled = false;
+    api.getUserBorrows(currentUser.id)
+        .then(ledger => {
+            if (cancelled) return;
+            setMyLogs(
+                [...ledger.pendingRequests, ...ledger.activeLoans, ...ledger.history]
+                    .sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime())
+            );
         })
-        .sort((a,b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime());
-  }, [state.logs, state.items, currentUser]);
+        .catch(error => console.error('Failed to load borrows:', error));
+    return () => { cancelled = true; };
+  }, [state.logs, currentUser]);
   
   const overdueItems = React.useMemo(() => {
     const today = new Date();
@@ -6,6 +6,7 @@ import { Modal } from '../components/Modal';
 import { IconSearch } from '../components/icons';
 import { useAuth } from '../context/AuthContext';
 import { UserSearchInput } from '../components/UserSearchInput';
+import api from '../services/apiService';
 
 const InventoryProgressBar: React.FC<{ available: number; total: number }> = ({ available, total }) => {
     const percentage = total > 0 ? (available / total) * 100 : 0;
@@ -20,7 +21,7 @@ const InventoryProgressBar: React.FC<{ available: number; total: number }> = ({
 
 
 export const Search: React.FC = () => {
-    const { state, requestBorrowItem } = useInventory();
+    const { requestBorrowItem } = useInventory();
     const { currentUser } = useAuth();
     const [searchResults, setSearchResults] = React.useState<Item[]>([]);
     const [searchQuery, setSearchQuery] = React.useState('');
@@ -56,32 +57,31 @@ export const Search: React.FC = () => {
         }
     };
     
-    const handleSearch = React.useCallback((query: string) => {
+    const handleSearch = React.useCallback(async (query: string) => {
         setSearchQuery(query);
         setHasSearched(true);
         setSearchResults([]);
 
         if (!query) return;
 
-        let foundItems: Item[] = [];
-        let searchTerm = query.toLowerCase();
+        let searchTerm = query;
 
         try {
             const qrData = JSON.parse(query);
             if(qrData.id || qrData.name) {
-                searchTerm = (qrData.name || qrData.id).toLowerCase();
+                searchTerm = qrData.id || qrData.name;
             }
         } catch (e) {
             // Not JSON, treat as plain text. searchTerm is already set.
         }
 
-        foundItems = state.items.filter(item => 
-            item.name.toLowerCase().includes(searchTerm) ||
-            item.id.toLowerCase() === searchTerm
-        );
-        
-        setSearchResults(foundItems);
-    }, [state.items]);
+        try {
+            const results = await api.search(searchTerm, 'items');
+            setSearchResults(results.items || []);
+        } catch (error) {
+            console.error('Search failed:', error);
+        }
+    }, []);
 
     const handleScanFailure = (error: string) => {
         console.warn(`QR scan error: ${error}`);
@@ -1,4 +1,4 @@
-import { State, Item, User, LogEntry, Notification, Suggestion, Comment, LogAction, SuggestionStatus, SuggestionType, UserStatus, LogStatus, InventoryReport } from '../types';
+import { State, Item, User, LogEntry, Notification, Suggestion, Comment, LogAction, SuggestionStatus, SuggestionType, UserStatus, LogStatus, InventoryReport, BorrowLedger, UsageSeries, TopUsage, UsageMetric, BatchOperation, BatchResult } from '../types';
 
 const isDevelopment = import.meta.env.DEV;
 
@@ -9,6 +9,17 @@ const BASE_URL = isDevelopment
   ? `http://localhost:5000/api`
   : `https://your-backend-name.onrender.com/api`; // <-- IMPORTANT: REPLACE WITH YOUR LIVE RENDER URL
 
+const NOTIFICATION_POLL_MS = 30_000;
+const REPORT_POLL_MIN_MS = 500;
+const REPORT_POLL_MAX_MS = 5_000;
+
+interface ReportJob {
+    jobId: string;
+    status: 'QUEUED' | 'RUNNING' | 'DONE' | 'FAILED';
+    report?: InventoryReport;
+    error?: string;
+}
+
 // --- Helper for API Calls ---
 const apiFetch = async <T>(endpoint: string, options: RequestInit = {}): Promise<T> => {
     try {
@@ -141,10 +152,79 @@ const api = {
         });
     },
 
+    getUserBorrows: async (userId: string): Promise<BorrowLedger> => {
+        return apiFetch<BorrowLedger>(`/users/${userId}/borrows`);
+    },
+
+    // Usage over time from the daily rollups: one item, one section, or the whole lab without either.
+    getUsageSeries: async (filters: { itemId?: string; section?: string; from?: string; to?: string; interval?: 'day' | 'week' | 'month' } = {}): Promise<UsageSeries> => {
+        const params = new URLSearchParams(Object.entries(filters).filter(([, value]) => value !== undefined) as [string, string][]);
+        return apiFetch<UsageSeries>(`/usage/series?${params}`);
+    },
+
+    getTopUsage: async (by: 'items' | 'sections' = 'items', metric: UsageMetric = 'borrows', filters: { from?: string; to?: string; limit?: number } = {}): Promise<TopUsage> => {
+        const params = new URLSearchParams({ by, metric });
+        if (filters.from) params.set('from', filters.from);
+        if (filters.to) params.set('to', filters.to);
+        if (filters.limit) params.set('limit', String(filters.limit));
+        return apiFetch<TopUsage>(`/usage/top?${params}`);
+    },
+
+    // Several write calls in one round trip and one transaction. With atomic, the first failure undoes them all.
+    batch: async (operations: BatchOperation[], atomic = true): Promise<BatchResult> => {
+        return apiFetch<BatchResult>('/batch', {
+            method: 'POST',
+            body: JSON.stringify({
+                atomic,
+                operations: operations.map(operation => ({ ...operation, path: `/api${operation.path}` })),
+            }),
+        });
+    },
+
+    // Ranked, typo-tolerant search; a full item or user id returns that record.
+    // `warming` means the server is still building its index and found nothing yet.
+    search: async (query: string, type?: 'items' | 'users', limit = 20): Promise<{ items?: Item[]; users?: User[]; warming?: boolean }> => {
+        const params = new URLSearchParams({ q: query, limit: String(limit) });
+        if (type) params.set('type', type);
+        return apiFetch<{ items?: Item[]; users?: User[]; warming?: boolean }>(`/search?${params}`);
+    },
+
+    getNotifications: async (userId: string): Promise<Notification[]> => {
+        const page = await apiFetch<{ data: Notification[]; nextCursor: string | null }>(`/notifications?userId=${userId}&limit=100`);
+        return page.data;
+    },
+
     markNotificationsAsRead: async (notificationIds: string[]): Promise<string[]> => {
-        // In a real app, this would be a POST request to an endpoint.
-        console.log("Simulating marking notifications as read on backend:", notificationIds);
-        return Promise.resolve(notificationIds);
+        return apiFetch<string[]>('/notifications/read', {
+            method: 'POST',
+            body: JSON.stringify({ ids: notificationIds })
+        });
+    },
+
+    // The server streams exports straight from the database; the browser saves the file as it arrives.
+    exportUrl: (kind: 'items' | 'users' | 'logs', format: 'csv' | 'xlsx' = 'csv', filters: Record<string, string> = {}): string => {
+        const params = new URLSearchParams({ ...filters, format });
+        return `${BASE_URL}/export/${kind}?${params}`;
+    },
+
+    // Opens the server's live event stream. The browser reconnects on its own; returns a function that closes it.
+    // A server with no room for another stream refuses it (503) and the browser gives up: poll instead.
+    subscribeToNotifications: (userId: string, onNotification: (notification: Notification) => void): (() => void) => {
+        let poll: ReturnType<typeof setInterval> | undefined;
+        const source = new EventSource(`${BASE_URL}/events?userId=${userId}`);
+        source.addEventListener('notification', (event) => onNotification(JSON.parse((event as MessageEvent).data)));
+        source.onerror = () => {
+            if (source.readyState !== EventSource.CLOSED || poll !== undefined) return;
+            poll = setInterval(() => {
+                api.getNotifications(userId)
+                    .then(notifications => notifications.forEach(onNotification))
+                    .catch(error => console.error('Failed to poll notifications:', error));
+            }, NOTIFICATION_POLL_MS);
+        };
+        return () => {
+            source.close();
+            if (poll !== undefined) clearInterval(poll);
+        };
     },
 
     importItems: async (itemsToImport: Omit<Item, 'id' | 'availableQuantity'>[]): Promise<Item[]> => {
@@ -183,11 +263,24 @@ const api = {
             body: JSON.stringify(payload)
         });
     },
-    generateReport: async (payload: { items: Item[], logs: LogEntry[], users: User[] }): Promise<InventoryReport> => {
-        return apiFetch<InventoryReport>('/reports/generate', {
+    generateReport: async (): Promise<InventoryReport> => {
+        // The report figures are computed on the server; no data needs to be uploaded.
+        // Reports run as background jobs, so poll until the job finishes. Each poll waits
+        // on the server for at most a couple of seconds, and the pauses between them grow.
+        let job = await apiFetch<ReportJob>('/reports/generate', {
             method: 'POST',
-            body: JSON.stringify(payload),
+            body: JSON.stringify({}),
         });
+        let delay = REPORT_POLL_MIN_MS;
+        while (job.status === 'QUEUED' || job.status === 'RUNNING') {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay = Math.min(delay * 2, REPORT_POLL_MAX_MS);
+            job = await apiFetch<ReportJob>(`/reports/jobs/${job.jobId}?wait=2`);
+        }
+        if (job.status === 'FAILED' || !job.report) {
+            throw new Error(job.error || 'Failed to generate report.');
+        }
+        return job.report;
     },
 };
 
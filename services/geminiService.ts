@@ -1,12 +1,12 @@
 
 
-import { Item, LogEntry, User, InventoryReport } from '../types';
+import { InventoryReport } from '../types';
 import api from './apiService';
 
-export const generateInventoryReport = async (items: Item[], logs: LogEntry[], users: User[]): Promise<InventoryReport> => {
+export const generateInventoryReport = async (): Promise<InventoryReport> => {
   try {
     // The API call is now delegated to the secure backend.
-    const report = await api.generateReport({ items, logs, users });
+    const report = await api.generateReport();
     return report;
   } catch (error) {
     console.error("Error generating report via backend:", error);
@@ -9,4 +9,5 @@ set -e
 # Start the Gunicorn server.
 # "app:create_app()" tells Gunicorn to look for the `create_app` factory
 # function inside the `app` module (app.py).
+# Worker class, threads and preloading come from gunicorn.conf.py.
 gunicorn "app:create_app()"
\ No newline at end of file
@@ -54,10 +54,65 @@ export interface LogEntry {
   returnRequested?: boolean;
 }
 
+// A borrow log as the per-user ledger returns it.
+export interface BorrowEntry extends LogEntry {
+  itemName: string;
+  returnNotes?: string | null;
+}
+
+export interface BorrowLedger {
+  outstanding: {
+    loans: number;
+    quantity: number;
+    items: { itemId: string; itemName: string; loans: number; quantity: number }[];
+  };
+  activeLoans: BorrowEntry[];
+  pendingRequests: BorrowEntry[];
+  history: BorrowEntry[];
+}
+
+// Request, borrow and return counts from the daily usage rollups.
+export interface UsageCounts {
+  requests: number;
+  borrows: number;
+  returns: number;
+  borrowedQuantity: number;
+  returnedQuantity: number;
+}
+
+export type UsageMetric = keyof UsageCounts;
+
+export interface UsageSeries {
+  interval: 'day' | 'week' | 'month';
+  from: string;
+  to: string;
+  points: ({ period: string } & UsageCounts)[];
+}
+
+export interface TopUsage {
+  by: 'items' | 'sections';
+  metric: UsageMetric;
+  from: string;
+  to: string;
+  entries: ({ itemId?: string; name?: string; category?: string; section?: string | null } & UsageCounts)[];
+}
+
+// One request inside a POST /api/batch, with its path relative to the API root.
+export interface BatchOperation {
+  method?: 'POST' | 'PUT' | 'DELETE';
+  path: string;
+  body?: unknown;
+}
+
+export interface BatchResult {
+  committed: boolean;
+  results: { status: number; body: any }[];
+}
+
 export interface Notification {
   id: string;
   message: string;
-  type: 'new_user' | 'return_request' | 'new_borrow_request' | 'borrow_request_denied' | 'borrow_request_approved' | 'account_approved' | 'account_denied';
+  type: 'new_user' | 'return_request' | 'new_borrow_request' | 'borrow_request_denied' | 'borrow_request_approved' | 'account_approved' | 'account_denied' | 'item_returned';
   read: boolean;
   timestamp: string;
   relatedLogId?: string;